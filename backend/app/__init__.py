@@ -4,6 +4,7 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 import os
+import tempfile
 
 # Load environment variables
 load_dotenv()
@@ -21,6 +22,32 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
     
+    # Refuse to start against a database that has not been migrated
+    app.config['SCHEMA_CHECK_ON_STARTUP'] = os.getenv('SCHEMA_CHECK_ON_STARTUP', 'true').lower() == 'true'
+    
+    # Response cache for public catalog endpoints: lru, redis or none
+    app.config['RESPONSE_CACHE_BACKEND'] = os.getenv('RESPONSE_CACHE_BACKEND', 'lru').lower()
+    app.config['RESPONSE_CACHE_URL'] = os.getenv('RESPONSE_CACHE_URL', 'redis://localhost:6379/0')
+    app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', '30'))
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))
+    
+    # Per-user badge counts (GET /api/me/counters and the badge streams)
+    app.config['BADGE_CACHE_TTL'] = int(os.getenv('BADGE_CACHE_TTL', '10'))
+    
+    # Server-Sent Events badge streams (per worker process)
+    app.config['SSE_HEARTBEAT_SECONDS'] = int(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+    app.config['SSE_RESYNC_SECONDS'] = int(os.getenv('SSE_RESYNC_SECONDS', '60'))
+    app.config['SSE_MAX_STREAMS'] = int(os.getenv('SSE_MAX_STREAMS', '500'))
+    app.config['SSE_MAX_STREAMS_PER_USER'] = int(os.getenv('SSE_MAX_STREAMS_PER_USER', '10'))
+    
+    # Event bus between worker processes: memory, socket, redis or none
+    app.config['EVENT_BUS_BACKEND'] = os.getenv('EVENT_BUS_BACKEND', 'memory').lower()
+    app.config['EVENT_BUS_URL'] = os.getenv('EVENT_BUS_URL', 'redis://localhost:6379/0')
+    app.config['EVENT_BUS_SOCKET_DIR'] = os.getenv('EVENT_BUS_SOCKET_DIR', os.path.join(tempfile.gettempdir(), 'rarevault-events'))
+    app.config['EVENT_BUS_STREAM_LENGTH'] = int(os.getenv('EVENT_BUS_STREAM_LENGTH', '10000'))
+    app.config['EVENT_BUS_QUEUE_SIZE'] = int(os.getenv('EVENT_BUS_QUEUE_SIZE', '1000'))
+    app.config['EVENT_BUS_BATCH_SIZE'] = int(os.getenv('EVENT_BUS_BATCH_SIZE', '100'))
+    
     # File upload configuration
     app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
@@ -34,6 +61,18 @@ def create_app():
     jwt.init_app(app)
     CORS(app)
     
+    from app.cache import init_response_cache
+    init_response_cache(app)
+    
+    from app.streams import init_streams
+    init_streams(app)
+    
+    from app.events import init_event_bus
+    init_event_bus(app)
+    
+    # Session hooks that keep conversation threads in step with message writes
+    from app import threads
+    
     # Static file serving for uploads
     @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
@@ -46,6 +85,7 @@ def create_app():
     from app.routes.messages import messages_bp
     from app.routes.notifications import notifications_bp
     from app.routes.seller_notifications import seller_notifications_bp
+    from app.routes.streams import streams_bp
     from app.admin.routes import admin_bp
     from app.user.routes import user_bp
     from app.seller.routes import seller_bp
@@ -57,9 +97,16 @@ def create_app():
     app.register_blueprint(messages_bp, url_prefix='/api/messages')
     app.register_blueprint(notifications_bp)
     app.register_blueprint(seller_notifications_bp)
+    app.register_blueprint(streams_bp)
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     app.register_blueprint(user_bp, url_prefix='/api/user')
     app.register_blueprint(seller_bp, url_prefix='/api')
     app.register_blueprint(debug_bp, url_prefix='/api')
     
+    # Schema changes are applied by `python manage.py migrate`, never by requests
+    if app.config['SCHEMA_CHECK_ON_STARTUP']:
+        from app.migrations import verify_schema
+        with app.app_context():
+            verify_schema(db.engine)
+    
     return app
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import User, Item, Order
+from app.outbox import sales_totals
 from sqlalchemy import func, and_
 
 admin_bp = Blueprint('admin', __name__)
@@ -159,13 +160,10 @@ def get_all_items():
         else:
             items = Item.query.all()
         
-        items_data = []
-        for item in items:
-            item_dict = item.to_dict()
-            # Get seller info
-            seller = User.query.get(item.seller_id)
-            item_dict['posted_by'] = seller.username if seller else 'Unknown'
-            items_data.append(item_dict)
+        items_data = Item.bulk_to_dict(items, include_seller=True)
+        for item_dict in items_data:
+            # Seller info is loaded in bulk by the serializer
+            item_dict['posted_by'] = item_dict.get('seller_name', 'Unknown')
             
         return jsonify({
             'success': True,
@@ -244,13 +242,10 @@ def get_appraisals():
         else:
             items = Item.query.filter(Item.status.in_(['pending', 'active', 'removed'])).all()
         
-        appraisals_data = []
-        for item in items:
-            item_dict = item.to_dict()
-            seller = User.query.get(item.seller_id)
-            item_dict['posted_by'] = seller.username if seller else 'Unknown'
-            item_dict['appraisal_status'] = 'approved' if item.status == 'active' else ('rejected' if item.status == 'removed' else 'pending')
-            appraisals_data.append(item_dict)
+        appraisals_data = Item.bulk_to_dict(items, include_seller=True)
+        for item_dict in appraisals_data:
+            item_dict['posted_by'] = item_dict.get('seller_name', 'Unknown')
+            item_dict['appraisal_status'] = 'approved' if item_dict['status'] == 'active' else ('rejected' if item_dict['status'] == 'removed' else 'pending')
             
         return jsonify({
             'success': True,
@@ -359,27 +354,16 @@ def get_sales_stats():
         else:
             start_date = end_date - timedelta(days=30)
         
-        # Get orders in date range
-        orders = Order.query.filter(
-            Order.created_at >= start_date,
-            Order.status.in_(['delivered', 'shipped'])
-        ).all()
-        
-        total_revenue = sum(float(order.total_amount) for order in orders)
-        total_orders = len(orders)
-        items_sold = sum(order.quantity for order in orders)
+        # Totals come from the daily order rollup, whole days by order date
+        sold_statuses = ['delivered', 'shipped']
+        total_orders, items_sold, total_revenue = sales_totals(start_date.date(), end_date.date(), sold_statuses)
         avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
         
         # Calculate previous period for comparison
         prev_start = start_date - (end_date - start_date)
-        prev_orders = Order.query.filter(
-            Order.created_at >= prev_start,
-            Order.created_at < start_date,
-            Order.status.in_(['delivered', 'shipped'])
-        ).all()
-        
-        prev_revenue = sum(float(order.total_amount) for order in prev_orders)
-        prev_count = len(prev_orders)
+        prev_count, _, prev_revenue = sales_totals(
+            prev_start.date(), start_date.date() - timedelta(days=1), sold_statuses
+        )
         
         revenue_change = ((total_revenue - prev_revenue) / prev_revenue * 100) if prev_revenue > 0 else 0
         orders_change = ((total_orders - prev_count) / prev_count * 100) if prev_count > 0 else 0
@@ -0,0 +1,71 @@
+"""
+Badge Counts - Every count a layout shows, from one query, cached per user
+
+    unread_notifications       notification_counters (see app/inbox.py)
+    unread_messages            notification_counters
+    seller_pending_orders      order_status_counts rollup plus unapplied
+    seller_delivered_orders    order events (see app/outbox.py)
+
+badge_counts() reads all four with one SELECT of scalar subqueries.
+cached_badge_counts() keeps the result for BADGE_CACHE_TTL seconds in the
+response cache backend, under a per-user version counter. Writers record
+whose counts they changed (inbox.mark_counters_changed: message sends and
+reads, notifications, order creation and status changes), and after commit
+app/streams.py bumps those versions before waking the users' streams.
+Other workers bump their own copies when the change reaches them through
+the event bus (see app/events.py).
+"""
+import json
+from flask import current_app
+from sqlalchemy import func, select
+from .cache import response_cache
+from .outbox import order_status_count_expression
+from .models.models import db, NotificationCounter
+
+
+def badge_version_name(user_id):
+    return f'badges:user:{user_id}'
+
+
+def badge_counts(user_id):
+    """The user's badge counts with one statement"""
+    def counter(column):
+        return func.coalesce(
+            select(column).where(NotificationCounter.user_id == user_id).scalar_subquery(), 0
+        )
+
+    row = db.session.execute(select(
+        counter(NotificationCounter.unread_notifications).label('unread_notifications'),
+        counter(NotificationCounter.unread_messages).label('unread_messages'),
+        order_status_count_expression(user_id, 'seller', ['pending']).label('seller_pending_orders'),
+        order_status_count_expression(user_id, 'seller', ['delivered']).label('seller_delivered_orders')
+    )).one()
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+
+def cached_badge_counts(user_id):
+    """badge_counts through the response cache backend, when one is configured"""
+    backend = response_cache.backend
+    if backend is None:
+        return badge_counts(user_id)
+
+    version = backend.get_versions([badge_version_name(user_id)])[0]
+    key = f'badges:{user_id}#{version}'
+    cached = backend.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    counts = badge_counts(user_id)
+    backend.set(key, json.dumps(counts), current_app.config['BADGE_CACHE_TTL'])
+    return counts
+
+
+def invalidate_badge_counts(user_ids):
+    if response_cache.backend is not None and user_ids:
+        response_cache.backend.bump_versions([badge_version_name(user_id) for user_id in user_ids])
+
+
+def invalidate_local_badge_counts(user_ids):
+    """invalidate_badge_counts for another worker's writes; a shared backend already has them"""
+    if response_cache.backend is not None and not response_cache.backend.shared:
+        invalidate_badge_counts(user_ids)
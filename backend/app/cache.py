@@ -0,0 +1,312 @@
+"""
+Response Cache - Read-through caching for public catalog endpoints
+
+Cached responses are keyed by route, query arguments and version counters.
+Writes never delete entries. Instead they bump the version of the item they
+touched and of the catalog list, so the next lookup misses and stale entries
+age out through TTL or LRU eviction. Both backends can do this cheaply.
+
+Backends:
+    lru    In-process, size-bounded LRU (default)
+    redis  Shared across workers; any client with the redis-py
+           get/set/incr/mget interface works, so tests can pass a stand-in
+    none   Caching disabled
+
+Configured with RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_URL,
+RESPONSE_CACHE_TTL and RESPONSE_CACHE_SIZE.
+
+With the lru backend every worker has its own copy, so writes made by other
+workers arrive through the event bus (see app/events.py) and bump the same
+versions here.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .events import event_bus, record_events
+from .models.models import Item, ItemImage, Order, Rating
+
+try:
+    import redis
+except ImportError:  # redis is only needed for the shared backend
+    redis = None
+
+CATALOG_VERSION = 'catalog:all'
+
+
+def item_version_name(item_id):
+    return f'catalog:item:{item_id}'
+
+
+class LRUCacheBackend:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._versions = {}            # version counters are never evicted
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_versions(self, names):
+        with self._lock:
+            return [self._versions.get(name, 0) for name in names]
+
+    def bump_versions(self, names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Cache shared by every worker, stored in Redis (or a compatible stand-in)"""
+
+    shared = True
+
+    def __init__(self, client, prefix='rarevault:'):
+        self.client = client
+        self.prefix = prefix
+        self.evictions = 0  # Redis evicts on its own; not observable here
+
+    @classmethod
+    def from_url(cls, url):
+        if redis is None:
+            raise RuntimeError('RESPONSE_CACHE_BACKEND=redis requires the redis package')
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def get_versions(self, names):
+        values = self.client.mget([self.prefix + name for name in names])
+        return [int(value) if value is not None else 0 for value in values]
+
+    def bump_versions(self, names):
+        for name in names:
+            self.client.incr(self.prefix + name)
+
+    def clear(self):
+        # Bumping the global version orphans every cached entry
+        self.bump_versions([CATALOG_VERSION])
+
+    def __len__(self):
+        return 0
+
+
+class ResponseCache:
+    """Read-through cache of JSON responses with hit/miss counters"""
+
+    def __init__(self, backend=None, ttl=30):
+        self.backend = backend
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def configure(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def build_key(self, version_names):
+        """Key from the route, the sorted query args and the current versions"""
+        versions = self.backend.get_versions(version_names)
+        args = '&'.join(
+            f'{name}={value}' for name, values in sorted(request.args.lists()) for value in values
+        )
+        version_part = ','.join(str(version) for version in versions)
+        return f'response:{request.path}?{args}#{version_part}'
+
+    def get(self, key):
+        value = self.backend.get(key)
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+    def invalidate_items(self, item_ids):
+        """Orphan cached responses for the given items and every catalog list"""
+        if not self.enabled:
+            return
+        names = [item_version_name(item_id) for item_id in item_ids]
+        self.backend.bump_versions(names + ['catalog:list'])
+        self._count('invalidations')
+
+    def invalidate_all(self):
+        if not self.enabled:
+            return
+        self.backend.bump_versions([CATALOG_VERSION])
+        self._count('invalidations')
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': getattr(self.backend, 'evictions', 0),
+            'entries': len(self.backend) if self.backend else 0,
+            'ttl': self.ttl
+        }
+
+
+response_cache = ResponseCache()
+
+
+def init_response_cache(app):
+    """Configure the response cache backend from app config"""
+    backend_name = app.config['RESPONSE_CACHE_BACKEND']
+    if backend_name == 'redis':
+        backend = RedisCacheBackend.from_url(app.config['RESPONSE_CACHE_URL'])
+    elif backend_name == 'lru':
+        backend = LRUCacheBackend(max_entries=app.config['RESPONSE_CACHE_SIZE'])
+    else:
+        backend = None
+    response_cache.configure(backend, app.config['RESPONSE_CACHE_TTL'])
+
+
+def cached_response(versions):
+    """Cache a view's 200 JSON responses.
+
+    `versions` maps the view kwargs to the version counters the response
+    depends on; bumping any of them makes the cached copy unreachable.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not response_cache.enabled:
+                return view(*args, **kwargs)
+
+            key = response_cache.build_key([CATALOG_VERSION] + versions(**kwargs))
+            cached = response_cache.get(key)
+            if cached is not None:
+                return Response(cached, status=200, mimetype='application/json',
+                                headers={'X-Cache': 'HIT'})
+
+            result = view(*args, **kwargs)
+            response, status = result if isinstance(result, tuple) else (result, 200)
+            if status == 200:
+                body = response.get_data(as_text=True)
+                response_cache.set(key, body)
+                response = Response(body, status=200, mimetype='application/json',
+                                    headers={'X-Cache': 'MISS'})
+            return response, status
+        return wrapper
+    return decorator
+
+
+def mark_items_touched(session, item_ids):
+    """Invalidate items after commit for writes made with bulk UPDATE statements"""
+    session.info.setdefault('catalog_touched', set()).update(item_ids)
+    record_events(session, [
+        {'model': 'item', 'action': 'update', 'id': item_id, 'item_id': item_id} for item_id in item_ids
+    ])
+
+
+# Write hooks: collect the items touched by a flush and invalidate after commit
+
+@event.listens_for(Session, 'after_flush')
+def _collect_catalog_writes(session, flush_context):
+    touched = session.info.setdefault('catalog_touched', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Item):
+            touched.add(obj.id)
+        elif isinstance(obj, (ItemImage, Order, Rating)) and obj.item_id is not None:
+            touched.add(obj.item_id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_catalog_deletes(orm_execute_state):
+    # Query.delete() skips the flush, so the affected ids are unknown
+    if orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Item, ItemImage, Order, Rating):
+            orm_execute_state.session.info['catalog_touched_all'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_catalog(session):
+    touched = session.info.pop('catalog_touched', None)
+    if session.info.pop('catalog_touched_all', False):
+        response_cache.invalidate_all()
+    elif touched:
+        response_cache.invalidate_items(touched)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_writes(session):
+    session.info.pop('catalog_touched', None)
+    session.info.pop('catalog_touched_all', None)
+
+
+# Other workers' writes: only a per-process backend has to hear about them
+
+CATALOG_MODELS = {'item', 'item_image', 'order', 'rating'}
+
+
+def _apply_remote_writes(events):
+    if response_cache.backend is None or response_cache.backend.shared:
+        return
+    catalog_events = [e for e in events if e['model'] in CATALOG_MODELS]
+    if any(e['action'] == 'bulk' for e in catalog_events):
+        response_cache.invalidate_all()
+    else:
+        touched = {e['item_id'] for e in catalog_events if e.get('item_id') is not None}
+        if touched:
+            response_cache.invalidate_items(touched)
+
+
+def _resync_remote_writes():
+    if response_cache.backend is not None and not response_cache.backend.shared:
+        response_cache.backend.clear()
+
+
+event_bus.subscribe(_apply_remote_writes, _resync_remote_writes)
@@ -0,0 +1,158 @@
+"""
+Cart Checkout - Order many items in one transaction
+
+Checking out a cart used to mean one POST /api/user/orders per item, each
+with its own stock check and commit. Here the whole cart is one transaction:
+
+    1. One SELECT loads every item in the cart with its seller
+    2. Item.reserve_stock_bulk takes the stock of all items in a single
+       conditional UPDATE, locking rows in ascending id order
+    3. One bulk INSERT writes every Order, and one SELECT reads them back
+    4. One bulk INSERT adds their 'created' events to the order outbox
+
+Either every line is reserved and ordered, or nothing is. The result is
+grouped by seller, since each seller confirms and ships separately.
+"""
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import insert
+from .cache import mark_items_touched
+from .outbox import record_orders_created
+from .models.models import db, Item, Order, User
+
+MAX_CART_LINES = 50
+
+
+class CheckoutError(ValueError):
+    """Raised for an invalid cart or one that cannot be fulfilled"""
+
+    def __init__(self, message, status_code=400, item_ids=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.item_ids = item_ids or []
+
+
+def parse_cart(data):
+    """item_id -> quantity from {"items": [{"item_id": 1, "quantity": 2}, ...]}.
+
+    Repeated item ids are merged; the result is ordered by item id.
+    """
+    lines = (data or {}).get('items')
+    if not isinstance(lines, list) or not lines:
+        raise CheckoutError('items must be a non-empty list of {item_id, quantity}')
+    if len(lines) > MAX_CART_LINES:
+        raise CheckoutError(f'A cart can hold at most {MAX_CART_LINES} items')
+
+    quantities = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise CheckoutError('items must be a non-empty list of {item_id, quantity}')
+        item_id, quantity = line.get('item_id'), line.get('quantity', 1)
+        if not isinstance(item_id, int) or isinstance(item_id, bool) or item_id <= 0:
+            raise CheckoutError('item_id must be a positive integer')
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise CheckoutError('Quantity must be greater than 0')
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+    return dict(sorted(quantities.items()))
+
+
+def load_cart_items(quantities, buyer_id):
+    """Rows of (Item.id, seller_id, title, price, status, stock, seller_username) for the cart"""
+    rows = db.session.query(
+        Item.id, Item.seller_id, Item.title, Item.price, Item.status, Item.stock,
+        User.username.label('seller_username')
+    ).outerjoin(
+        User, User.id == Item.seller_id
+    ).filter(
+        Item.id.in_(list(quantities))
+    ).order_by(Item.id).all()
+
+    missing = sorted(set(quantities) - {row.id for row in rows})
+    if missing:
+        raise CheckoutError('Item not found', status_code=404, item_ids=missing)
+    own = [row.id for row in rows if row.seller_id == buyer_id]
+    if own:
+        raise CheckoutError('Cannot order your own item', item_ids=own)
+    return rows
+
+
+def unavailable_items(rows, quantities):
+    """Ids of cart items that are not active or short of stock, as of the rows read"""
+    return [row.id for row in rows if row.status != 'active' or row.stock < quantities[row.id]]
+
+
+def _new_order_number():
+    return f"ORD{datetime.now().strftime('%Y%m%d')}{str(uuid.uuid4())[:8].upper()}"
+
+
+def place_cart_orders(buyer_id, quantities, details):
+    """Reserve stock and insert one order per cart line; returns the per-seller groups.
+
+    Runs inside the caller's transaction; the caller commits. Raises
+    CheckoutError (409) after rolling back when any item cannot be reserved.
+    """
+    rows = load_cart_items(quantities, buyer_id)
+
+    short = unavailable_items(rows, quantities)
+    if short:
+        raise CheckoutError('Insufficient stock available', status_code=409, item_ids=short)
+
+    if not Item.reserve_stock_bulk(quantities):
+        # Another checkout won a race since the rows were read; report who is short now
+        db.session.rollback()
+        short = unavailable_items(load_cart_items(quantities, buyer_id), quantities)
+        raise CheckoutError('Insufficient stock available', status_code=409, item_ids=short)
+
+    now = datetime.utcnow()
+    order_rows = []
+    for row in rows:
+        quantity = quantities[row.id]
+        order_rows.append({
+            'order_number': _new_order_number(),
+            'buyer_id': buyer_id,
+            'seller_id': row.seller_id,
+            'item_id': row.id,
+            'quantity': quantity,
+            'price_per_item': row.price,
+            'total_amount': Decimal(row.price) * quantity,
+            'status': 'pending',
+            'shipping_address': details.get('shipping_address') or 'Not provided',
+            'customer_name': details.get('customer_name') or 'Not provided',
+            'customer_phone': details.get('customer_phone') or '',
+            'customer_email': details.get('customer_email') or '',
+            'payment_method': details.get('payment_method', 'cash_on_delivery'),
+            'customer_notes': details.get('customer_notes', ''),
+            'created_at': now,
+            'updated_at': now
+        })
+    db.session.execute(insert(Order), order_rows)
+    mark_items_touched(db.session, list(quantities))
+
+    orders = Order.query.filter(
+        Order.order_number.in_([order['order_number'] for order in order_rows])
+    ).order_by(Order.item_id).all()
+    record_orders_created(db.session, orders)
+    return group_orders_by_seller(orders, {row.seller_id: row.seller_username for row in rows})
+
+
+def group_orders_by_seller(orders, seller_names):
+    groups = OrderedDict()
+    for order in orders:
+        group = groups.get(order.seller_id)
+        if group is None:
+            group = groups[order.seller_id] = {
+                'seller_id': order.seller_id,
+                'seller_name': seller_names.get(order.seller_id),
+                'orders': [],
+                'subtotal': Decimal('0')
+            }
+        group['orders'].append(order.to_dict())
+        group['subtotal'] += order.total_amount
+
+    result = []
+    for group in groups.values():
+        group['subtotal'] = float(group['subtotal'])
+        result.append(group)
+    return result
@@ -0,0 +1,136 @@
+"""
+Conditional GET - Weak ETags and Last-Modified for item and listing endpoints
+
+Validators are computed from items.updated_at, never from the serialized
+response, so a matching If-None-Match returns 304 before any item is loaded
+or serialized.
+
+    Single item   (id, updated_at) of the item row
+    Listing       COUNT, MAX(updated_at) and SUM(id) over the filtered set.
+                  An edit raises the max, and an insert or delete changes
+                  the count and the id sum
+
+Image writes touch the parent item's updated_at, so image changes also
+change the validators. Rating and sales counters are written with UPDATE
+statements, which apply the column's onupdate.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import Response, request
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from .models.models import Item, ItemImage
+
+
+def weak_etag(*parts):
+    """Weak ETag over the validator parts, the request path and its query args"""
+    args = sorted(request.args.items(multi=True))
+    digest = hashlib.sha1(repr((request.path, args, parts)).encode('utf-8')).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def item_validators(query):
+    """(etag, last_modified) for the single item matched by `query`, or None"""
+    row = query.with_entities(Item.id, Item.updated_at).first()
+    if row is None:
+        return None
+    return weak_etag(row.id, row.updated_at), row.updated_at
+
+
+def listing_validators(query):
+    """(etag, last_modified) for every item matched by a listing query"""
+    row = query.with_entities(
+        func.count(Item.id), func.max(Item.updated_at), func.sum(Item.id)
+    ).order_by(None).one()
+    count, last_modified, id_sum = row
+    return weak_etag(count, last_modified, int(id_sum or 0)), last_modified
+
+
+def _etag_matches(etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # Weak comparison: W/ prefixes are ignored
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def is_not_modified(etag, last_modified, use_if_modified_since=False):
+    """Check the request's validators against the current ones.
+
+    If-Modified-Since is only consulted when asked for. A listing's
+    MAX(updated_at) does not move when an item is deleted, so listings rely
+    on the ETag alone.
+    """
+    if 'If-None-Match' in request.headers:
+        return _etag_matches(etag)
+    if use_if_modified_since and last_modified and request.if_modified_since:
+        since = request.if_modified_since.replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def not_modified_response(etag, last_modified):
+    response = Response(status=304)
+    return with_validators(response, etag, last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    """Attach ETag and Last-Modified headers to a response"""
+    response.headers['ETag'] = etag
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional_item(validators):
+    """Answer conditional GETs for a single-item view.
+
+    `validators` maps the view kwargs to (etag, last_modified), or None when
+    the item does not exist (the view then produces its usual 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = validators(**kwargs)
+            if current is None:
+                return view(*args, **kwargs)
+
+            etag, last_modified = current
+            if is_not_modified(etag, last_modified, use_if_modified_since=True):
+                return not_modified_response(etag, last_modified)
+
+            result = view(*args, **kwargs)
+            response, status = result if isinstance(result, tuple) else (result, 200)
+            if status == 200:
+                with_validators(response, etag, last_modified)
+            return response, status
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, 'before_flush')
+def _touch_items_for_image_writes(session, flush_context, instances):
+    # Image changes do not write the items row, so bump its updated_at here
+    item_ids = {
+        obj.item_id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, ItemImage) and obj.item_id is not None
+    }
+    if not item_ids:
+        return
+    now = datetime.utcnow()
+    with session.no_autoflush:
+        for item_id in item_ids:
+            item = session.get(Item, item_id)
+            if item is not None and item not in session.deleted:
+                item.updated_at = now
@@ -0,0 +1,249 @@
+"""
+Conversation Queries - The message inbox as a range read over thread summaries
+
+A conversation is every message between the user and one partner about one
+item (or about no item). Its latest message and unread counts are kept in
+conversation_threads (see app/threads.py), so a page of the inbox is one
+SELECT that never touches older messages:
+
+    1. The threads where the user is the lower and the higher participant,
+       each an index range read on (user, last_message_at, id) that stops
+       after one page, joined with the partner to apply the role rules
+    2. The two halves merged by last message time
+    3. The page joined with its latest messages, items, primary images and
+       orders
+
+Pages seek on (last_message_at, thread id), so users with years of history
+get their first page as fast as anyone else.
+
+The messages of one conversation are read on the (user_low_id,
+user_high_id, item_id, id) index: "new since after_id" for polling and
+"older than before_id" for scrolling back are each one range probe.
+Marking a conversation read is one UPDATE on the (receiver_id, sender_id,
+item_id, is_receiver_read) index; reading messages never writes.
+
+serialize_messages() turns a page of messages into the same dicts as
+Message.to_dict, with one IN query each for their users, items, first
+images and orders instead of lazy loads per message.
+"""
+from sqlalchemy import select, union_all, update
+from sqlalchemy.orm import aliased
+from .inbox import add_to_counters
+from .models.models import db, ConversationThread, Item, ItemImage, Message, Order, User, format_manila_time
+from .pagination import decode_cursor, encode_cursor, seek_predicate
+from .threads import clear_thread_unread
+
+# Who each role may talk to
+CONVERSATION_PARTNER_ROLES = {
+    'seller': ['user'],
+    'user': ['seller', 'admin'],
+    'admin': ['user', 'seller'],
+}
+
+CURSOR_TAG = 'conversation_threads'
+
+
+def _thread_range(user_id, side, partner_side, unread, partner_roles, item_id, key, limit):
+    """One page of the threads where the user is on `side`, newest first"""
+    partner = aliased(User, name='partner')
+    query = select(
+        ConversationThread.id.label('thread_id'),
+        ConversationThread.item_key,
+        ConversationThread.last_message_id,
+        ConversationThread.last_message_at,
+        unread.label('unread_count'),
+        partner.id.label('partner_id'),
+        partner.username.label('partner_username'),
+        partner.role.label('partner_role')
+    ).join(
+        partner, partner.id == partner_side
+    ).where(
+        side == user_id,
+        partner.role.in_(partner_roles)
+    )
+    if side is ConversationThread.user_high_id:
+        # A conversation with oneself is listed once, from the lower side
+        query = query.where(ConversationThread.user_low_id != user_id)
+    if item_id is not None:
+        query = query.where(ConversationThread.item_key == item_id)
+    if key is not None:
+        query = query.where(seek_predicate(ConversationThread.last_message_at, ConversationThread.id, key, True))
+    return query.order_by(
+        ConversationThread.last_message_at.desc(), ConversationThread.id.desc()
+    ).limit(limit).subquery()
+
+
+def list_conversations(user_id, partner_roles, item_id=None, cursor='', per_page=50):
+    """One page of the user's conversations; returns (rows, next_cursor).
+
+    Raises InvalidCursor for a cursor from another listing.
+    """
+    key = decode_cursor(CURSOR_TAG, cursor) if cursor else None
+    halves = [
+        _thread_range(user_id, ConversationThread.user_low_id, ConversationThread.user_high_id,
+                      ConversationThread.low_unread, partner_roles, item_id, key, per_page + 1),
+        _thread_range(user_id, ConversationThread.user_high_id, ConversationThread.user_low_id,
+                      ConversationThread.high_unread, partner_roles, item_id, key, per_page + 1),
+    ]
+    page = union_all(*(select(half) for half in halves)).subquery('page')
+
+    image_path = select(ItemImage.image_path).where(
+        ItemImage.item_id == page.c.item_key
+    ).order_by(
+        ItemImage.is_primary.desc(), ItemImage.id
+    ).limit(1).correlate(page).scalar_subquery()
+
+    rows = db.session.query(
+        page,
+        Message,
+        Item.title.label('item_title'),
+        Item.price.label('item_price'),
+        Item.status.label('item_status'),
+        image_path.label('item_image_path'),
+        Order.order_number,
+        Order.status.label('order_status'),
+        Order.total_amount.label('order_total_amount')
+    ).select_from(page).join(
+        Message, Message.id == page.c.last_message_id
+    ).outerjoin(
+        Item, Item.id == page.c.item_key
+    ).outerjoin(
+        Order, Order.id == Message.order_id
+    ).order_by(
+        page.c.last_message_at.desc(), page.c.thread_id.desc()
+    ).limit(per_page + 1).all()
+
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(CURSOR_TAG, (rows[-1].last_message_at, rows[-1].thread_id)) if has_next else None
+    return rows, next_cursor
+
+
+def conversation_messages_query(user_id, partner_id, item_id=None):
+    """Messages between two users, optionally about one item, on the (pair, item_id, id) index"""
+    low, high = sorted((int(user_id), int(partner_id)))
+    query = Message.query.filter(Message.user_low_id == low, Message.user_high_id == high)
+    if item_id:
+        query = query.filter(Message.item_id == item_id)
+    return query
+
+
+def messages_after(query, after_id, limit):
+    """Up to `limit` messages newer than `after_id`, oldest first; returns (messages, has_more)"""
+    rows = query.filter(Message.id > after_id).order_by(Message.id.asc()).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def messages_before(query, before_id, limit):
+    """The `limit` messages just older than `before_id` (or the latest), oldest first; returns (messages, has_more)"""
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    return list(reversed(rows[:limit])), len(rows) > limit
+
+
+def serialize_messages(messages):
+    """Message.to_dict for many messages, loading related rows with IN queries"""
+    messages = list(messages)
+    user_ids = {m.sender_id for m in messages} | {m.receiver_id for m in messages}
+    item_ids = {m.item_id for m in messages if m.item_id}
+    order_ids = {m.order_id for m in messages if m.order_id}
+
+    users = {}
+    if user_ids:
+        for row in db.session.query(User.id, User.username, User.role).filter(User.id.in_(user_ids)):
+            users[row.id] = {'id': row.id, 'username': row.username, 'role': row.role}
+
+    items = {}
+    if item_ids:
+        for row in db.session.query(Item.id, Item.title, Item.price, Item.status).filter(Item.id.in_(item_ids)):
+            items[row.id] = {
+                'id': row.id, 'title': row.title, 'price': float(row.price), 'status': row.status, 'images': []
+            }
+        images = db.session.query(ItemImage.item_id, ItemImage.image_path).filter(
+            ItemImage.item_id.in_(item_ids)
+        ).order_by(ItemImage.item_id, ItemImage.id)
+        for row in images:
+            item = items.get(row.item_id)
+            if item is not None and not item['images']:
+                item['images'].append(row.image_path)
+
+    orders = {}
+    if order_ids:
+        query = db.session.query(Order.id, Order.order_number, Order.status, Order.total_amount)
+        for row in query.filter(Order.id.in_(order_ids)):
+            orders[row.id] = {
+                'id': row.id, 'order_number': row.order_number,
+                'status': row.status, 'total_amount': float(row.total_amount)
+            }
+
+    return [{
+        'id': m.id,
+        'sender_id': m.sender_id,
+        'receiver_id': m.receiver_id,
+        'item_id': m.item_id,
+        'order_id': m.order_id,
+        'message': m.message,
+        'is_sender_read': m.is_sender_read,
+        'is_receiver_read': m.is_receiver_read,
+        'created_at': format_manila_time(m.created_at),
+        'updated_at': format_manila_time(m.updated_at),
+        'sender': users.get(m.sender_id),
+        'receiver': users.get(m.receiver_id),
+        'item': items.get(m.item_id),
+        'order': orders.get(m.order_id)
+    } for m in messages]
+
+
+def mark_conversation_read(reader_id, sender_id, item_id=None):
+    """Mark every unread message from `sender_id` to `reader_id` (about one item, if given) as read.
+
+    One UPDATE, whatever the backlog. The flush hooks that keep the unread
+    counters do not see bulk UPDATEs, so the reader's unread_messages
+    counter and thread counts are adjusted here, in the same transaction.
+    Returns how many messages were marked.
+    """
+    statement = update(Message).where(
+        Message.receiver_id == reader_id,
+        Message.sender_id == sender_id,
+        Message.is_receiver_read == False
+    )
+    if item_id:
+        statement = statement.where(Message.item_id == item_id)
+    result = db.session.execute(
+        statement.values(is_receiver_read=True).execution_options(synchronize_session=False)
+    )
+
+    marked = result.rowcount
+    if marked:
+        add_to_counters(db.session, 'unread_messages', {reader_id: -marked})
+        clear_thread_unread(db.session, reader_id, sender_id, item_id)
+    db.session.commit()
+    return marked
+
+
+def conversation_row_to_dict(row, user_id, format_time):
+    message = row.Message
+    return {
+        'partner_id': row.partner_id,
+        'partner_username': row.partner_username,
+        'partner_role': row.partner_role,
+        'item_id': row.item_key or None,
+        'item': {
+            'id': row.item_key,
+            'title': row.item_title,
+            'price': float(row.item_price),
+            'status': row.item_status,
+            'images': [row.item_image_path] if row.item_image_path else []
+        } if row.item_title is not None else None,
+        'order': {
+            'id': message.order_id,
+            'order_number': row.order_number,
+            'status': row.order_status,
+            'total_amount': float(row.order_total_amount)
+        } if row.order_number is not None else None,
+        'last_message': message.message,
+        'last_message_time': format_time(message.created_at),
+        'unread_count': int(row.unread_count or 0),
+        'is_last_message_mine': message.sender_id == user_id
+    }
@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify
 from app.models.models import Item, ItemImage, db
+from app.cache import response_cache
+from app.events import event_bus
 
 debug_bp = Blueprint('debug', __name__)
 
@@ -34,3 +36,17 @@ def debug_items_images():
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@debug_bp.route('/debug/cache-stats', methods=['GET'])
+def debug_cache_stats():
+    try:
+        return jsonify(response_cache.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@debug_bp.route('/debug/event-bus-stats', methods=['GET'])
+def debug_event_bus_stats():
+    try:
+        return jsonify(event_bus.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
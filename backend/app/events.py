@@ -0,0 +1,449 @@
+"""
+Event Bus - Write events shared between worker processes
+
+The response cache, facet cache, search index and badge streams each live
+in one worker process, so a write served by one gunicorn worker has to
+reach the others. After every commit the writes to items, item images,
+orders, messages and ratings are published as small events:
+
+    {"model": "item", "action": "update", "id": 7, "item_id": 7}
+    {"model": "message", "action": "insert", "id": 90, "item_id": 7, "user_ids": [3, 5]}
+    {"model": "item", "action": "bulk"}                  a bulk DELETE
+    {"model": "counters", "user_ids": [3, 5]}            from app/streams.py
+
+Modules subscribe handlers for the events of other workers (app/cache.py,
+app/facets.py, app/search.py, app/streams.py). A worker's own writes are
+already applied by the commit hooks of those modules.
+
+Transports (EVENT_BUS_BACKEND):
+    memory  In-process hub (default); nothing crosses processes
+    socket  One Unix datagram socket per worker in EVENT_BUS_SOCKET_DIR;
+            works offline, with no broker to run
+    redis   A Redis stream shared by every worker on every host
+            (EVENT_BUS_URL), trimmed to about EVENT_BUS_STREAM_LENGTH entries
+    none    Publishing disabled
+
+Delivery is batched and at-least-once. Events are sent in batches of up to
+EVENT_BUS_BATCH_SIZE, handlers receive lists of events and must be
+idempotent, and a failing handler is retried. Every queue holds at most
+EVENT_BUS_QUEUE_SIZE events. When events may have been lost (a full queue,
+a gap in a worker's batch numbers, a handler that keeps failing) the
+subscriber's resync callback runs instead and drops whatever state the
+missed events could have changed.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .models.models import Item, ItemImage, Message, Order, Rating
+
+try:
+    import redis
+except ImportError:  # redis is only needed for the shared backend
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAMES = {Item: 'item', ItemImage: 'item_image', Order: 'order', Message: 'message', Rating: 'rating'}
+
+# Attempts at delivering one batch to a handler before resyncing it instead
+MAX_ATTEMPTS = 3
+
+
+def model_event(obj, action):
+    """The event for an ORM write to one of the published models"""
+    data = {'model': MODEL_NAMES[type(obj)], 'action': action, 'id': obj.id}
+    item_id = obj.id if isinstance(obj, Item) else obj.item_id
+    if item_id is not None:
+        data['item_id'] = item_id
+    # Ids set from JWT identities are still strings before the flush
+    if isinstance(obj, Message):
+        data['user_ids'] = [int(obj.sender_id), int(obj.receiver_id)]
+    elif isinstance(obj, Order):
+        data['user_ids'] = [int(obj.buyer_id), int(obj.seller_id)]
+    return data
+
+
+class MemoryTransport:
+    """Delivers to every bus started on it in this process"""
+
+    def __init__(self):
+        self._receivers = []
+
+    def start(self, worker_id, receive):
+        self._receivers.append(receive)
+
+    def publish(self, payload):
+        for receive in list(self._receivers):
+            receive(payload)
+
+    def stop(self):
+        self._receivers.clear()
+
+
+class UnixSocketTransport:
+    """One datagram socket per worker in a shared directory; publishing sends to all of them"""
+
+    MAX_DATAGRAM = 256 * 1024
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = None
+        self._socket = None
+        self._sender = None
+        self._stop = threading.Event()
+
+    def start(self, worker_id, receive):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'{worker_id}.sock')
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.MAX_DATAGRAM)
+        self._socket.bind(self.path)
+        self._socket.settimeout(1)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._stop.clear()
+        threading.Thread(target=self._receive_loop, args=(receive,), name='event-bus-socket', daemon=True).start()
+
+    def _receive_loop(self, receive):
+        while not self._stop.is_set():
+            try:
+                data = self._socket.recv(self.MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            receive(data.decode('utf-8'))
+
+    def publish(self, payload):
+        data = payload.encode('utf-8')
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.sock') or path == self.path:
+                continue
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker is gone; remove its socket file
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                # The worker is behind; it sees the gap in batch numbers and resyncs
+                pass
+
+    def stop(self):
+        self._stop.set()
+        for sock in (self._socket, self._sender):
+            if sock is not None:
+                sock.close()
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class RedisStreamTransport:
+    """A Redis stream read by every worker; any client with xadd/xread works"""
+
+    def __init__(self, client, stream='rarevault:events', max_length=10000):
+        self.client = client
+        self.stream = stream
+        self.max_length = max_length
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_url(cls, url, max_length=10000):
+        if redis is None:
+            raise RuntimeError('EVENT_BUS_BACKEND=redis requires the redis package')
+        return cls(redis.Redis.from_url(url), max_length=max_length)
+
+    def start(self, worker_id, receive):
+        self._stop.clear()
+        threading.Thread(target=self._receive_loop, args=(receive,), name='event-bus-redis', daemon=True).start()
+
+    def _receive_loop(self, receive):
+        last_id = '$'  # only what is published from now on
+        while not self._stop.is_set():
+            try:
+                entries = self.client.xread({self.stream: last_id}, count=100, block=1000)
+            except Exception as e:
+                # Reading resumes after last_id; entries trimmed meanwhile show up as gaps
+                logger.warning(f'Event bus read failed: {e}')
+                time.sleep(1)
+                continue
+            for _, messages in entries or []:
+                for message_id, fields in messages:
+                    last_id = message_id
+                    payload = fields.get(b'batch', fields.get('batch'))
+                    receive(payload.decode('utf-8') if isinstance(payload, bytes) else payload)
+
+    def publish(self, payload):
+        self.client.xadd(self.stream, {'batch': payload}, maxlen=self.max_length, approximate=True)
+
+    def stop(self):
+        self._stop.set()
+
+
+class Subscriber:
+    """A handler fed from a bounded queue by its own thread"""
+
+    def __init__(self, handler, resync, max_queue, batch_size):
+        self.handler = handler
+        self.resync = resync
+        self.batch_size = batch_size
+        self._queue = queue.Queue(max_queue)
+        self._lost = threading.Event()
+
+    def offer(self, events):
+        for data in events:
+            try:
+                self._queue.put_nowait(data)
+            except queue.Full:
+                self.mark_lost()
+                return
+
+    def mark_lost(self):
+        self._lost.set()
+
+    def run(self, app, stop):
+        while not stop.is_set():
+            if self._lost.is_set():
+                self._lost.clear()
+                self._drain()
+                self._call(app, self.resync)
+                continue
+            try:
+                events = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            while len(events) < self.batch_size:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                if self._call(app, self.handler, events):
+                    break
+                if attempt == MAX_ATTEMPTS:
+                    self.mark_lost()
+                else:
+                    time.sleep(0.5 * attempt)
+
+    def _drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _call(self, app, function, *args):
+        try:
+            with app.app_context():
+                function(*args)
+            return True
+        except Exception as e:
+            logger.error(f'Event bus handler {function.__module__}.{function.__name__} failed: {e}')
+            return False
+
+
+class EventBus:
+    """Publishes this worker's write events and feeds other workers' events to subscribers"""
+
+    def __init__(self):
+        self.app = None
+        self.transport = None
+        self.max_queue = 1000
+        self.batch_size = 100
+        self.worker_id = None
+        self._handlers = []
+        self._subscribers = []
+        self._outbox = None
+        self._outbox_lost = False
+        self._seq = 0
+        self._last_seq = {}  # origin -> last batch number seen
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.resyncs = 0
+
+    def configure(self, app, transport, max_queue, batch_size):
+        self.app = app
+        self.transport = transport
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+
+    def subscribe(self, handler, resync):
+        """Call handler(events) with other workers' events, or resync() when some were lost"""
+        self._handlers.append((handler, resync))
+
+    def ensure_started(self):
+        """Start the threads in this process; after a fork the worker starts its own"""
+        if self.transport is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+            self._stop = threading.Event()
+            self._outbox = queue.Queue(self.max_queue)
+            self._subscribers = [
+                Subscriber(handler, resync, self.max_queue, self.batch_size) for handler, resync in self._handlers
+            ]
+            for subscriber in self._subscribers:
+                threading.Thread(
+                    target=subscriber.run, args=(self.app, self._stop), name='event-bus-subscriber', daemon=True
+                ).start()
+            threading.Thread(target=self._send_loop, name='event-bus-sender', daemon=True).start()
+            self.transport.start(self.worker_id, self._receive)
+            atexit.register(self.close)
+
+    def publish(self, events):
+        """Queue events for the other workers; never blocks the caller"""
+        if self.transport is None or not events:
+            return
+        self.ensure_started()
+        for data in events:
+            try:
+                self._outbox.put_nowait(data)
+                self.published += 1
+            except queue.Full:
+                self.dropped += 1
+                self._outbox_lost = True
+
+    def _send_loop(self):
+        outbox, stop = self._outbox, self._stop
+        while not stop.is_set():
+            try:
+                events = [outbox.get(timeout=1)]
+            except queue.Empty:
+                continue
+            while len(events) < self.batch_size:
+                try:
+                    events.append(outbox.get_nowait())
+                except queue.Empty:
+                    break
+            self._send(events)
+
+    def _send(self, events):
+        self._seq += 1
+        # Receivers resync when told events were dropped before this batch
+        lost, self._outbox_lost = self._outbox_lost, False
+        payload = json.dumps({'origin': self.worker_id, 'seq': self._seq, 'resync': lost, 'events': events})
+        try:
+            self.transport.publish(payload)
+        except Exception as e:
+            logger.warning(f'Event bus publish failed: {e}')
+            self.dropped += len(events)
+            self._outbox_lost = True
+
+    def _receive(self, payload):
+        batch = json.loads(payload)
+        origin = batch['origin']
+        if origin == self.worker_id:
+            return
+        self.received += len(batch['events'])
+        last = self._last_seq.get(origin)
+        self._last_seq[origin] = batch['seq']
+        if batch['resync'] or (last is not None and batch['seq'] != last + 1):
+            self.resyncs += 1
+            for subscriber in self._subscribers:
+                subscriber.mark_lost()
+        for subscriber in self._subscribers:
+            subscriber.offer(batch['events'])
+
+    def close(self, timeout=2):
+        """Send what is queued (for up to `timeout` seconds) and stop"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._outbox is not None and not self._outbox.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        self.transport.stop()
+        self._pid = None
+
+    def stats(self):
+        return {
+            'backend': type(self.transport).__name__ if self.transport else None,
+            'worker_id': self.worker_id,
+            'subscribers': len(self._handlers),
+            'published': self.published,
+            'received': self.received,
+            'dropped': self.dropped,
+            'resyncs': self.resyncs,
+            'workers_seen': len(self._last_seq)
+        }
+
+
+event_bus = EventBus()
+
+
+def init_event_bus(app):
+    """Configure the event bus transport from app config; threads start on first use"""
+    backend_name = app.config['EVENT_BUS_BACKEND']
+    if backend_name == 'redis':
+        transport = RedisStreamTransport.from_url(
+            app.config['EVENT_BUS_URL'], max_length=app.config['EVENT_BUS_STREAM_LENGTH']
+        )
+    elif backend_name == 'socket':
+        transport = UnixSocketTransport(app.config['EVENT_BUS_SOCKET_DIR'])
+    elif backend_name == 'memory':
+        transport = MemoryTransport()
+    else:
+        transport = None
+    event_bus.configure(app, transport, app.config['EVENT_BUS_QUEUE_SIZE'], app.config['EVENT_BUS_BATCH_SIZE'])
+    # Workers forked from a preloaded app start receiving with their first request
+    app.before_request(event_bus.ensure_started)
+
+
+def record_events(session, events):
+    """Publish events once the session commits (for writes made with bulk UPDATE statements)"""
+    session.info.setdefault('bus_events', []).extend(events)
+
+
+# Write hooks: collect the published models' writes and publish after commit
+
+@event.listens_for(Session, 'after_flush')
+def _collect_model_writes(session, flush_context):
+    events = []
+    for action, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if type(obj) in MODEL_NAMES and (action != 'update' or session.is_modified(obj)):
+                events.append(model_event(obj, action))
+    if events:
+        record_events(session, events)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_deletes(orm_execute_state):
+    # Query.delete() skips the flush, so the affected ids are unknown
+    if orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in MODEL_NAMES:
+            record_events(orm_execute_state.session, [{'model': MODEL_NAMES[mapper.class_], 'action': 'bulk'}])
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_model_writes(session):
+    events = session.info.pop('bus_events', None)
+    if events:
+        event_bus.publish(events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_model_writes(session):
+    session.info.pop('bus_events', None)
@@ -0,0 +1,310 @@
+"""
+Marketplace Facets - Filter counts by category, condition, year and price
+
+The counts come from one grouped query over active items, grouped by
+(category, condition, decade, price bucket). The result is a small "cube" of
+cells that is cached per base filter (search term and price range). Counts
+for each facet are summed from the cube in Python, so a page view no longer
+scans the items table just to fill the filter sidebar.
+
+Each facet ignores its own selection and applies the others. Picking a
+category therefore still shows the counts for every other category.
+
+The unfiltered cube is kept current incrementally from item write hooks.
+Cubes for searches and price ranges are dropped on any item write. Bulk
+deletes, and bulk UPDATEs run with the changes_item_status execution option,
+drop every cube. Item writes made by other worker processes drop every cube
+when they arrive through the event bus (see app/events.py); the TTL bounds
+staleness when bus events are lost.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import case, event, func, inspect
+from sqlalchemy.orm import Session
+from . import db
+from .events import event_bus
+from .models.models import Item
+from .search import search_items
+
+CONDITIONS = ['new', 'like_new', 'good', 'fair', 'poor']
+
+# Upper bounds of each price bucket; the last bucket is open-ended
+PRICE_BUCKET_EDGES = [50, 100, 250, 500, 1000, 5000]
+
+FACET_CACHE_TTL = int(os.getenv('FACET_CACHE_TTL', '60'))
+FACET_CACHE_SIZE = int(os.getenv('FACET_CACHE_SIZE', '256'))
+
+
+def price_bucket_index(price):
+    """Index of the bucket a price falls into"""
+    if price is None:
+        return None
+    for index, edge in enumerate(PRICE_BUCKET_EDGES):
+        if price < edge:
+            return index
+    return len(PRICE_BUCKET_EDGES)
+
+
+def price_bucket_label(index):
+    if index == 0:
+        return f'Under {PRICE_BUCKET_EDGES[0]}'
+    if index == len(PRICE_BUCKET_EDGES):
+        return f'{PRICE_BUCKET_EDGES[-1]}+'
+    return f'{PRICE_BUCKET_EDGES[index - 1]}-{PRICE_BUCKET_EDGES[index]}'
+
+
+def price_bucket_range(index):
+    """(min_price, max_price) of a bucket; max is exclusive and None when open-ended"""
+    low = PRICE_BUCKET_EDGES[index - 1] if index > 0 else 0
+    high = PRICE_BUCKET_EDGES[index] if index < len(PRICE_BUCKET_EDGES) else None
+    return low, high
+
+
+def year_bucket(year):
+    """Decade of a year, e.g. 1974 -> 1970"""
+    if year is None:
+        return None
+    return year - year % 10
+
+
+def _cell_key(category, condition, year, price):
+    return (category, condition, year_bucket(year), price_bucket_index(price))
+
+
+def _price_bucket_expression():
+    whens = [(Item.price < edge, index) for index, edge in enumerate(PRICE_BUCKET_EDGES)]
+    return case(*whens, else_=len(PRICE_BUCKET_EDGES))
+
+
+def _load_cube(search=None, min_price=None, max_price=None):
+    """One grouped query returning {(category, condition, decade, price bucket): count}"""
+    decade = (Item.year - Item.year % 10).label('decade')
+    price_bucket = _price_bucket_expression().label('price_bucket')
+
+    query = db.session.query(
+        Item.category, Item.condition_status, decade, price_bucket, func.count(Item.id)
+    ).filter(Item.status == 'active')
+
+    if search:
+        query, _ = search_items(query, search)
+    if min_price is not None:
+        query = query.filter(Item.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Item.price <= max_price)
+
+    rows = query.group_by(Item.category, Item.condition_status, decade, price_bucket).all()
+    return {(row[0], row[1], row[2], row[3]): row[4] for row in rows}
+
+
+class FacetCache:
+    """Per-process cache of facet cubes keyed by base filter"""
+
+    def __init__(self, ttl=FACET_CACHE_TTL, max_entries=FACET_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # base key -> (loaded_at, generation, cube)
+        self._generation = 0
+
+    def get_cube(self, search=None, min_price=None, max_price=None):
+        key = ((search or '').strip().lower(), min_price, max_price)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl and entry[1] == self._generation:
+                self._entries.move_to_end(key)
+                return entry[2]
+            generation = self._generation
+
+        cube = _load_cube(search, min_price, max_price)
+
+        with self._lock:
+            # A write that raced the load leaves the result uncached
+            if generation == self._generation:
+                self._entries[key] = (now, generation, cube)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return cube
+
+    def apply_deltas(self, deltas):
+        """Fold per-cell count changes into the unfiltered cube; drop every other cube"""
+        with self._lock:
+            self._generation += 1
+            base = self._entries.get(('', None, None))
+            self._entries.clear()
+            if base is None:
+                return
+
+            # Readers iterate cubes without the lock; give them a new one
+            loaded_at, _, cube = base
+            cube = dict(cube)
+            for cell, delta in deltas.items():
+                count = cube.get(cell, 0) + delta
+                if count > 0:
+                    cube[cell] = count
+                else:
+                    cube.pop(cell, None)
+            self._entries[('', None, None)] = (loaded_at, self._generation, cube)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+_cache = FacetCache()
+
+
+def invalidate_facets():
+    """Drop all cached facet counts (for writes that bypass the ORM)"""
+    _cache.clear()
+
+
+def _sum_by(cube, position, include):
+    counts = {}
+    for cell, count in cube.items():
+        if cell[position] is not None and include(cell):
+            counts[cell[position]] = counts.get(cell[position], 0) + count
+    return counts
+
+
+def get_marketplace_facets(search=None, category=None, condition=None, decade=None,
+                           min_price=None, max_price=None):
+    """Facet counts for the marketplace filter sidebar.
+
+    Each facet applies every selected filter except its own.
+    """
+    cube = _cache.get_cube(search, min_price, max_price)
+
+    matches_category = lambda cell: not category or cell[0] == category
+    matches_condition = lambda cell: not condition or cell[1] == condition
+    matches_decade = lambda cell: decade is None or cell[2] == decade
+
+    category_counts = _sum_by(cube, 0, lambda cell: matches_condition(cell) and matches_decade(cell))
+    condition_counts = _sum_by(cube, 1, lambda cell: matches_category(cell) and matches_decade(cell))
+    year_counts = _sum_by(cube, 2, lambda cell: matches_category(cell) and matches_condition(cell))
+    price_counts = _sum_by(
+        cube, 3, lambda cell: matches_category(cell) and matches_condition(cell) and matches_decade(cell)
+    )
+
+    price_facets = []
+    for index in sorted(price_counts):
+        low, high = price_bucket_range(index)
+        price_facets.append({
+            'label': price_bucket_label(index),
+            'min_price': low,
+            'max_price': high,
+            'count': price_counts[index]
+        })
+
+    return {
+        'categories': [
+            {'value': value, 'count': count}
+            for value, count in sorted(category_counts.items(), key=lambda entry: (-entry[1], entry[0]))
+        ],
+        'conditions': [
+            {'value': value, 'count': condition_counts.get(value, 0)} for value in CONDITIONS
+        ],
+        'years': [
+            {'value': decade, 'label': f'{decade}s', 'count': year_counts[decade]}
+            for decade in sorted(year_counts, reverse=True)
+        ],
+        'price_ranges': price_facets
+    }
+
+
+# Write hooks: turn item flushes into cube deltas and apply them after commit
+
+def _facet_cell(item, committed):
+    """Cube cell of an item before (committed=True) or after the flush; None if not active"""
+    if committed:
+        state = inspect(item)
+        values = {}
+        for name in ('status', 'category', 'condition_status', 'year', 'price'):
+            history = state.attrs[name].history
+            if history.deleted:
+                values[name] = history.deleted[0]
+            elif history.unchanged:
+                values[name] = history.unchanged[0]
+            else:
+                values[name] = getattr(item, name)
+    else:
+        values = {name: getattr(item, name) for name in ('status', 'category', 'condition_status', 'year', 'price')}
+
+    if values['status'] != 'active':
+        return None
+    price = float(values['price']) if values['price'] is not None else None
+    return _cell_key(values['category'], values['condition_status'], values['year'], price)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_facet_deltas(session, flush_context):
+    deltas = session.info.setdefault('facet_deltas', {})
+    touched = session.info.get('facet_touched', False)
+
+    for obj in session.new:
+        if isinstance(obj, Item):
+            touched = True
+            cell = _facet_cell(obj, committed=False)
+            if cell:
+                deltas[cell] = deltas.get(cell, 0) + 1
+    for obj in session.dirty:
+        if isinstance(obj, Item) and session.is_modified(obj, include_collections=False):
+            touched = True
+            before = _facet_cell(obj, committed=True)
+            after = _facet_cell(obj, committed=False)
+            if before != after:
+                if before:
+                    deltas[before] = deltas.get(before, 0) - 1
+                if after:
+                    deltas[after] = deltas.get(after, 0) + 1
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            touched = True
+            cell = _facet_cell(obj, committed=True)
+            if cell:
+                deltas[cell] = deltas.get(cell, 0) - 1
+
+    session.info['facet_touched'] = touched
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_facet_writes(orm_execute_state):
+    # Bulk deletes and status-changing bulk UPDATEs skip the flush; rebuild after commit
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Item:
+        return
+    if orm_execute_state.is_delete or (
+        orm_execute_state.is_update and orm_execute_state.execution_options.get('changes_item_status')
+    ):
+        orm_execute_state.session.info['facet_reset'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_facet_deltas(session):
+    deltas = session.info.pop('facet_deltas', None)
+    touched = session.info.pop('facet_touched', False)
+    if session.info.pop('facet_reset', False):
+        _cache.clear()
+    elif touched:
+        _cache.apply_deltas({cell: delta for cell, delta in (deltas or {}).items() if delta})
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_facet_deltas(session):
+    session.info.pop('facet_deltas', None)
+    session.info.pop('facet_touched', None)
+    session.info.pop('facet_reset', None)
+
+
+def _apply_remote_item_writes(events):
+    # Another worker's deltas are not known here; drop every cube
+    if any(e['model'] == 'item' for e in events):
+        _cache.clear()
+
+
+event_bus.subscribe(_apply_remote_item_writes, invalidate_facets)
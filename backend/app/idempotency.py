@@ -0,0 +1,114 @@
+"""
+Idempotency Keys - Safe retries for non-idempotent POST endpoints
+
+A client sends an Idempotency-Key header (any unique string, e.g. a UUID per
+checkout attempt). The first request stores its response in the same
+transaction as its writes. A retry with the same key is a primary-key
+lookup on (user_id, idempotency_key) and returns the stored response
+without redoing any work.
+
+Two requests racing with the same key both try to insert the same primary
+key. The loser's transaction rolls back, so its stock reservation and order
+are undone, and it replays the winner's response.
+
+Reusing a key with a different request body is rejected with 422. Keys
+expire after IDEMPOTENCY_KEY_TTL seconds (default 24 hours) and are purged
+by `python manage.py purge-idempotency-keys`.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from flask import Response, request
+from sqlalchemy import tuple_
+from .models.models import db, IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 60 * 60)))
+
+
+class IdempotencyKeyError(ValueError):
+    """Raised for a malformed key, or a key reused with a different request"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_idempotency_key():
+    """The request's Idempotency-Key header, or None when it was not sent"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyKeyError(f'{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters')
+    return key
+
+
+def request_fingerprint():
+    """Hash of the method, path and JSON body, used to detect key reuse"""
+    payload = request.get_json(silent=True)
+    canonical = json.dumps([request.method, request.path, payload], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def replay_response(record):
+    response = Response(record.response_body, status=record.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def find_stored_response(user_id, key, fingerprint):
+    """Return the stored response for a key, or None when the request should run.
+
+    An expired record is deleted in the current transaction so the request
+    can reuse the key.
+    """
+    record = db.session.get(IdempotencyKey, (user_id, key))
+    if record is None:
+        return None
+    if record.expires_at <= datetime.utcnow():
+        db.session.delete(record)
+        db.session.flush()
+        return None
+    if record.request_hash != fingerprint:
+        raise IdempotencyKeyError(
+            f'{IDEMPOTENCY_HEADER} was already used for a different request', status_code=422
+        )
+    return replay_response(record)
+
+
+def store_response(user_id, key, fingerprint, status_code, body):
+    """Add the response to the current transaction; the caller commits it with its writes"""
+    now = datetime.utcnow()
+    db.session.add(IdempotencyKey(
+        user_id=user_id,
+        idempotency_key=key,
+        request_hash=fingerprint,
+        status_code=status_code,
+        response_body=json.dumps(body),
+        created_at=now,
+        expires_at=now + timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+    ))
+
+
+def purge_expired_keys(chunk_size=1000):
+    """Delete expired keys in chunks, one short transaction per chunk"""
+    deleted = 0
+    now = datetime.utcnow()
+    while True:
+        rows = db.session.query(IdempotencyKey.user_id, IdempotencyKey.idempotency_key).filter(
+            IdempotencyKey.expires_at <= now
+        ).limit(chunk_size).all()
+        if not rows:
+            break
+        db.session.query(IdempotencyKey).filter(
+            tuple_(IdempotencyKey.user_id, IdempotencyKey.idempotency_key).in_([tuple(row) for row in rows])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(rows)
+        if len(rows) < chunk_size:
+            break
+    return deleted
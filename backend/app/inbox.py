@@ -0,0 +1,274 @@
+"""
+Notification Inbox - Notifications fanned out on write, unread counters per user
+
+Order events (see app/outbox.py) are turned into notifications for the buyer
+or seller in the same transaction as the order change. Each user has one
+notification_counters row holding:
+
+    unread_notifications   notifications that are neither seen nor read
+    unread_messages        messages received and not yet read
+    seen_notification_id   watermark: everything up to it counts as read
+
+Counters are adjusted by the same transaction that inserts a notification
+or message, or changes its read flag. Badge polling is then one
+primary-key read instead of COUNT queries over orders and messages.
+
+    order created            -> seller   "New Order Received"
+    confirmed/declined/
+    shipped/cancelled        -> buyer
+    delivered                -> seller   "Order Delivered"
+    message sent / read      -> receiver's unread_messages
+
+Messages are counted rather than copied into notifications, since they
+already have their own badge and inbox.
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import case, event, func, inspect, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session, aliased
+from .models.models import db, Item, Message, Notification, NotificationCounter, Order, User
+
+# to_status -> (recipient, notification type, title)
+ORDER_NOTIFICATIONS = {
+    'confirmed': ('buyer', 'order_confirmed', 'Order Confirmed'),
+    'declined': ('buyer', 'order_declined', 'Order Declined'),
+    'shipped': ('buyer', 'order_shipped', 'Order Shipped'),
+    'cancelled': ('buyer', 'order_cancelled', 'Order Cancelled'),
+    'delivered': ('seller', 'order_delivered', 'Order Delivered'),
+}
+
+
+def _order_message(notification_type, order):
+    title = order.item_title or 'your item'
+    if notification_type == 'order_placed':
+        return f'You have a new order from {order.buyer_name} for "{title}"'
+    if notification_type == 'order_confirmed':
+        return f'Your order for "{title}" has been confirmed by {order.seller_name}'
+    if notification_type == 'order_declined':
+        return f'Your order for "{title}" was declined by {order.seller_name}'
+    if notification_type == 'order_shipped':
+        return f'Your order for "{title}" has been shipped by {order.seller_name}'
+    if notification_type == 'order_cancelled':
+        return f'Your order #{order.order_number} for "{title}" was cancelled'
+    return f'Order #{order.order_number} for "{title}" has been delivered'
+
+
+def mark_counters_changed(session, user_ids):
+    """Remember whose badge counts changed; app/badges.py acts on them after commit"""
+    session.info.setdefault('counters_changed', set()).update(user_ids)
+
+
+def add_to_counters(session, column, deltas):
+    """Add {user_id: delta} to one counter column.
+
+    Increments are one multi-row upsert; decrements are one UPDATE that
+    never takes a counter below zero. Both run on the session's connection,
+    so this is safe inside flush hooks.
+    """
+    connection = session.connection()
+    table = NotificationCounter.__table__
+    increments = {user_id: delta for user_id, delta in deltas.items() if delta > 0}
+    decrements = {user_id: -delta for user_id, delta in deltas.items() if delta < 0}
+
+    if increments:
+        rows = [{'user_id': user_id, column: delta} for user_id, delta in increments.items()]
+        if connection.dialect.name == 'mysql':
+            statement = mysql.insert(table)
+            statement = statement.on_duplicate_key_update({column: table.c[column] + statement.inserted[column]})
+        else:
+            statement = sqlite.insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id'], set_={column: table.c[column] + statement.excluded[column]}
+            )
+        connection.execute(statement, rows)
+
+    if decrements:
+        amount = case(decrements, value=table.c.user_id, else_=0)
+        connection.execute(
+            update(table)
+            .where(table.c.user_id.in_(list(decrements)))
+            .values({column: case((table.c[column] > amount, table.c[column] - amount), else_=0)})
+        )
+
+    mark_counters_changed(session, [user_id for user_id, delta in deltas.items() if delta])
+
+
+def fan_out_order_events(session, rows):
+    """Insert the notifications for a batch of order event rows and count them as unread.
+
+    Runs on the writing transaction's connection, so notifications commit
+    (or roll back) with the order changes.
+    """
+    connection = session.connection()
+    # Both parties' order counts change, whoever gets the notification
+    mark_counters_changed(session, {row['buyer_id'] for row in rows} | {row['seller_id'] for row in rows})
+
+    targets = []
+    for row in rows:
+        if row['event_type'] == 'created':
+            targets.append((row, row['seller_id'], 'order_placed', 'New Order Received'))
+        elif row['to_status'] in ORDER_NOTIFICATIONS:
+            recipient, notification_type, title = ORDER_NOTIFICATIONS[row['to_status']]
+            targets.append((row, row[f'{recipient}_id'], notification_type, title))
+    if not targets:
+        return
+
+    # One query for the names and titles the messages mention
+    buyer = aliased(User)
+    seller = aliased(User)
+    orders = {
+        order.id: order for order in connection.execute(
+            select(
+                Order.id, Order.order_number, Item.title.label('item_title'),
+                buyer.username.label('buyer_name'), seller.username.label('seller_name')
+            ).select_from(Order)
+            .outerjoin(Item, Item.id == Order.item_id)
+            .outerjoin(buyer, buyer.id == Order.buyer_id)
+            .outerjoin(seller, seller.id == Order.seller_id)
+            .where(Order.id.in_({row['order_id'] for row, _, _, _ in targets}))
+        )
+    }
+
+    now = datetime.utcnow()
+    notifications = []
+    unread = defaultdict(int)
+    for row, user_id, notification_type, title in targets:
+        order = orders.get(row['order_id'])
+        if order is None:
+            continue
+        notifications.append({
+            'user_id': user_id,
+            'type': notification_type,
+            'title': title,
+            'message': _order_message(notification_type, order),
+            'related_id': row['order_id'],
+            'related_type': 'order',
+            'is_read': False,
+            'created_at': now,
+            'updated_at': now
+        })
+        unread[user_id] += 1
+
+    if notifications:
+        connection.execute(Notification.__table__.insert(), notifications)
+        add_to_counters(session, 'unread_notifications', unread)
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_message_writes(session, flush_context):
+    unread = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Message) and not obj.is_receiver_read:
+            unread[obj.receiver_id] += 1
+    for obj in session.dirty:
+        if isinstance(obj, Message):
+            history = inspect(obj).attrs.is_receiver_read.history
+            if history.added and history.deleted and bool(history.added[0]) != bool(history.deleted[0]):
+                unread[obj.receiver_id] += -1 if history.added[0] else 1
+    for obj in session.deleted:
+        if isinstance(obj, Message) and not obj.is_receiver_read:
+            unread[obj.receiver_id] -= 1
+    if unread:
+        add_to_counters(session, 'unread_messages', unread)
+
+
+# Readers and watermark
+
+def get_counters(user_id):
+    """(unread_notifications, unread_messages) with one primary-key read"""
+    counter = db.session.get(NotificationCounter, user_id)
+    if counter is None:
+        return 0, 0
+    return counter.unread_notifications, counter.unread_messages
+
+
+def _lock_counter(user_id):
+    counter = db.session.query(NotificationCounter).filter_by(user_id=user_id).with_for_update().first()
+    if counter is None:
+        counter = NotificationCounter(user_id=user_id, unread_notifications=0, unread_messages=0,
+                                      seen_notification_id=0)
+        db.session.add(counter)
+        db.session.flush()
+    return counter
+
+
+def list_notifications(user_id, limit=20):
+    """The user's latest notifications with their order's number, amount and status, in one query"""
+    watermark = select(func.coalesce(func.max(NotificationCounter.seen_notification_id), 0)).where(
+        NotificationCounter.user_id == user_id
+    ).scalar_subquery()
+    rows = db.session.query(
+        Notification,
+        (Notification.id <= watermark).label('seen'),
+        Order.order_number, Order.total_amount, Order.status.label('order_status')
+    ).outerjoin(
+        Order, (Notification.related_type == 'order') & (Order.id == Notification.related_id)
+    ).filter(
+        Notification.user_id == user_id
+    ).order_by(Notification.id.desc()).limit(limit).all()
+
+    result = []
+    for notification, seen, order_number, total_amount, order_status in rows:
+        result.append({
+            'id': notification.id,
+            'type': notification.type,
+            'title': notification.title,
+            'message': notification.message,
+            'is_read': bool(notification.is_read or seen),
+            'related_id': notification.related_id,
+            'related_type': notification.related_type,
+            'order_id': notification.related_id if notification.related_type == 'order' else None,
+            'order_number': order_number,
+            'amount': float(total_amount) if total_amount is not None else 0.0,
+            'status': order_status,
+            'created_at': notification.created_at.isoformat() if notification.created_at else None
+        })
+    return result
+
+
+def mark_seen(user_id, up_to_id=None):
+    """Move the user's watermark to `up_to_id` (default: their latest notification).
+
+    The unread count is recomputed from the notifications above the new
+    watermark, which is an index range scan over at most a few rows.
+    """
+    counter = _lock_counter(user_id)
+    latest = db.session.query(func.coalesce(func.max(Notification.id), 0)).filter(
+        Notification.user_id == user_id
+    ).scalar()
+    watermark = latest if up_to_id is None else min(up_to_id, latest)
+    if watermark > counter.seen_notification_id:
+        counter.seen_notification_id = watermark
+    counter.unread_notifications = db.session.query(func.count(Notification.id)).filter(
+        Notification.user_id == user_id,
+        Notification.id > counter.seen_notification_id,
+        Notification.is_read.is_(False)
+    ).scalar()
+    mark_counters_changed(db.session, [user_id])
+    db.session.commit()
+    return counter.unread_notifications
+
+
+def mark_read(user_id, notification_id):
+    """Mark one notification read; returns False when it is not the user's"""
+    counter = _lock_counter(user_id)
+    exists = db.session.query(Notification.id).filter_by(id=notification_id, user_id=user_id).first()
+    if exists is None:
+        db.session.rollback()
+        return False
+    result = db.session.execute(
+        update(Notification)
+        .where(
+            Notification.id == notification_id,
+            Notification.is_read.is_(False),
+            Notification.id > counter.seen_notification_id
+        )
+        .values(is_read=True, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        counter.unread_notifications = max(counter.unread_notifications - 1, 0)
+        mark_counters_changed(db.session, [user_id])
+    db.session.commit()
+    return True
@@ -0,0 +1,146 @@
+"""
+Maintenance Tasks - Rebuild denormalized data and release stale reservations
+"""
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from .models.models import db, Item, Order, Rating
+from .cache import mark_items_touched
+from .outbox import record_status_changes
+
+STALE_ORDER_NOTE = 'Automatically cancelled: the seller did not confirm the order in time'
+
+
+def reconcile_item_counters(chunk_size=500):
+    """Rebuild items.sold_quantity/delivered_order_count/rating_sum/rating_count.
+
+    Items are processed in primary-key chunks, each in its own short
+    transaction, so the command can run against a live database.
+    """
+    last_id = 0
+    items_processed = 0
+    items_changed = 0
+
+    while True:
+        rows = db.session.query(
+            Item.id, Item.sold_quantity, Item.delivered_order_count, Item.rating_sum, Item.rating_count
+        ).filter(Item.id > last_id).order_by(Item.id).limit(chunk_size).all()
+        if not rows:
+            break
+
+        item_ids = [row.id for row in rows]
+        last_id = item_ids[-1]
+
+        sales = {
+            row.item_id: row for row in db.session.query(
+                Order.item_id,
+                func.sum(Order.quantity).label('total_quantity'),
+                func.count(Order.id).label('order_count')
+            ).filter(
+                Order.item_id.in_(item_ids),
+                Order.status == 'delivered'
+            ).group_by(Order.item_id).all()
+        }
+        ratings = {
+            row.item_id: row for row in db.session.query(
+                Rating.item_id,
+                func.sum(Rating.rating).label('rating_sum'),
+                func.count(Rating.id).label('rating_count')
+            ).filter(Rating.item_id.in_(item_ids)).group_by(Rating.item_id).all()
+        }
+
+        changes = []
+        for row in rows:
+            sale = sales.get(row.id)
+            rating = ratings.get(row.id)
+            expected = {
+                'id': row.id,
+                'sold_quantity': int(sale.total_quantity or 0) if sale else 0,
+                'delivered_order_count': int(sale.order_count) if sale else 0,
+                'rating_sum': int(rating.rating_sum or 0) if rating else 0,
+                'rating_count': int(rating.rating_count) if rating else 0
+            }
+            current = (row.sold_quantity, row.delivered_order_count, row.rating_sum, row.rating_count)
+            if current != (expected['sold_quantity'], expected['delivered_order_count'],
+                           expected['rating_sum'], expected['rating_count']):
+                changes.append(expected)
+
+        if changes:
+            # Bulk UPDATE by primary key, one executemany per chunk
+            db.session.execute(update(Item), changes)
+        db.session.commit()
+
+        items_processed += len(rows)
+        items_changed += len(changes)
+
+    return {'items_processed': items_processed, 'items_changed': items_changed}
+
+
+def release_stale_orders(ttl_hours=72, chunk_size=200, now=None):
+    """Cancel pending orders older than `ttl_hours` and return their stock.
+
+    Each chunk is one short transaction with a fixed number of statements:
+    - an indexed SELECT ... FOR UPDATE SKIP LOCKED on (status, created_at, id),
+      so orders a seller is confirming right now are skipped rather than waited on
+    - one UPDATE cancelling the chunk's orders
+    - one UPDATE returning stock to every affected item, with the per-item
+      quantities summed into a CASE expression
+    - one INSERT of the cancellations into the order outbox
+
+    Returns throughput metrics.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=ttl_hours)
+    started = time.perf_counter()
+    metrics = {
+        'cutoff': cutoff.isoformat(),
+        'chunks': 0,
+        'orders_released': 0,
+        'units_restored': 0,
+        'item_updates': 0,
+        'max_chunk_ms': 0.0
+    }
+
+    while True:
+        chunk_started = time.perf_counter()
+        rows = db.session.query(
+            Order.id, Order.item_id, Order.quantity, Order.status, Order.buyer_id,
+            Order.seller_id, Order.total_amount, Order.created_at
+        ).filter(
+            Order.status == 'pending',
+            Order.created_at < cutoff
+        ).order_by(Order.created_at, Order.id).limit(chunk_size).with_for_update(skip_locked=True).all()
+        if not rows:
+            db.session.rollback()
+            break
+
+        order_ids = [row.id for row in rows]
+        restock = {}
+        for row in rows:
+            restock[row.item_id] = restock.get(row.item_id, 0) + (row.quantity or 0)
+
+        cancelled_at = datetime.utcnow()
+        db.session.execute(
+            update(Order)
+            .where(Order.id.in_(order_ids), Order.status == 'pending')
+            .values(status='cancelled', cancelled_at=cancelled_at, seller_notes=STALE_ORDER_NOTE)
+            .execution_options(synchronize_session=False)
+        )
+        Item.release_stock_bulk(restock)
+        mark_items_touched(db.session, restock)
+        record_status_changes(db.session, rows, 'cancelled')
+        db.session.commit()
+
+        metrics['chunks'] += 1
+        metrics['orders_released'] += len(order_ids)
+        metrics['units_restored'] += sum(restock.values())
+        metrics['item_updates'] += len(restock)
+        metrics['max_chunk_ms'] = max(metrics['max_chunk_ms'], (time.perf_counter() - chunk_started) * 1000)
+
+        if len(rows) < chunk_size:
+            break
+
+    elapsed = time.perf_counter() - started
+    metrics['elapsed_seconds'] = round(elapsed, 3)
+    metrics['orders_per_second'] = round(metrics['orders_released'] / elapsed, 1) if elapsed else 0.0
+    metrics['max_chunk_ms'] = round(metrics['max_chunk_ms'], 1)
+    return metrics
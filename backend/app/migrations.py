@@ -0,0 +1,92 @@
+"""
+Schema Migrations - Versioned SQL files applied once at deploy time
+"""
+import os
+import re
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+VERSION_TABLE = 'schema_version'
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+
+class SchemaVersionError(RuntimeError):
+    """Raised when the database schema is behind the migrations on disk"""
+
+
+def discover_migrations():
+    """Return (version, name, path) tuples for every migration file, oldest first"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+def split_statements(sql):
+    """Split a migration file into individual statements, dropping comment lines"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def latest_version():
+    migrations = discover_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(connection):
+    """Get the highest applied migration version, or 0 for an unmanaged database"""
+    if not inspect(connection).has_table(VERSION_TABLE):
+        return 0
+    version = connection.execute(text(f"SELECT MAX(version) FROM {VERSION_TABLE}")).scalar()
+    return version or 0
+
+
+def apply_migrations(engine):
+    """Apply every pending migration and record it in the version table"""
+    applied = []
+    with engine.begin() as connection:
+        connection.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+                version INT NOT NULL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at DATETIME NOT NULL
+            )
+        """))
+        version = current_version(connection)
+
+    for migration_version, name, path in discover_migrations():
+        if migration_version <= version:
+            continue
+
+        with open(path, encoding='utf-8') as f:
+            statements = split_statements(f.read())
+
+        # MySQL commits DDL implicitly, so the version row is written last and a
+        # failed migration is simply retried on the next run
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(
+                text(f"INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {'version': migration_version, 'name': name, 'applied_at': datetime.utcnow()}
+            )
+        applied.append((migration_version, name))
+
+    return applied
+
+
+def verify_schema(engine):
+    """Fail fast if the database has not been migrated to the latest version"""
+    expected = latest_version()
+    with engine.connect() as connection:
+        version = current_version(connection)
+
+    if version < expected:
+        raise SchemaVersionError(
+            f"Database schema is at version {version} but version {expected} is required. "
+            f"Run `python manage.py migrate` before starting the server."
+        )
+    return version
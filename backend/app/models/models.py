@@ -1,9 +1,20 @@
 from app import db
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import Numeric, or_, and_
+from sqlalchemy import Numeric, or_, and_, case, update
 import pytz
 
+# Built once; pytz.timezone() per timestamp showed up in message serialization
+MANILA_TZ = pytz.timezone('Asia/Manila')
+
+def format_manila_time(dt):
+    """Format a datetime (naive means UTC) as Manila time in ISO format"""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = pytz.UTC.localize(dt)
+    return dt.astimezone(MANILA_TZ).strftime('%Y-%m-%dT%H:%M:%S+08:00')
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -56,6 +67,12 @@ class Item(db.Model):
     isNegotiable = db.Column(db.Boolean, default=False)
     isAuthenticated = db.Column(db.Boolean, default=False)
     tags = db.Column(db.JSON)
+    tags_text = db.Column(db.Text)  # Flattened tags for the FULLTEXT index, see app/search.py
+    # Denormalized counters, updated in the same transaction as deliveries and ratings
+    sold_quantity = db.Column(db.Integer, nullable=False, default=0)
+    delivered_order_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -64,95 +81,133 @@ class Item(db.Model):
     seller = db.relationship('User', backref='items')
     
     def to_dict(self):
-        # Try to get images, but handle the case where table doesn't exist
-        images_list = []
-        primary_image = None
-        
-        try:
-            # First, ensure the item_images table exists
-            from sqlalchemy import text
-            # Check if item_images table exists and create it if not
-            try:
-                db.engine.execute(text("SELECT 1 FROM item_images LIMIT 1"))
-            except Exception as table_error:
-                # Table doesn't exist, create it
-                print(f"Creating item_images table...")
-                db.engine.execute(text("""
-                    CREATE TABLE IF NOT EXISTS `item_images` (
-                      `id` int NOT NULL AUTO_INCREMENT,
-                      `item_id` int NOT NULL,
-                      `image_url` varchar(500) COLLATE utf8mb4_unicode_ci NOT NULL,
-                      `is_primary` tinyint(1) DEFAULT '0',
-                      `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
-                      PRIMARY KEY (`id`),
-                      KEY `idx_item_id` (`item_id`),
-                      CONSTRAINT `item_images_ibfk_1` FOREIGN KEY (`item_id`) REFERENCES `items` (`id`) ON DELETE CASCADE
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-                """))
-                
-            # Now try to get images from the relationship
-            images_list = [image.to_dict() for image in self.images.all()]
-            # Find primary image or use first image
-            if images_list:
-                primary_image = next((img for img in images_list if img.get('isPrimary')), images_list[0])
-        except Exception as e:
-            # If still can't access images, check file system
-            print(f"Warning: Could not load images for item {self.id}: {e}")
-            
-            # Check if there are images in the uploads directory
-            import os
-            upload_dir = f"uploads/items/{self.id}"
-            if os.path.exists(upload_dir):
-                image_files = [f for f in os.listdir(upload_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
-                if image_files:
-                    # Create image objects from files
-                    for i, image_file in enumerate(image_files):
-                        image_url = f"http://localhost:5000/uploads/items/{self.id}/{image_file}"
-                        images_list.append({
-                            'id': i + 1,
-                            'url': image_url,
-                            'isPrimary': i == 0,
-                            'created_at': None
-                        })
-                    primary_image = images_list[0] if images_list else None
+        return Item.bulk_to_dict([self])[0]
+    
+    @staticmethod
+    def record_delivery(item_id, quantity, delta=1):
+        """Add (or with delta=-1, remove) a delivered order in the item's sales counters"""
+        Item.query.filter_by(id=item_id).update({
+            Item.sold_quantity: Item.sold_quantity + delta * (quantity or 0),
+            Item.delivered_order_count: Item.delivered_order_count + delta
+        }, synchronize_session=False)
+    
+    @staticmethod
+    def record_rating(item_id, rating):
+        """Add a new rating to the item's rating counters"""
+        Item.query.filter_by(id=item_id).update({
+            Item.rating_sum: Item.rating_sum + rating,
+            Item.rating_count: Item.rating_count + 1
+        }, synchronize_session=False)
+    
+    @staticmethod
+    def reserve_stock(item_id, quantity):
+        """Atomically take `quantity` units from an active item's stock.
         
-        # Calculate real sales data from orders table
-        from sqlalchemy import func
-        sold_count = 0
-        total_sales_quantity = 0
+        A single conditional UPDATE, so concurrent checkouts cannot oversell
+        and the row lock is held only until the caller commits. The item
+        flips to 'sold' when its last unit is taken. Returns False when the
+        item is not active or has too little stock.
+        """
+        # status is assigned first: MySQL evaluates SET clauses left to right
+        result = db.session.execute(
+            update(Item)
+            .where(Item.id == item_id, Item.status == 'active', Item.stock >= quantity)
+            .ordered_values(
+                (Item.status, case((Item.stock <= quantity, 'sold'), else_=Item.status)),
+                (Item.stock, Item.stock - quantity)
+            )
+            .execution_options(synchronize_session=False, changes_item_status=True)
+        )
+        return result.rowcount == 1
+    
+    @staticmethod
+    def reserve_stock_bulk(quantities):
+        """Take stock from many items in one conditional UPDATE; `quantities` maps item_id -> units.
         
-        try:
-            # Get total quantity sold for this item from delivered orders
-            sales_data = db.session.query(
-                func.sum(Order.quantity).label('total_quantity'),
-                func.count(Order.id).label('order_count')
-            ).filter(
-                Order.item_id == self.id,
-                Order.status == 'delivered'
-            ).first()
-            
-            if sales_data and sales_data.total_quantity:
-                total_sales_quantity = int(sales_data.total_quantity)
-                sold_count = int(sales_data.order_count)
-        except Exception as e:
-            print(f"Error calculating sales data: {e}")
+        The ids are a primary-key IN list, which InnoDB scans and locks in
+        ascending id order, so two carts sharing items cannot deadlock.
+        Returns True only when every item was reserved; otherwise the caller
+        must roll back, since the items that did qualify were updated.
+        """
+        if not quantities:
+            return True
+        wanted = case(quantities, value=Item.id)
+        result = db.session.execute(
+            update(Item)
+            .where(Item.id.in_(sorted(quantities)), Item.status == 'active', Item.stock >= wanted)
+            .ordered_values(
+                (Item.status, case((Item.stock <= wanted, 'sold'), else_=Item.status)),
+                (Item.stock, Item.stock - wanted)
+            )
+            .execution_options(synchronize_session=False, changes_item_status=True)
+        )
+        return result.rowcount == len(quantities)
+    
+    @staticmethod
+    def release_stock(item_id, quantity):
+        """Atomically return `quantity` units to stock and make the item available again"""
+        db.session.execute(
+            update(Item)
+            .where(Item.id == item_id)
+            .values(stock=Item.stock + quantity, status='active')
+            .execution_options(synchronize_session=False, changes_item_status=True)
+        )
+    
+    @staticmethod
+    def release_stock_bulk(quantities):
+        """Return stock to many items in one UPDATE; `quantities` maps item_id -> units.
         
-        # Calculate real ratings data
-        rating = 0.0
-        rating_count = 0
+        Sold-out items and items held by a confirmed order ('pending') become
+        available again, as with release_stock; removed items keep their status.
+        """
+        if not quantities:
+            return
+        db.session.execute(
+            update(Item)
+            .where(Item.id.in_(list(quantities)))
+            .ordered_values(
+                (Item.status, case((Item.status.in_(['sold', 'pending']), 'active'), else_=Item.status)),
+                (Item.stock, Item.stock + case(quantities, value=Item.id, else_=0))
+            )
+            .execution_options(synchronize_session=False, changes_item_status=True)
+        )
+    
+    @staticmethod
+    def set_status_bulk(item_ids, status):
+        """Set many items' status in one UPDATE, as order status changes do"""
+        if not item_ids:
+            return
+        db.session.execute(
+            update(Item)
+            .where(Item.id.in_(list(item_ids)))
+            .values(status=status)
+            .execution_options(synchronize_session=False, changes_item_status=True)
+        )
+    
+    @staticmethod
+    def record_deliveries(deliveries):
+        """Add delivered orders to many items' sales counters in one UPDATE.
         
-        try:
-            # Get average rating and count for this item
-            rating_data = db.session.query(
-                func.avg(Rating.rating).label('avg_rating'),
-                func.count(Rating.id).label('rating_count')
-            ).filter(Rating.item_id == self.id).first()
-            
-            if rating_data and rating_data.avg_rating:
-                rating = float(rating_data.avg_rating)
-                rating_count = int(rating_data.rating_count)
-        except Exception as e:
-            print(f"Error calculating rating data: {e}")
+        `deliveries` maps item_id -> (units delivered, number of orders).
+        """
+        if not deliveries:
+            return
+        units = {item_id: value[0] for item_id, value in deliveries.items()}
+        orders = {item_id: value[1] for item_id, value in deliveries.items()}
+        db.session.execute(
+            update(Item)
+            .where(Item.id.in_(list(deliveries)))
+            .values(
+                sold_quantity=Item.sold_quantity + case(units, value=Item.id, else_=0),
+                delivered_order_count=Item.delivered_order_count + case(orders, value=Item.id, else_=0)
+            )
+            .execution_options(synchronize_session=False)
+        )
+    
+    def _build_dict(self, images_list, primary_image):
+        """Assemble the item payload from preloaded images and the stored counters"""
+        rating_count = self.rating_count or 0
+        rating = float(self.rating_sum) / rating_count if rating_count else 0.0
         
         return {
             'id': self.id,
@@ -175,13 +230,65 @@ class Item(db.Model):
             'images': images_list,
             'primary_image': primary_image,
             # Real sales and ratings data
-            'soldCount': total_sales_quantity,
-            'totalOrders': sold_count,
+            'soldCount': self.sold_quantity or 0,
+            'totalOrders': self.delivered_order_count or 0,
             'rating': rating,
             'ratingCount': rating_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+    
+    @staticmethod
+    def bulk_to_dict(items, include_seller=False):
+        """Serialize many items at once.
+        
+        Images (and sellers, when requested) are loaded with a single query each
+        and sales/ratings come from the counter columns, so the number of queries
+        stays the same no matter how many items are on the page.
+        """
+        items = list(items)
+        if not items:
+            return []
+        
+        item_ids = [item.id for item in items]
+        
+        images_by_item = {}
+        for image in ItemImage.query.filter(
+            ItemImage.item_id.in_(item_ids)
+        ).order_by(ItemImage.item_id, ItemImage.id).all():
+            images_by_item.setdefault(image.item_id, []).append(image.to_dict())
+        
+        sellers_by_id = {}
+        if include_seller:
+            seller_ids = {item.seller_id for item in items}
+            sellers_by_id = {
+                seller.id: seller
+                for seller in User.query.filter(User.id.in_(seller_ids)).all()
+            }
+        
+        results = []
+        for item in items:
+            images_list = images_by_item.get(item.id, [])
+            primary_image = None
+            if images_list:
+                primary_image = next((img for img in images_list if img.get('isPrimary')), images_list[0])
+            
+            item_data = item._build_dict(images_list, primary_image)
+            
+            if include_seller:
+                seller = sellers_by_id.get(item.seller_id)
+                if seller:
+                    item_data['seller'] = {
+                        'id': seller.id,
+                        'username': seller.username,
+                        'first_name': seller.first_name,
+                        'last_name': seller.last_name
+                    }
+                    item_data['seller_name'] = seller.username
+            
+            results.append(item_data)
+        
+        return results
 
 class ItemImage(db.Model):
     __tablename__ = 'item_images'
@@ -195,20 +302,23 @@ class ItemImage(db.Model):
     file_size = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @staticmethod
+    def build_url(item_id, image_path):
+        """Public URL of a stored image path"""
+        if not image_path:
+            return None
+        # If it's already a full URL, use it as is
+        if image_path.startswith('http'):
+            return image_path
+        # If it starts with 'items/', prepend the uploads path
+        if image_path.startswith('items/'):
+            return f"http://localhost:5000/uploads/{image_path}"
+        # Otherwise, assume it's a filename and construct the full path
+        return f"http://localhost:5000/uploads/items/{item_id}/{image_path}"
+    
     def to_dict(self):
         # Construct the proper image URL
-        if self.image_path:
-            # If it's already a full URL, use it as is
-            if self.image_path.startswith('http'):
-                full_url = self.image_path
-            # If it starts with 'items/', prepend the uploads path
-            elif self.image_path.startswith('items/'):
-                full_url = f"http://localhost:5000/uploads/{self.image_path}"
-            # Otherwise, assume it's a filename and construct the full path
-            else:
-                full_url = f"http://localhost:5000/uploads/items/{self.item_id}/{self.image_path}"
-        else:
-            full_url = None
+        full_url = ItemImage.build_url(self.item_id, self.image_path)
         
         return {
             'id': self.id,
@@ -341,6 +451,122 @@ class Wishlist(db.Model):
         }
 
 
+class IdempotencyKey(db.Model):
+    """Response stored for a request made with an Idempotency-Key header"""
+    __tablename__ = 'idempotency_keys'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    idempotency_key = db.Column(db.String(64), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.SmallInteger, nullable=False)
+    response_body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class OrderEvent(db.Model):
+    """Outbox row for an order being created or changing status, see app/outbox.py"""
+    __tablename__ = 'order_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False)
+    buyer_id = db.Column(db.Integer, nullable=False)
+    seller_id = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.Enum('created', 'status_changed'), nullable=False)
+    from_status = db.Column(db.String(20))
+    to_status = db.Column(db.String(20), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    total_amount = db.Column(Numeric(10, 2), nullable=False)
+    order_created_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class OutboxConsumer(db.Model):
+    """Position of an outbox consumer: the last order event it has applied"""
+    __tablename__ = 'outbox_consumers'
+
+    name = db.Column(db.String(64), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OrderStatusCount(db.Model):
+    """Number of a user's orders in each status, as buyer and as seller"""
+    __tablename__ = 'order_status_counts'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    role = db.Column(db.Enum('buyer', 'seller'), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyOrderRollup(db.Model):
+    """Orders placed on a day, by their current status"""
+    __tablename__ = 'daily_order_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Numeric(14, 2), nullable=False, default=0)
+
+
+class Notification(db.Model):
+    """Inbox entry written when something happens to one of the user's orders, see app/inbox.py"""
+    __tablename__ = 'notifications'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    type = db.Column(db.Enum(
+        'order_placed', 'order_confirmed', 'order_declined', 'order_shipped', 'order_delivered',
+        'order_cancelled', 'message_received', 'item_favorited'
+    ), nullable=False)
+    title = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    related_id = db.Column(db.Integer)
+    related_type = db.Column(db.Enum('order', 'item', 'message', 'user'))
+    is_read = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class NotificationCounter(db.Model):
+    """Per-user unread counters behind the badges, kept in step with every write"""
+    __tablename__ = 'notification_counters'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0)
+    unread_messages = db.Column(db.Integer, nullable=False, default=0)
+    # Notifications up to this id count as read ("mark all as seen")
+    seen_notification_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ConversationThread(db.Model):
+    """Latest message and unread counts of one conversation, see app/threads.py"""
+    __tablename__ = 'conversation_threads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # The two participants, lower user id first
+    user_low_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # The item the conversation is about, 0 for general conversations
+    item_key = db.Column(db.Integer, nullable=False, default=0)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    last_message_at = db.Column(db.DateTime, nullable=False)
+    # Messages sent to each participant that they have not read
+    low_unread = db.Column(db.Integer, nullable=False, default=0)
+    high_unread = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', 'item_key', name='uq_conversation_threads_pair_item'),
+        db.Index('idx_conversation_threads_low', 'user_low_id', 'last_message_at', 'id'),
+        db.Index('idx_conversation_threads_high', 'user_high_id', 'last_message_at', 'id'),
+    )
+
+
 class SellerProfile(db.Model):
     __tablename__ = 'seller_profiles'
     
@@ -438,6 +664,19 @@ class Message(db.Model):
     is_receiver_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # The two participants, lower user id first, whoever sent the message;
+    # with item_id and id they index a conversation in message order
+    user_low_id = db.Column(db.Integer, db.Computed(
+        'CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END', persisted=False
+    ))
+    user_high_id = db.Column(db.Integer, db.Computed(
+        'CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END', persisted=False
+    ))
+    
+    __table_args__ = (
+        db.Index('idx_messages_pair_item', 'user_low_id', 'user_high_id', 'item_id', 'id'),
+        db.Index('idx_messages_receiver_unread', 'receiver_id', 'sender_id', 'item_id', 'is_receiver_read'),
+    )
     
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
@@ -447,29 +686,7 @@ class Message(db.Model):
     
     def get_manila_time(self, dt):
         """Convert datetime to Manila timezone"""
-        if dt is None:
-            return None
-        
-        try:
-            import pytz
-            # Manila timezone
-            manila = pytz.timezone('Asia/Manila')
-            
-            # If dt is naive (no timezone info), assume it's UTC
-            if dt.tzinfo is None:
-                utc = pytz.UTC
-                dt = utc.localize(dt)
-            
-            # Convert to Manila time
-            manila_time = dt.astimezone(manila)
-            # Return in ISO format with Manila timezone
-            return manila_time.strftime('%Y-%m-%dT%H:%M:%S+08:00')
-        except ImportError:
-            # Fallback if pytz is not available - add 8 hours to UTC
-            from datetime import timedelta
-            manila_offset = timedelta(hours=8)
-            manila_time = dt + manila_offset
-            return manila_time.strftime('%Y-%m-%dT%H:%M:%S+08:00')
+        return format_manila_time(dt)
     
     def get_conversation_partner(self, user_id):
         """Get the conversation partner for a given user"""
@@ -0,0 +1,124 @@
+"""
+Order Queries - Order lists with item and counterparty data in one query
+
+Seller queues and buyer histories used to serialize each order with
+Item.query.get, item.to_dict() and User.query.get, which is several queries
+per row. Here a page is one SELECT. It joins the order's item and the other
+party, and gets the primary image path from a correlated subquery. Each row
+becomes the order dict plus a compact item summary.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from .models.models import db, Item, ItemImage, Order, User
+from .pagination import paginate_keyset
+
+ORDER_STATUSES = ['pending', 'confirmed', 'declined', 'shipped', 'delivered', 'cancelled']
+
+
+def primary_image_path():
+    """Correlated subquery: the primary image of the order's item, else its first image"""
+    return select(ItemImage.image_path).where(
+        ItemImage.item_id == Order.item_id
+    ).order_by(
+        ItemImage.is_primary.desc(), ItemImage.id
+    ).limit(1).correlate(Order).scalar_subquery()
+
+
+def order_list_query(party_column):
+    """Orders joined with their item, primary image and the user in `party_column`"""
+    party = aliased(User, name='party')
+    return db.session.query(
+        Order,
+        Item.title.label('item_title'),
+        Item.category.label('item_category'),
+        Item.price.label('item_price'),
+        Item.status.label('item_status'),
+        Item.stock.label('item_stock'),
+        Item.condition_status.label('item_condition'),
+        primary_image_path().label('item_image_path'),
+        party.id.label('party_id'),
+        party.username.label('party_username'),
+        party.first_name.label('party_first_name'),
+        party.last_name.label('party_last_name')
+    ).outerjoin(
+        Item, Item.id == Order.item_id
+    ).outerjoin(
+        party, party.id == party_column
+    )
+
+
+def parse_status_filter(args):
+    """Statuses from ?status=a,b or repeated ?status=; raises ValueError for unknown ones"""
+    statuses = []
+    for value in args.getlist('status'):
+        statuses.extend(part.strip() for part in value.split(',') if part.strip())
+    unknown = [status for status in statuses if status not in ORDER_STATUSES]
+    if unknown:
+        raise ValueError(f"Invalid status: {', '.join(unknown)}")
+    return statuses
+
+
+def parse_date_range(args):
+    """(start, end) datetimes from ?from= and ?to= ISO dates; `to` is inclusive of its whole day"""
+    start = end = None
+    try:
+        if args.get('from'):
+            start = datetime.fromisoformat(args['from'])
+        if args.get('to'):
+            end = datetime.fromisoformat(args['to'])
+            if len(args['to']) == 10:
+                end += timedelta(days=1)
+    except ValueError:
+        raise ValueError('from and to must be ISO dates, e.g. 2024-05-31')
+    return start, end
+
+
+def apply_order_filters(query, statuses=None, start=None, end=None):
+    if statuses:
+        query = query.filter(Order.status.in_(statuses))
+    if start:
+        query = query.filter(Order.created_at >= start)
+    if end:
+        query = query.filter(Order.created_at < end)
+    return query
+
+
+def paginate_orders(query, cursor, per_page, tag):
+    """Newest first, seeking on (created_at, id); returns (rows, next_cursor)"""
+    return paginate_keyset(
+        query, Order.created_at, Order.id, True, cursor, per_page, tag=tag,
+        key=lambda row: (row.Order.created_at, row.Order.id)
+    )
+
+
+def order_row_to_dict(row, party_key):
+    """Order dict with a compact item summary and the other party under `party_key`"""
+    order = row.Order
+    order_data = order.to_dict()
+
+    if row.item_title is not None:
+        image_url = ItemImage.build_url(order.item_id, row.item_image_path)
+        order_data['item'] = {
+            'id': order.item_id,
+            'title': row.item_title,
+            'category': row.item_category,
+            'price': float(row.item_price) if row.item_price is not None else None,
+            'status': row.item_status,
+            'stock': row.item_stock,
+            # Item.to_dict calls it condition; the order modals read either
+            'condition': row.item_condition,
+            'condition_status': row.item_condition,
+            'image_url': image_url,
+            'primary_image': {'url': image_url} if image_url else None
+        }
+
+    if row.party_id is not None:
+        order_data[party_key] = {
+            'id': row.party_id,
+            'username': row.party_username,
+            'first_name': row.party_first_name,
+            'last_name': row.party_last_name
+        }
+
+    return order_data
@@ -0,0 +1,390 @@
+"""
+Order Outbox - Order events written with the change, applied in batches
+
+Every order creation and status change adds a row to order_events in the
+same transaction as the change itself, so an event exists exactly when its
+change was committed:
+
+    ORM writes    an after_flush hook compares each Order's status history
+    Bulk UPDATEs  call record_status_changes / record_orders_created, as they
+                  call mark_items_touched for the response cache
+
+Consumers read events in id order and keep their position in
+outbox_consumers. A batch's rollup updates and the new position commit
+together, so each event is applied exactly once. A consumer only takes
+events older than OUTBOX_SETTLE_SECONDS: auto-increment ids are assigned
+before commit, and a slow transaction could otherwise commit a lower id
+after a higher one has been consumed.
+
+The same transaction fans the events out into users' notifications, see
+app/inbox.py.
+
+Rollups kept by the built-in consumers:
+    order_status_counts   orders per (user, buyer/seller, status)
+    daily_order_rollups   orders, units and revenue per (order day, status),
+                          for the admin sales reports
+
+Run `python manage.py consume-order-events --interval 5` as a service.
+`python manage.py rebuild-order-rollups` recomputes the rollups from orders
+(to initialize them, or to repair drift) and moves every consumer to the
+latest event.
+"""
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import and_, case, event, func, inspect, select, tuple_
+from sqlalchemy.orm import Session
+from .inbox import fan_out_order_events
+from .models.models import db, Order, OrderEvent, OutboxConsumer, OrderStatusCount, DailyOrderRollup
+
+OUTBOX_SETTLE_SECONDS = int(os.getenv('OUTBOX_SETTLE_SECONDS', '5'))
+
+
+def order_event_row(order, event_type, from_status, to_status, now=None):
+    """Insert parameters for an event about `order` (an Order or a row with the same columns)"""
+    return {
+        'order_id': order.id,
+        'buyer_id': order.buyer_id,
+        'seller_id': order.seller_id,
+        'item_id': order.item_id,
+        'event_type': event_type,
+        'from_status': from_status,
+        'to_status': to_status,
+        'quantity': order.quantity or 0,
+        'total_amount': order.total_amount or 0,
+        'order_created_at': order.created_at,
+        'created_at': now or datetime.utcnow()
+    }
+
+
+def _write_events(session, rows):
+    # Core inserts on the session's connection, so they are safe inside flush hooks
+    if rows:
+        session.connection().execute(OrderEvent.__table__.insert(), rows)
+        fan_out_order_events(session, rows)
+
+
+def record_orders_created(session, orders):
+    """Add 'created' events for orders inserted without a flush"""
+    now = datetime.utcnow()
+    _write_events(session, [order_event_row(order, 'created', None, order.status, now) for order in orders])
+
+
+def record_status_changes(session, orders, to_status):
+    """Add 'status_changed' events for orders moved with a bulk UPDATE.
+
+    `orders` are the rows as read before the update; their status is the
+    previous one.
+    """
+    now = datetime.utcnow()
+    _write_events(session, [
+        order_event_row(order, 'status_changed', order.status, to_status, now)
+        for order in orders if order.status != to_status
+    ])
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_order_writes(session, flush_context):
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, Order):
+            rows.append(order_event_row(obj, 'created', None, obj.status or 'pending'))
+    for obj in session.dirty:
+        if isinstance(obj, Order) and obj not in session.deleted:
+            history = inspect(obj).attrs.status.history
+            if not history.added:
+                continue
+            from_status = history.deleted[0] if history.deleted else None
+            if history.added[0] != from_status:
+                rows.append(order_event_row(obj, 'status_changed', from_status, history.added[0]))
+    _write_events(session, rows)
+
+
+# Consumers
+
+class OrderEventConsumer(ABC):
+    """Base class for a consumer; subclasses set `name` and implement apply and rebuild"""
+
+    name = None
+
+    @abstractmethod
+    def apply(self, events):
+        """Fold a batch of events into the rollup, in the caller's transaction"""
+
+    @abstractmethod
+    def rebuild(self):
+        """Recompute the rollup from the orders table, in the caller's transaction"""
+
+
+def apply_deltas(model, key_columns, deltas):
+    """Add `deltas` ({key tuple: {column: delta}}) to a rollup table.
+
+    One locking SELECT finds the existing rows; they are updated in one
+    batched flush and the missing ones inserted.
+    """
+    if not deltas:
+        return
+    columns = [getattr(model, name) for name in key_columns]
+    existing = {
+        tuple(getattr(row, name) for name in key_columns): row
+        for row in model.query.filter(tuple_(*columns).in_(list(deltas))).with_for_update().all()
+    }
+    for key, changes in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            db.session.add(model(**dict(zip(key_columns, key)), **changes))
+        else:
+            for name, delta in changes.items():
+                setattr(row, name, getattr(row, name) + delta)
+    db.session.flush()
+
+
+def _status_moves(event):
+    """(status, sign) pairs: the order leaves its previous status and enters the new one"""
+    if event.from_status:
+        yield event.from_status, -1
+    yield event.to_status, 1
+
+
+class OrderStatusCounts(OrderEventConsumer):
+    name = 'order_status_counts'
+
+    def apply(self, events):
+        deltas = defaultdict(lambda: {'order_count': 0})
+        for order_event in events:
+            for status, sign in _status_moves(order_event):
+                deltas[(order_event.buyer_id, 'buyer', status)]['order_count'] += sign
+                deltas[(order_event.seller_id, 'seller', status)]['order_count'] += sign
+        apply_deltas(OrderStatusCount, ('user_id', 'role', 'status'),
+                     {key: value for key, value in deltas.items() if value['order_count']})
+
+    def rebuild(self):
+        OrderStatusCount.query.delete(synchronize_session=False)
+        rows = []
+        for role, column in (('buyer', Order.buyer_id), ('seller', Order.seller_id)):
+            for user_id, status, count in db.session.query(
+                column, Order.status, func.count(Order.id)
+            ).group_by(column, Order.status):
+                rows.append({'user_id': user_id, 'role': role, 'status': status, 'order_count': count})
+        if rows:
+            db.session.execute(OrderStatusCount.__table__.insert(), rows)
+
+
+class DailyOrderRollups(OrderEventConsumer):
+    name = 'daily_order_rollups'
+
+    def apply(self, events):
+        deltas = defaultdict(lambda: {'order_count': 0, 'units': 0, 'revenue': Decimal('0')})
+        for order_event in events:
+            day = order_event.order_created_at.date()
+            for status, sign in _status_moves(order_event):
+                delta = deltas[(day, status)]
+                delta['order_count'] += sign
+                delta['units'] += sign * order_event.quantity
+                delta['revenue'] += sign * Decimal(order_event.total_amount)
+        apply_deltas(DailyOrderRollup, ('day', 'status'),
+                     {key: value for key, value in deltas.items() if any(value.values())})
+
+    def rebuild(self):
+        DailyOrderRollup.query.delete(synchronize_session=False)
+        day = func.date(Order.created_at)
+        rows = [
+            {
+                # SQLite returns DATE() as text
+                'day': date.fromisoformat(row.day) if isinstance(row.day, str) else row.day,
+                'status': row.status,
+                'order_count': row.order_count,
+                'units': int(row.units or 0),
+                'revenue': row.revenue or 0
+            }
+            for row in db.session.query(
+                day.label('day'), Order.status.label('status'),
+                func.count(Order.id).label('order_count'),
+                func.sum(Order.quantity).label('units'),
+                func.sum(Order.total_amount).label('revenue')
+            ).group_by(day, Order.status)
+        ]
+        if rows:
+            db.session.execute(DailyOrderRollup.__table__.insert(), rows)
+
+
+ORDER_EVENT_CONSUMERS = [OrderStatusCounts(), DailyOrderRollups()]
+
+
+def _lock_position(name):
+    position = db.session.query(OutboxConsumer).filter_by(name=name).with_for_update().first()
+    if position is None:
+        position = OutboxConsumer(name=name, last_event_id=0)
+        db.session.add(position)
+        db.session.flush()
+    return position
+
+
+def consume_batch(consumer, batch_size=500, settle_seconds=None, now=None):
+    """Apply the consumer's next batch of settled events; returns how many were applied.
+
+    The consumer's position row is locked for the whole batch, so several
+    workers can run the same consumer without applying an event twice.
+    """
+    if settle_seconds is None:
+        settle_seconds = OUTBOX_SETTLE_SECONDS
+    settled_before = (now or datetime.utcnow()) - timedelta(seconds=settle_seconds)
+
+    position = _lock_position(consumer.name)
+    events = OrderEvent.query.filter(
+        OrderEvent.id > position.last_event_id
+    ).order_by(OrderEvent.id).limit(batch_size).all()
+
+    # Stop at the first unsettled event so nothing is ever skipped
+    for index, order_event in enumerate(events):
+        if order_event.created_at > settled_before:
+            events = events[:index]
+            break
+
+    if not events:
+        db.session.rollback()
+        return 0
+
+    consumer.apply(events)
+    position.last_event_id = events[-1].id
+    db.session.commit()
+    return len(events)
+
+
+def consume_order_events(consumers=None, batch_size=500, settle_seconds=None):
+    """Drain every consumer, one transaction per batch; returns per-consumer metrics"""
+    results = {}
+    for consumer in consumers or ORDER_EVENT_CONSUMERS:
+        started = time.perf_counter()
+        applied = batches = 0
+        while True:
+            count = consume_batch(consumer, batch_size, settle_seconds)
+            if not count:
+                break
+            applied += count
+            batches += 1
+            if count < batch_size:
+                break
+        results[consumer.name] = {
+            'events_applied': applied,
+            'batches': batches,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
+    return results
+
+
+def rebuild_rollups(consumers=None):
+    """Recompute each consumer's rollup from orders and move it to the latest event.
+
+    Events written while a rebuild runs may be counted twice or not at all;
+    run it while order traffic is quiet.
+    """
+    results = {}
+    for consumer in consumers or ORDER_EVENT_CONSUMERS:
+        position = _lock_position(consumer.name)
+        position.last_event_id = db.session.query(func.coalesce(func.max(OrderEvent.id), 0)).scalar()
+        consumer.rebuild()
+        db.session.commit()
+        results[consumer.name] = position.last_event_id
+    return results
+
+
+def purge_consumed_events(older_than_days=30, chunk_size=1000):
+    """Delete events that every consumer has applied and that are older than the cutoff"""
+    names = [consumer.name for consumer in ORDER_EVENT_CONSUMERS]
+    positions = db.session.query(OutboxConsumer.last_event_id).filter(OutboxConsumer.name.in_(names)).all()
+    if len(positions) < len(names):
+        db.session.rollback()
+        return 0
+    consumed_through = min(row.last_event_id for row in positions)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(OrderEvent.id).filter(
+            OrderEvent.id <= consumed_through,
+            OrderEvent.created_at < cutoff
+        ).order_by(OrderEvent.id).limit(chunk_size)]
+        if not ids:
+            break
+        OrderEvent.query.filter(OrderEvent.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < chunk_size:
+            break
+    db.session.rollback()
+    return deleted
+
+
+# Readers
+
+def order_status_count_expression(user_id, role, statuses):
+    """SQL expression for order_status_count, to embed in a larger SELECT"""
+    user_column = OrderEvent.buyer_id if role == 'buyer' else OrderEvent.seller_id
+    position = select(func.coalesce(func.max(OutboxConsumer.last_event_id), 0)).where(
+        OutboxConsumer.name == OrderStatusCounts.name
+    ).scalar_subquery()
+    rollup = select(func.coalesce(func.sum(OrderStatusCount.order_count), 0)).where(
+        OrderStatusCount.user_id == user_id,
+        OrderStatusCount.role == role,
+        OrderStatusCount.status.in_(statuses)
+    ).scalar_subquery()
+    pending = select(func.coalesce(func.sum(
+        case((OrderEvent.to_status.in_(statuses), 1), else_=0)
+        - case((and_(OrderEvent.from_status.isnot(None), OrderEvent.from_status.in_(statuses)), 1), else_=0)
+    ), 0)).where(
+        user_column == user_id,
+        OrderEvent.id > position
+    ).scalar_subquery()
+    return rollup + pending
+
+
+def order_status_count(user_id, role, statuses):
+    """How many of a user's orders (as 'buyer' or 'seller') are in `statuses`.
+
+    One statement: the rollup plus the events its consumer has not applied
+    yet, so the count is current even when the consumer lags.
+    """
+    expression = order_status_count_expression(user_id, role, statuses)
+    return int(db.session.execute(select(expression)).scalar() or 0)
+
+
+def sales_totals(start_day, end_day, statuses):
+    """(orders, units, revenue) for orders placed from start_day to end_day inclusive, in `statuses`.
+
+    One statement: the daily rollup plus the events its consumer has not
+    applied yet, like order_status_count.
+    """
+    position = select(func.coalesce(func.max(OutboxConsumer.last_event_id), 0)).where(
+        OutboxConsumer.name == DailyOrderRollups.name
+    ).scalar_subquery()
+
+    def rollup(column):
+        return select(func.coalesce(func.sum(column), 0)).where(
+            DailyOrderRollup.day >= start_day,
+            DailyOrderRollup.day <= end_day,
+            DailyOrderRollup.status.in_(statuses)
+        ).scalar_subquery()
+
+    # +1 for an event entering `statuses`, -1 for one leaving them
+    sign = (
+        case((OrderEvent.to_status.in_(statuses), 1), else_=0)
+        - case((and_(OrderEvent.from_status.isnot(None), OrderEvent.from_status.in_(statuses)), 1), else_=0)
+    )
+
+    def pending(weight):
+        return select(func.coalesce(func.sum(sign * weight), 0)).where(
+            OrderEvent.id > position,
+            OrderEvent.order_created_at >= datetime.combine(start_day, datetime.min.time()),
+            OrderEvent.order_created_at < datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+        ).scalar_subquery()
+
+    row = db.session.execute(select(
+        rollup(DailyOrderRollup.order_count) + pending(1),
+        rollup(DailyOrderRollup.units) + pending(OrderEvent.quantity),
+        rollup(DailyOrderRollup.revenue) + pending(OrderEvent.total_amount)
+    )).one()
+    return int(row[0] or 0), int(row[1] or 0), float(row[2] or 0)
@@ -0,0 +1,91 @@
+"""
+Keyset Pagination - Opaque cursors for seek-based paging
+
+Instead of COUNT(*) + OFFSET, each page remembers the sort key of its last row
+and the next page seeks past it with an indexed range predicate, so page 50
+costs the same as page 1.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor is malformed or was issued for a different sort"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+    return value
+
+
+def encode_cursor(tag, key):
+    """Build an opaque cursor from a sort tag and the (sort value, id) of the last row"""
+    payload = {'s': tag, 'k': [_encode_value(value) for value in key]}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(tag, cursor):
+    """Return the key stored in a cursor, checking it belongs to the same sort"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(payload, dict) or not isinstance(payload.get('k'), list) or len(payload['k']) != 2:
+            raise InvalidCursor('Invalid cursor')
+        key = [_decode_value(value) for value in payload['k']]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if payload.get('s') != tag:
+        raise InvalidCursor('Cursor does not match the requested sort order')
+    return key
+
+
+def seek_predicate(sort_column, id_column, key, descending):
+    """Rows strictly after `key` in (sort_column, id_column) order"""
+    value, last_id = key
+    if descending:
+        return or_(sort_column < value, and_(sort_column == value, id_column < last_id))
+    return or_(sort_column > value, and_(sort_column == value, id_column > last_id))
+
+
+def paginate_keyset(query, sort_column, id_column, descending, cursor, per_page, tag, key=None):
+    """Fetch one page of `query` ordered by (sort_column, id_column).
+
+    Returns (rows, next_cursor). next_cursor is None on the last page. `key`
+    extracts (sort value, id) from a row and defaults to reading the two
+    columns off the row by name.
+    """
+    if key is None:
+        key = lambda row: (getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    if cursor:
+        query = query.filter(seek_predicate(sort_column, id_column, decode_cursor(tag, cursor), descending))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # Fetch one extra row to learn whether another page exists without counting
+    rows = query.limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = encode_cursor(tag, key(rows[-1])) if has_next else None
+    return rows, next_cursor
@@ -11,7 +11,7 @@ def get_items():
     try:
         items = Item.query.all()
         return jsonify({
-            'items': [item.to_dict() for item in items]
+            'items': Item.bulk_to_dict(items)
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,23 +1,28 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..models.models import db, User, Item, Order
+from ..cache import cached_response, item_version_name
+from ..conditional import conditional_item, item_validators
 from datetime import datetime
 import uuid
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/items', methods=['GET'])
+@cached_response(lambda: ['catalog:list'])
 def get_items():
     try:
         # Get all active items (not sold, pending, or removed)
         items = Item.query.filter_by(status='active').all()
         return jsonify({
-            'items': [item.to_dict() for item in items]
+            'items': Item.bulk_to_dict(items)
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @main_bp.route('/items/<int:item_id>', methods=['GET'])
+@conditional_item(lambda item_id: item_validators(Item.query.filter_by(id=item_id)))
+@cached_response(lambda item_id: [item_version_name(item_id)])
 def get_item(item_id):
     try:
         item = Item.query.get(item_id)
@@ -1,7 +1,14 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models.models import Message, User, Item, Order
+from app.models.models import Message, User, Item, Order, format_manila_time
+from app.inbox import get_counters
+from app.conversations import (
+    CONVERSATION_PARTNER_ROLES, list_conversations, conversation_row_to_dict,
+    conversation_messages_query, messages_after, messages_before, mark_conversation_read,
+    serialize_messages
+)
+from app.pagination import InvalidCursor
 from sqlalchemy import or_, and_
 from datetime import datetime
 
@@ -9,30 +16,7 @@ messages_bp = Blueprint('messages', __name__)
 
 def convert_to_manila_time(dt):
     """Convert UTC datetime to Manila timezone for display only"""
-    if dt is None:
-        return None
-    
-    try:
-        import pytz
-        # Manila timezone
-        manila = pytz.timezone('Asia/Manila')
-        utc = pytz.UTC
-        
-        # Ensure dt is timezone-aware UTC
-        if dt.tzinfo is None:
-            dt = utc.localize(dt)
-        elif dt.tzinfo != utc:
-            dt = dt.astimezone(utc)
-        
-        # Convert to Manila time for display
-        manila_time = dt.astimezone(manila)
-        return manila_time.strftime('%Y-%m-%dT%H:%M:%S+08:00')
-    except ImportError:
-        # Fallback - assume UTC and add 8 hours
-        from datetime import timedelta
-        manila_offset = timedelta(hours=8)
-        manila_time = dt + manila_offset
-        return manila_time.strftime('%Y-%m-%dT%H:%M:%S+08:00')
+    return format_manila_time(dt)
 
 @messages_bp.route('/send', methods=['POST'])
 @jwt_required()
@@ -94,7 +78,7 @@ def send_message():
         return jsonify({
             'success': True,
             'message': 'Message sent successfully',
-            'data': new_message.to_dict()
+            'data': serialize_messages([new_message])[0]
         }), 201
         
     except Exception as e:
@@ -105,10 +89,12 @@ def send_message():
 @messages_bp.route('/conversations', methods=['GET'])
 @jwt_required()
 def get_conversations():
-    """Get all conversations for current user, filtered by role compatibility and grouped by item"""
+    """Get the current user's conversations, one per partner and item, most recent first"""
     try:
-        current_user_id = get_jwt_identity()
-        item_id = request.args.get('item_id')  # Optional filter by item
+        current_user_id = int(get_jwt_identity())
+        item_id = request.args.get('item_id', type=int)  # Optional filter by item
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 100)
+        cursor = request.args.get('cursor', '')
         
         # Get current user to determine role
         current_user = User.query.get(current_user_id)
@@ -116,97 +102,28 @@ def get_conversations():
             return jsonify({'error': 'User not found'}), 404
             
         # Define allowed conversation partners based on role
-        allowed_roles = []
-        if current_user.role == 'seller':
-            allowed_roles = ['user']  # Sellers can only talk to users/customers
-        elif current_user.role == 'user':
-            allowed_roles = ['seller', 'admin']  # Users can talk to sellers and admins
-        elif current_user.role == 'admin':
-            allowed_roles = ['user', 'seller']  # Admins can talk to everyone
-        
-        # Get all messages involving current user
-        query = Message.query.filter(
-            or_(Message.sender_id == current_user_id, Message.receiver_id == current_user_id)
-        )
+        allowed_roles = CONVERSATION_PARTNER_ROLES.get(current_user.role, [])
         
-        # Filter by item if specified
-        if item_id:
-            query = query.filter(Message.item_id == item_id)
-            
-        all_messages = query.order_by(Message.created_at.desc()).all()
+        # One range read over the thread summaries, joined with each page
+        # conversation's latest message, partner, item, image and order
+        try:
+            rows, next_cursor = list_conversations(current_user_id, allowed_roles, item_id, cursor, per_page)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Group by conversation partner AND item (for item-specific conversations)
-        conversations_dict = {}
-        
-        for message in all_messages:
-            # Determine the partner (the other person in the conversation)
-            partner_id = message.receiver_id if message.sender_id == current_user_id else message.sender_id
-            
-            # Create a unique key for each conversation (partner + item)
-            conversation_key = f"{partner_id}_{message.item_id or 'general'}"
-            
-            # Skip if we've already found a more recent message for this conversation
-            if conversation_key in conversations_dict:
-                continue
-                
-            # Get partner information
-            partner = User.query.get(partner_id)
-            if not partner:
-                continue
-                
-            # Filter by allowed roles
-            if partner.role not in allowed_roles:
-                continue
-                
-            # Count unread messages FROM this partner TO current user for this item
-            unread_query = Message.query.filter(
-                Message.sender_id == partner_id,
-                Message.receiver_id == current_user_id,
-                Message.is_receiver_read == False
-            )
-            
-            if message.item_id:
-                unread_query = unread_query.filter(Message.item_id == message.item_id)
-            else:
-                unread_query = unread_query.filter(Message.item_id.is_(None))
-                
-            unread_count = unread_query.count()
-            
-            conversations_dict[conversation_key] = {
-                'partner_id': partner_id,
-                'partner_username': partner.username,
-                'partner_role': partner.role,
-                'item_id': message.item_id,
-                'item': {
-                    'id': message.item.id,
-                    'title': message.item.title,
-                    'price': float(message.item.price),
-                    'status': message.item.status,
-                    'images': [img.image_path for img in message.item.images[:1]]
-                } if message.item else None,
-                'order': {
-                    'id': message.order.id,
-                    'order_number': message.order.order_number,
-                    'status': message.order.status,
-                    'total_amount': float(message.order.total_amount)
-                } if message.order else None,
-                'last_message': message.message,
-                'last_message_time': convert_to_manila_time(message.created_at),
-                'unread_count': unread_count,
-                'is_last_message_mine': message.sender_id == current_user_id
-            }
-        
-        # Convert to list and sort by last message time
-        conversations_list = list(conversations_dict.values())
-        conversations_list.sort(
-            key=lambda x: x['last_message_time'] if x['last_message_time'] else '', 
-            reverse=True
-        )
+        conversations_list = [
+            conversation_row_to_dict(row, current_user_id, convert_to_manila_time) for row in rows
+        ]
         
         return jsonify({
             'success': True,
             'conversations': conversations_list,
-            'user_role': current_user.role
+            'user_role': current_user.role,
+            'pagination': {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
         }), 200
         
     except Exception as e:
@@ -216,48 +133,42 @@ def get_conversations():
 @messages_bp.route('/conversation/<int:partner_id>', methods=['GET'])
 @jwt_required()
 def get_conversation_messages(partner_id):
-    """Get all messages in a conversation with a specific user, optionally filtered by item"""
+    """Get the messages in a conversation with a specific user, optionally filtered by item.
+    
+    With `after_id` only messages newer than it are returned (polling for new
+    messages); with `before_id` the ones just older (scrolling back). Both
+    skip the partner and item details, which the client already has.
+    Reading never marks messages read; clients call PUT /mark-read.
+    """
     try:
         current_user_id = get_jwt_identity()
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         item_id = request.args.get('item_id', type=int)  # Optional item filter
+        after_id = request.args.get('after_id', type=int)
+        before_id = request.args.get('before_id', type=int)
         
-        # Build the query
-        query = Message.query.filter(
-            or_(
-                and_(Message.sender_id == current_user_id, Message.receiver_id == partner_id),
-                and_(Message.sender_id == partner_id, Message.receiver_id == current_user_id)
-            )
-        )
+        # Both directions of the conversation share the (pair, item_id, id) index
+        query = conversation_messages_query(current_user_id, partner_id, item_id)
         
-        # Filter by item if specified
-        if item_id:
-            query = query.filter(Message.item_id == item_id)
+        if after_id is not None or before_id is not None:
+            limit = min(max(per_page, 1), 100)
+            if after_id is not None:
+                messages, has_more = messages_after(query, after_id, limit)
+            else:
+                messages, has_more = messages_before(query, before_id, limit)
+            
+            return jsonify({
+                'success': True,
+                'messages': serialize_messages(messages),
+                'has_more': has_more
+            }), 200
         
         # Get messages with pagination
-        messages = query.order_by(Message.created_at.desc()).paginate(
+        messages = query.order_by(Message.id.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
-        # Mark messages as read if current user is receiver
-        unread_query = Message.query.filter(
-            Message.sender_id == partner_id,
-            Message.receiver_id == current_user_id,
-            Message.is_receiver_read == False
-        )
-        
-        if item_id:
-            unread_query = unread_query.filter(Message.item_id == item_id)
-            
-        unread_messages = unread_query.all()
-        
-        for msg in unread_messages:
-            msg.is_receiver_read = True
-        
-        if unread_messages:
-            db.session.commit()
-        
         # Get partner info
         partner = User.query.get(partner_id)
         if not partner:
@@ -280,7 +191,7 @@ def get_conversation_messages(partner_id):
         
         return jsonify({
             'success': True,
-            'messages': [msg.to_dict() for msg in reversed(messages.items)],  # Reverse to show oldest first
+            'messages': serialize_messages(reversed(messages.items)),  # Reverse to show oldest first
             'partner': {
                 'id': partner.id,
                 'username': partner.username,
@@ -304,31 +215,24 @@ def get_conversation_messages(partner_id):
 @messages_bp.route('/mark-read', methods=['PUT'])
 @jwt_required()
 def mark_messages_read():
-    """Mark messages as read"""
+    """Mark the messages from a sender (optionally about one item) as read"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         data = request.get_json()
         
         if not data or not data.get('sender_id'):
             return jsonify({'error': 'Sender ID is required'}), 400
         
         sender_id = data.get('sender_id')
+        item_id = data.get('item_id')
         
-        # Mark all unread messages from sender as read
-        unread_messages = Message.query.filter(
-            Message.sender_id == sender_id,
-            Message.receiver_id == current_user_id,
-            Message.is_receiver_read == False
-        ).all()
-        
-        for msg in unread_messages:
-            msg.is_receiver_read = True
-        
-        db.session.commit()
+        # One UPDATE over the unread messages, however many there are
+        marked = mark_conversation_read(current_user_id, sender_id, item_id)
         
         return jsonify({
             'success': True,
-            'message': f'Marked {len(unread_messages)} messages as read'
+            'message': f'Marked {marked} messages as read',
+            'marked_count': marked
         }), 200
         
     except Exception as e:
@@ -340,12 +244,10 @@ def mark_messages_read():
 def get_unread_count():
     """Get total unread message count for current user"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
-        unread_count = Message.query.filter(
-            Message.receiver_id == current_user_id,
-            Message.is_receiver_read == False
-        ).count()
+        # Maintained on message send and read, see app/inbox.py
+        _, unread_count = get_counters(current_user_id)
         
         return jsonify({
             'success': True,
@@ -475,7 +377,7 @@ def start_conversation():
         return jsonify({
             'success': True,
             'message': 'Conversation started successfully',
-            'data': new_message.to_dict()
+            'data': serialize_messages([new_message])[0]
         }), 201
         
     except Exception as e:
@@ -533,7 +435,7 @@ def start_item_conversation(item_id):
         return jsonify({
             'success': True,
             'message': 'Message sent to seller successfully',
-            'data': new_message.to_dict()
+            'data': serialize_messages([new_message])[0]
         }), 201
         
     except Exception as e:
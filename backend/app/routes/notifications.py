@@ -1,25 +1,44 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import db, Order, Item, User
+from app.inbox import get_counters, list_notifications, mark_seen, mark_read
+from app.badges import cached_badge_counts
 
 notifications_bp = Blueprint('notifications', __name__)
 
 @notifications_bp.route('/api/notifications/count', methods=['GET'])
 @jwt_required()
 def get_notification_count():
-    """Get count of confirmed orders for the authenticated user"""
+    """Get the number of unread notifications for the authenticated user"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
-        # Count confirmed orders where user is the buyer
-        confirmed_count = db.session.query(Order).filter(
-            Order.buyer_id == current_user_id,
-            Order.status == 'confirmed'
-        ).count()
+        # One primary-key read of the user's counters
+        unread_notifications, _ = get_counters(current_user_id)
         
         return jsonify({
             'success': True,
-            'notification_count': confirmed_count
+            'notification_count': unread_notifications
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@notifications_bp.route('/api/me/counters', methods=['GET'])
+@jwt_required()
+def get_my_counters():
+    """Every badge count for the authenticated user in one response"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        # One query, cached per user until a message or order write changes it
+        counts = cached_badge_counts(current_user_id)
+        
+        return jsonify({
+            'success': True,
+            **counts
         })
         
     except Exception as e:
@@ -31,35 +50,12 @@ def get_notification_count():
 @notifications_bp.route('/api/notifications', methods=['GET'])
 @jwt_required()
 def get_notifications():
-    """Get list of confirmed orders as notifications for the authenticated user"""
+    """Get the latest notifications for the authenticated user"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get confirmed orders with item and seller details
-        notifications = db.session.query(Order, Item, User).join(
-            Item, Order.item_id == Item.id
-        ).join(
-            User, Order.seller_id == User.id
-        ).filter(
-            Order.buyer_id == current_user_id,
-            Order.status == 'confirmed'
-        ).order_by(Order.confirmed_at.desc()).limit(20).all()
-        
-        notification_list = []
-        for order, item, seller in notifications:
-            notification_list.append({
-                'id': order.id,
-                'type': 'order_confirmed',
-                'title': 'Order Confirmed',
-                'message': f'Your order for "{item.title}" has been confirmed by {seller.username}',
-                'order_id': order.id,
-                'order_number': order.order_number,
-                'item_title': item.title,
-                'seller_name': seller.username,
-                'amount': float(order.total_amount),
-                'confirmed_at': order.confirmed_at.isoformat() if order.confirmed_at else None,
-                'created_at': order.created_at.isoformat()
-            })
+        current_user_id = int(get_jwt_identity())
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        
+        notification_list = list_notifications(current_user_id, limit=limit)
         
         return jsonify({
             'success': True,
@@ -76,21 +72,46 @@ def get_notifications():
 @notifications_bp.route('/api/notifications/mark-seen', methods=['POST'])
 @jwt_required()
 def mark_notifications_seen():
-    """Mark confirmed orders as seen (for future enhancement)"""
+    """Mark notifications as seen, up to `up_to_id` (default: all of them)"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json(silent=True) or {}
+        
+        up_to_id = data.get('up_to_id')
+        if up_to_id is not None and not isinstance(up_to_id, int):
+            return jsonify({'success': False, 'error': 'up_to_id must be an integer'}), 400
         
-        # For now, just return success
-        # In the future, you could add a 'seen' column to orders table
-        # or create a user_notifications_seen table
+        unread_notifications = mark_seen(current_user_id, up_to_id)
         
         return jsonify({
             'success': True,
-            'message': 'Notifications marked as seen'
+            'message': 'Notifications marked as seen',
+            'notification_count': unread_notifications
         })
         
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@notifications_bp.route('/api/notifications/<int:notification_id>/read', methods=['PUT'])
+@jwt_required()
+def mark_notification_read(notification_id):
+    """Mark a single notification as read"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        if not mark_read(current_user_id, notification_id):
+            return jsonify({'success': False, 'error': 'Notification not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'message': 'Notification marked as read'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
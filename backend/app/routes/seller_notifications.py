@@ -1,25 +1,22 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import db, Order, Message, Item, User
+from app.inbox import get_counters, list_notifications, mark_seen
 
 seller_notifications_bp = Blueprint('seller_notifications', __name__)
 
 @seller_notifications_bp.route('/api/seller/notifications/count', methods=['GET'])
 @jwt_required()
 def get_seller_notification_count():
-    """Get count of pending and delivered orders for seller"""
+    """Get the number of unread notifications for seller"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
-        # Count orders where seller is current user and status is pending or delivered
-        order_count = db.session.query(Order).filter(
-            Order.seller_id == current_user_id,
-            Order.status.in_(['pending', 'delivered'])
-        ).count()
+        # One primary-key read of the seller's counters
+        unread_notifications, _ = get_counters(current_user_id)
         
         return jsonify({
             'success': True,
-            'notification_count': order_count
+            'notification_count': unread_notifications
         })
         
     except Exception as e:
@@ -31,43 +28,12 @@ def get_seller_notification_count():
 @seller_notifications_bp.route('/api/seller/notifications', methods=['GET'])
 @jwt_required()
 def get_seller_notifications():
-    """Get list of pending and delivered orders as notifications for seller"""
+    """Get the latest notifications (new orders, deliveries) for seller"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
+        limit = min(request.args.get('limit', 20, type=int), 100)
         
-        # Get pending and delivered orders with item and buyer details
-        notifications = db.session.query(Order, Item, User).join(
-            Item, Order.item_id == Item.id
-        ).join(
-            User, Order.buyer_id == User.id
-        ).filter(
-            Order.seller_id == current_user_id,
-            Order.status.in_(['pending', 'delivered'])
-        ).order_by(Order.created_at.desc()).limit(20).all()
-        
-        notification_list = []
-        for order, item, buyer in notifications:
-            if order.status == 'pending':
-                title = 'New Order Received'
-                message = f'You have a new order from {buyer.username} for "{item.title}"'
-            else:  # delivered
-                title = 'Order Delivered'
-                message = f'Order #{order.order_number} for "{item.title}" has been delivered'
-            
-            notification_list.append({
-                'id': order.id,
-                'type': f'order_{order.status}',
-                'title': title,
-                'message': message,
-                'order_id': order.id,
-                'order_number': order.order_number,
-                'item_title': item.title,
-                'buyer_name': buyer.username,
-                'amount': float(order.total_amount),
-                'status': order.status,
-                'created_at': order.created_at.isoformat(),
-                'delivered_at': order.delivered_at.isoformat() if order.delivered_at else None
-            })
+        notification_list = list_notifications(current_user_id, limit=limit)
         
         return jsonify({
             'success': True,
@@ -81,18 +47,41 @@ def get_seller_notifications():
             'error': str(e)
         }), 500
 
+@seller_notifications_bp.route('/api/seller/notifications/mark-seen', methods=['POST'])
+@jwt_required()
+def mark_seller_notifications_seen():
+    """Mark seller notifications as seen, up to `up_to_id` (default: all of them)"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        data = request.get_json(silent=True) or {}
+        
+        up_to_id = data.get('up_to_id')
+        if up_to_id is not None and not isinstance(up_to_id, int):
+            return jsonify({'success': False, 'error': 'up_to_id must be an integer'}), 400
+        
+        unread_notifications = mark_seen(current_user_id, up_to_id)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Notifications marked as seen',
+            'notification_count': unread_notifications
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @seller_notifications_bp.route('/api/seller/messages/unread-count', methods=['GET'])
 @jwt_required()
 def get_seller_unread_message_count():
     """Get count of unread messages for seller"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
-        # Count messages where seller is receiver and message is unread
-        unread_count = db.session.query(Message).filter(
-            Message.receiver_id == current_user_id,
-            Message.is_receiver_read == False
-        ).count()
+        # Maintained on message send and read, see app/inbox.py
+        _, unread_count = get_counters(current_user_id)
         
         return jsonify({
             'success': True,
@@ -103,4 +92,4 @@ def get_seller_unread_message_count():
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
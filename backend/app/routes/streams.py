@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import decode_token, get_unverified_jwt_headers
+from flask_jwt_extended.internal_utils import custom_verification_for_token, verify_token_not_blocklisted
+from app.streams import stream_registry, counter_events
+
+streams_bp = Blueprint('streams', __name__)
+
+@streams_bp.route('/api/stream/counters', methods=['GET'])
+def stream_counters():
+    """Server-Sent Events stream of the user's unread notification and message counts.
+
+    EventSource cannot send an Authorization header, so the access token is
+    passed as ?token= and checked once when the stream opens, with the same
+    checks as jwt_required: access tokens only, not revoked.
+    """
+    token = request.args.get('token', '')
+    try:
+        claims = decode_token(token)
+        if claims.get('type') != 'access':
+            raise ValueError('Only access tokens can open a stream')
+        header = get_unverified_jwt_headers(token)
+        verify_token_not_blocklisted(header, claims)
+        custom_verification_for_token(header, claims)
+        user_id = int(claims['sub'])
+    except Exception:
+        return jsonify({'error': 'Invalid or expired token'}), 401
+
+    subscription = stream_registry.subscribe(user_id)
+    if subscription is None:
+        response = jsonify({'error': 'Too many open streams, falling back to polling'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    events = counter_events(
+        subscription,
+        expires_at=claims.get('exp', float('inf')),
+        heartbeat=current_app.config['SSE_HEARTBEAT_SECONDS'],
+        resync=current_app.config['SSE_RESYNC_SECONDS']
+    )
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
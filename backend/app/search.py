@@ -0,0 +1,283 @@
+"""
+Marketplace Search - Relevance-ranked full-text search over items
+
+MySQL uses the FULLTEXT index from migration 0004. Other databases (SQLite in
+development) use an in-process inverted index that is built on first use and
+kept current by item write hooks.
+
+Both backends search title, description, category and tags, match every
+query term, and treat each term as a prefix ("vint" finds "vintage").
+
+Each worker process has its own in-process index; item writes made by other
+workers arrive through the event bus (see app/events.py) and are reindexed
+from the database.
+"""
+import bisect
+import re
+import threading
+from sqlalchemy import case, event, false, text
+from sqlalchemy.orm import Session
+from . import db
+from .events import event_bus
+from .models.models import Item
+
+TOKEN_PATTERN = re.compile(r'[0-9a-z]+')
+
+# Relevance weight of a term found in each field
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'tags': 2.0,
+    'category': 2.0,
+    'description': 1.0
+}
+
+# Exact term matches rank above prefix-only matches
+EXACT_MATCH_BONUS = 0.5
+
+
+def tokenize(value):
+    """Lowercase alphanumeric tokens of a string"""
+    if not value:
+        return []
+    return TOKEN_PATTERN.findall(str(value).lower())
+
+
+def tags_to_text(tags):
+    """Flatten the tags JSON list into searchable text"""
+    if not tags:
+        return ''
+    if isinstance(tags, (list, tuple)):
+        return ' '.join(str(tag) for tag in tags if tag)
+    return str(tags)
+
+
+class InvertedIndex:
+    """Thread-safe in-memory inverted index of items"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}   # token -> {item_id: weight}
+        self._documents = {}  # item_id -> set of tokens
+        self._vocabulary = [] # sorted tokens, for prefix lookups
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, item_id, title=None, description=None, category=None, tags=None):
+        """Index (or re-index) one item"""
+        weights = {}
+        for field, value in (('title', title), ('description', description),
+                             ('category', category), ('tags', tags_to_text(tags))):
+            for token in tokenize(value):
+                weights[token] = weights.get(token, 0.0) + FIELD_WEIGHTS[field]
+
+        with self._lock:
+            self._remove_locked(item_id)
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._vocabulary, token)
+                postings[item_id] = weight
+            self._documents[item_id] = set(weights)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove_locked(item_id)
+
+    def _remove_locked(self, item_id):
+        for token in self._documents.pop(item_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(item_id, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocabulary, token)
+                if position < len(self._vocabulary) and self._vocabulary[position] == token:
+                    del self._vocabulary[position]
+
+    def _expand_prefix(self, term):
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + '\uffff')
+        return self._vocabulary[start:end]
+
+    def search(self, query):
+        """Return item ids matching every query term, best match first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token in self._expand_prefix(term):
+                    bonus = EXACT_MATCH_BONUS if token == term else 0.0
+                    for item_id, weight in self._postings[token].items():
+                        score = weight + bonus
+                        if score > term_scores.get(item_id, 0.0):
+                            term_scores[item_id] = score
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {item_id: scores[item_id] + score
+                              for item_id, score in term_scores.items() if item_id in scores}
+                if not scores:
+                    return []
+
+        return sorted(scores, key=lambda item_id: (-scores[item_id], -item_id))
+
+
+class InMemorySearchBackend:
+    """Search backed by an InvertedIndex, for databases without FULLTEXT"""
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self._built = False
+        self._build_lock = threading.Lock()
+
+    def ensure_built(self):
+        if self._built:
+            return
+        with self._build_lock:
+            if self._built:
+                return
+            self._load(self.index)
+            self._built = True
+
+    def _load(self, index):
+        rows = db.session.query(
+            Item.id, Item.title, Item.description, Item.category, Item.tags
+        ).all()
+        for row in rows:
+            index.add(row.id, row.title, row.description, row.category, row.tags)
+
+    def apply(self, query, term):
+        """Restrict `query` to matching items; returns (query, relevance ORDER BY clause)"""
+        self.ensure_built()
+        ranked_ids = self.index.search(term)
+        if not ranked_ids:
+            return query.filter(false()), Item.id.desc()
+
+        ranks = {item_id: position for position, item_id in enumerate(ranked_ids)}
+        query = query.filter(Item.id.in_(ranked_ids))
+        return query, case(ranks, value=Item.id, else_=len(ranks)).asc()
+
+    def index_item(self, item_id, title, description, category, tags):
+        if self._built:
+            self.index.add(item_id, title, description, category, tags)
+
+    def remove_item(self, item_id):
+        if self._built:
+            self.index.remove(item_id)
+
+    def reindex_items(self, item_ids):
+        """Reload the given items from the database; ones that no longer exist are removed"""
+        if not self._built:
+            return
+        rows = db.session.query(
+            Item.id, Item.title, Item.description, Item.category, Item.tags
+        ).filter(Item.id.in_(item_ids)).all()
+        for row in rows:
+            self.index.add(row.id, row.title, row.description, row.category, row.tags)
+        for item_id in set(item_ids) - {row.id for row in rows}:
+            self.index.remove(item_id)
+
+    def rebuild(self):
+        """Replace a built index with a fresh one from the database"""
+        if not self._built:
+            return
+        with self._build_lock:
+            index = InvertedIndex()
+            self._load(index)
+            self.index = index
+
+
+class FulltextSearchBackend:
+    """Search backed by the MySQL FULLTEXT index on items"""
+
+    MATCH_SQL = "MATCH (items.title, items.description, items.category, items.tags_text) AGAINST (:search_terms IN BOOLEAN MODE)"
+
+    def apply(self, query, term):
+        """Restrict `query` to matching items; returns (query, relevance ORDER BY clause)"""
+        terms = tokenize(term)
+        if not terms:
+            return query.filter(false()), Item.id.desc()
+
+        # Every term is required and matched as a prefix
+        boolean_query = ' '.join(f'+{t}*' for t in terms)
+        match = text(self.MATCH_SQL).bindparams(search_terms=boolean_query)
+        return query.filter(match), text(f"{self.MATCH_SQL} DESC").bindparams(search_terms=boolean_query)
+
+    def index_item(self, item_id, title, description, category, tags):
+        # InnoDB maintains the FULLTEXT index itself
+        pass
+
+    def remove_item(self, item_id):
+        pass
+
+
+_in_memory_backend = InMemorySearchBackend()
+_fulltext_backend = FulltextSearchBackend()
+
+
+def get_search_backend():
+    """FULLTEXT on MySQL, the in-process index everywhere else"""
+    if db.engine.dialect.name == 'mysql':
+        return _fulltext_backend
+    return _in_memory_backend
+
+
+def search_items(query, term):
+    """Filter an Item query by a search string; returns (query, relevance ORDER BY clause)"""
+    return get_search_backend().apply(query, term)
+
+
+# Write hooks: keep tags_text in sync and update the in-process index after commit
+
+@event.listens_for(Item, 'before_insert')
+@event.listens_for(Item, 'before_update')
+def _sync_tags_text(mapper, connection, target):
+    target.tags_text = tags_to_text(target.tags)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_item_changes(session, flush_context):
+    # Snapshot the searchable fields now; attributes are expired after commit
+    pending = session.info.setdefault('search_pending', {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Item):
+            pending[obj.id] = (obj.title, obj.description, obj.category, obj.tags)
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            pending[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_item_changes(session):
+    pending = session.info.pop('search_pending', None)
+    if not pending:
+        return
+    for item_id, fields in pending.items():
+        if fields is None:
+            _in_memory_backend.remove_item(item_id)
+        else:
+            _in_memory_backend.index_item(item_id, *fields)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_item_changes(session):
+    session.info.pop('search_pending', None)
+
+
+def _apply_remote_item_writes(events):
+    item_events = [e for e in events if e['model'] == 'item']
+    if any(e['action'] == 'bulk' for e in item_events):
+        _in_memory_backend.rebuild()
+    elif item_events:
+        _in_memory_backend.reindex_items({e['id'] for e in item_events})
+
+
+event_bus.subscribe(_apply_remote_item_writes, _in_memory_backend.rebuild)
@@ -5,6 +5,14 @@ from datetime import datetime
 import os
 import base64
 from werkzeug.utils import secure_filename
+from ..search import search_items
+from .services import SellerService
+from ..pagination import InvalidCursor
+from ..order_queries import (
+    order_list_query, apply_order_filters, parse_status_filter, parse_date_range,
+    paginate_orders, order_row_to_dict
+)
+from ..conditional import item_validators, listing_validators, is_not_modified, not_modified_response, with_validators
 
 seller_bp = Blueprint('seller', __name__)
 
@@ -77,7 +85,11 @@ def get_seller_items():
         if category:
             query = query.filter_by(category=category)
         if search:
-            query = query.filter(Item.title.contains(search))
+            query, _ = search_items(query, search)
+        
+        etag, last_modified = listing_validators(query)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
         
         # Order by most recent first
         query = query.order_by(Item.created_at.desc())
@@ -88,30 +100,17 @@ def get_seller_items():
         )
         
         # Add rating information and sold count to each item
-        items_with_ratings = []
-        for item in items.items:
-            item_data = item.to_dict()
-            
-            # Get rating statistics for this item
-            ratings = Rating.query.filter_by(item_id=item.id).all()
-            if ratings:
-                avg_rating = sum(r.rating for r in ratings) / len(ratings)
-                item_data['average_rating'] = round(avg_rating, 1)
-                item_data['rating_count'] = len(ratings)
+        items_with_ratings = Item.bulk_to_dict(items.items)
+        for item_data in items_with_ratings:
+            # Rating statistics and sold count come from the bulk aggregates
+            if item_data['ratingCount']:
+                item_data['average_rating'] = round(item_data['rating'], 1)
             else:
                 item_data['average_rating'] = None
-                item_data['rating_count'] = 0
-            
-            # Get sold count for this item (sum of quantities from delivered orders)
-            sold_count = db.session.query(db.func.sum(Order.quantity)).filter_by(
-                item_id=item.id, 
-                status='delivered'
-            ).scalar() or 0
-            item_data['sold_count'] = sold_count
-            
-            items_with_ratings.append(item_data)
+            item_data['rating_count'] = item_data['ratingCount']
+            item_data['sold_count'] = item_data['soldCount']
         
-        return jsonify({
+        response = jsonify({
             'items': items_with_ratings,
             'pagination': {
                 'page': items.page,
@@ -119,7 +118,8 @@ def get_seller_items():
                 'per_page': items.per_page,
                 'total': items.total
             }
-        }), 200
+        })
+        return with_validators(response, etag, last_modified), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -265,11 +265,20 @@ def get_seller_item(item_id):
         if not user or user.role not in ['seller', 'admin']:
             return jsonify({'error': 'Access denied. Seller role required.'}), 403
         
-        item = Item.query.filter_by(id=item_id, seller_id=current_user_id).first()
+        item_query = Item.query.filter_by(id=item_id, seller_id=current_user_id)
+        validators = item_validators(item_query)
+        if not validators:
+            return jsonify({'error': 'Item not found'}), 404
+        
+        etag, last_modified = validators
+        if is_not_modified(etag, last_modified, use_if_modified_since=True):
+            return not_modified_response(etag, last_modified)
+        
+        item = item_query.first()
         if not item:
             return jsonify({'error': 'Item not found'}), 404
         
-        return jsonify({'item': item.to_dict()}), 200
+        return with_validators(jsonify({'item': item.to_dict()}), etag, last_modified), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -545,7 +554,12 @@ def update_seller_profile():
 @seller_bp.route('/seller/orders', methods=['GET'])
 @jwt_required()
 def get_seller_orders():
-    """Get orders for the seller"""
+    """Get the seller's order queue.
+    
+    Filters: status (comma-separated or repeated), from/to (ISO dates on created_at).
+    Passing ?cursor= (empty for the first page) switches from page numbers to
+    keyset pagination on (created_at, id).
+    """
     try:
         current_user_id = int(get_jwt_identity())
         
@@ -556,64 +570,39 @@ def get_seller_orders():
 
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 20, type=int), 50)
-        status_filter = request.args.get('status', '')
+        cursor_mode = 'cursor' in request.args
+        cursor = request.args.get('cursor', '')
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
         
-        # Build query using your database schema
         try:
-            query = Order.query.filter_by(seller_id=current_user_id)
-            
-            if status_filter:
-                query = query.filter_by(status=status_filter)
-            
-            query = query.order_by(Order.created_at.desc())  # Use created_at to match schema
-            
-            total = query.count()
-            orders = query.offset((page - 1) * per_page).limit(per_page).all()
-            
-            print(f"Found {total} orders for seller {current_user_id}")
-            
-        except Exception as query_error:
-            print(f"Error querying orders: {query_error}")
-            # If query fails, return empty result
-            return jsonify({
-                'orders': [],
-                'pagination': {
-                    'page': 1,
-                    'pages': 0,
-                    'per_page': 20,
-                    'total': 0,
-                    'has_next': False,
-                    'has_prev': False
-                }
-            }), 200
+            statuses = parse_status_filter(request.args)
+            start, end = parse_date_range(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Format response with item and buyer details
-        orders_data = []
-        for order in orders:
-            order_data = order.to_dict()
-            
-            # Get item details
-            item = Item.query.get(order.item_id)
-            if item:
-                order_data['item'] = item.to_dict()
-                # The item.to_dict() method already handles image loading safely
-                # including primary image, so we don't need to query ItemImage separately
-            
-            # Get buyer details (limited info for privacy)
-            buyer = User.query.get(order.buyer_id)
-            if buyer:
-                order_data['buyer'] = {
-                    'id': buyer.id,
-                    'username': buyer.username,
-                    'first_name': buyer.first_name,
-                    'last_name': buyer.last_name
-                }
-            
-            orders_data.append(order_data)
+        # Orders, items, primary image and buyers in one query
+        query = order_list_query(Order.buyer_id).filter(Order.seller_id == current_user_id)
+        query = apply_order_filters(query, statuses, start, end)
         
-        return jsonify({
-            'orders': orders_data,
-            'pagination': {
+        if cursor_mode:
+            try:
+                rows, next_cursor = paginate_orders(query, cursor, per_page, tag='seller_orders')
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            
+            pagination = {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
+            if include_total:
+                pagination['total'] = query.order_by(None).count()
+        else:
+            total = query.order_by(None).count()
+            rows = query.order_by(Order.created_at.desc(), Order.id.desc()).offset(
+                (page - 1) * per_page
+            ).limit(per_page).all()
+            pagination = {
                 'page': page,
                 'pages': (total + per_page - 1) // per_page,
                 'per_page': per_page,
@@ -621,6 +610,10 @@ def get_seller_orders():
                 'has_next': page * per_page < total,
                 'has_prev': page > 1
             }
+        
+        return jsonify({
+            'orders': [order_row_to_dict(row, 'buyer') for row in rows],
+            'pagination': pagination
         })
         
     except Exception as e:
@@ -652,6 +645,7 @@ def update_order_status(order_id):
             return jsonify({'error': 'Order not found'}), 404
         
         # Update order status and timestamps
+        previous_status = order.status
         order.status = new_status
         order.seller_notes = seller_notes
         order.updated_at = datetime.utcnow()
@@ -673,11 +667,16 @@ def update_order_status(order_id):
                 item.status = 'sold' if new_status == 'shipped' else 'pending'
             elif new_status in ['declined', 'cancelled']:
                 # Restore stock when order is declined or cancelled
-                item.stock += order.quantity
-                item.status = 'active'
+                Item.release_stock(item.id, order.quantity)
             elif new_status == 'delivered':
                 item.status = 'sold'
         
+        # Keep the item's sales counters in step with delivered orders
+        if new_status == 'delivered' and previous_status != 'delivered':
+            Item.record_delivery(order.item_id, order.quantity)
+        elif previous_status == 'delivered' and new_status != 'delivered':
+            Item.record_delivery(order.item_id, order.quantity, delta=-1)
+        
         db.session.commit()
         
         return jsonify({
@@ -689,6 +688,36 @@ def update_order_status(order_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@seller_bp.route('/seller/orders/bulk-status', methods=['PUT'])
+@jwt_required()
+def bulk_update_order_status():
+    """Move many orders to one status (confirm/decline/cancel/ship/deliver) in a single transaction"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        
+        # Verify user is a seller
+        user = User.query.get(current_user_id)
+        if not SellerService.verify_seller_access(user):
+            return jsonify({'error': 'Access denied. Seller role required.'}), 403
+        
+        data = request.get_json() or {}
+        result = SellerService.bulk_update_order_status(
+            current_user_id,
+            data.get('order_ids'),
+            data.get('status'),
+            seller_notes=data.get('seller_notes'),
+            decline_reason=data.get('decline_reason')
+        )
+        if not result['success']:
+            return jsonify({'error': result['errors'][0]}), 400
+        
+        result.pop('success')
+        return jsonify(result), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @seller_bp.route('/seller/orders/<int:order_id>/confirm', methods=['PUT'])
 @jwt_required()
 def confirm_order(order_id):
@@ -762,8 +791,8 @@ def cancel_order(order_id):
         # Restore stock when order is cancelled
         item = Item.query.get(order.item_id)
         if item:
-            item.stock += order.quantity
-            item.status = 'active'  # Make item available again
+            # Atomic increment, so it cannot overwrite a concurrent reservation
+            Item.release_stock(item.id, order.quantity)
         
         db.session.commit()
         
@@ -1,9 +1,32 @@
 """
 Seller Services - Business logic for seller operations
 """
-from ..models.models import db, Item, User
+from ..models.models import db, Item, User, Order
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, update
+from ..search import search_items
+from ..cache import mark_items_touched
+from ..outbox import record_status_changes
+
+# Bulk order transitions: target status -> statuses an order may move from
+ORDER_STATUS_TRANSITIONS = {
+    'confirmed': {'pending'},
+    'declined': {'pending'},
+    'cancelled': {'pending', 'confirmed'},
+    'shipped': {'confirmed'},
+    'delivered': {'confirmed', 'shipped'}
+}
+
+# Timestamp column stamped by each transition
+ORDER_STATUS_TIMESTAMPS = {
+    'confirmed': 'confirmed_at',
+    'declined': 'declined_at',
+    'cancelled': 'cancelled_at',
+    'shipped': 'shipped_at',
+    'delivered': 'delivered_at'
+}
+
+MAX_BULK_ORDERS = 500
 
 class SellerService:
     
@@ -216,14 +239,9 @@ class SellerService:
             if filters.get('category'):
                 query = query.filter_by(category=filters['category'])
             
+            relevance_order = None
             if filters.get('search'):
-                search_term = f"%{filters['search']}%"
-                query = query.filter(
-                    db.or_(
-                        Item.title.ilike(search_term),
-                        Item.description.ilike(search_term)
-                    )
-                )
+                query, relevance_order = search_items(query, filters['search'])
             
             if filters.get('min_price'):
                 query = query.filter(Item.price >= float(filters['min_price']))
@@ -235,10 +253,12 @@ class SellerService:
                 query = query.filter_by(condition=filters['condition'])
             
             # Apply sorting
-            sort_by = filters.get('sort_by', 'created_at')
+            sort_by = filters.get('sort_by', 'relevance' if relevance_order is not None else 'created_at')
             sort_order = filters.get('sort_order', 'desc')
             
-            if hasattr(Item, sort_by):
+            if sort_by == 'relevance' and relevance_order is not None:
+                query = query.order_by(relevance_order, Item.id.desc())
+            elif hasattr(Item, sort_by):
                 if sort_order == 'desc':
                     query = query.order_by(getattr(Item, sort_by).desc())
                 else:
@@ -256,7 +276,7 @@ class SellerService:
             
             return {
                 'success': True,
-                'items': [item.to_dict() for item in items.items],
+                'items': Item.bulk_to_dict(items.items),
                 'pagination': {
                     'page': items.page,
                     'pages': items.pages,
@@ -270,6 +290,115 @@ class SellerService:
         except Exception as e:
             return {'success': False, 'errors': [str(e)]}
     
+    @staticmethod
+    def bulk_update_order_status(seller_id, order_ids, new_status, seller_notes=None, decline_reason=None):
+        """Move many of a seller's orders to `new_status` in one transaction.
+        
+        One locking SELECT validates every order, one UPDATE moves the valid
+        ones, and item statuses, stock restoration or delivery counters are
+        applied with one grouped UPDATE each over the affected items, as the
+        single-order path applies them. Orders that are missing or
+        cannot make the transition are reported and left untouched.
+        """
+        try:
+            if new_status not in ORDER_STATUS_TRANSITIONS:
+                return {'success': False, 'errors': [f'Invalid status: {new_status}']}
+            
+            requested_ids = []
+            for order_id in order_ids or []:
+                if isinstance(order_id, int) and order_id not in requested_ids:
+                    requested_ids.append(order_id)
+            if not requested_ids:
+                return {'success': False, 'errors': ['order_ids must be a non-empty list of integers']}
+            if len(requested_ids) > MAX_BULK_ORDERS:
+                return {'success': False, 'errors': [f'At most {MAX_BULK_ORDERS} orders can be updated at once']}
+            
+            # One query validates ownership and the current status of every order
+            orders = {
+                row.id: row for row in db.session.query(
+                    Order.id, Order.status, Order.item_id, Order.quantity, Order.buyer_id,
+                    Order.seller_id, Order.total_amount, Order.created_at
+                ).filter(
+                    Order.id.in_(requested_ids),
+                    Order.seller_id == seller_id
+                ).with_for_update().all()
+            }
+            
+            allowed_from = ORDER_STATUS_TRANSITIONS[new_status]
+            results = []
+            valid = []
+            for order_id in requested_ids:
+                order = orders.get(order_id)
+                if order is None:
+                    results.append({'order_id': order_id, 'success': False, 'error': 'Order not found'})
+                elif order.status not in allowed_from:
+                    results.append({
+                        'order_id': order_id,
+                        'success': False,
+                        'previous_status': order.status,
+                        'error': f'Cannot change a {order.status} order to {new_status}'
+                    })
+                else:
+                    valid.append(order)
+                    results.append({
+                        'order_id': order_id,
+                        'success': True,
+                        'previous_status': order.status,
+                        'status': new_status
+                    })
+            
+            if valid:
+                now = datetime.utcnow()
+                values = {'status': new_status, ORDER_STATUS_TIMESTAMPS[new_status]: now, 'updated_at': now}
+                if seller_notes is not None:
+                    values['seller_notes'] = seller_notes
+                if new_status == 'declined' and decline_reason is not None:
+                    values['decline_reason'] = decline_reason
+                
+                db.session.execute(
+                    update(Order)
+                    .where(Order.id.in_([order.id for order in valid]))
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                
+                # Group the item side effects so each is a single UPDATE; the
+                # item statuses follow update_order_status in seller/routes.py
+                item_ids = {order.item_id for order in valid}
+                if new_status == 'confirmed':
+                    Item.set_status_bulk(item_ids, 'pending')
+                elif new_status in ('shipped', 'delivered'):
+                    Item.set_status_bulk(item_ids, 'sold')
+                
+                if new_status in ('declined', 'cancelled'):
+                    restock = {}
+                    for order in valid:
+                        restock[order.item_id] = restock.get(order.item_id, 0) + (order.quantity or 0)
+                    Item.release_stock_bulk(restock)
+                elif new_status == 'delivered':
+                    deliveries = {}
+                    for order in valid:
+                        units, count = deliveries.get(order.item_id, (0, 0))
+                        deliveries[order.item_id] = (units + (order.quantity or 0), count + 1)
+                    Item.record_deliveries(deliveries)
+                
+                mark_items_touched(db.session, item_ids)
+                record_status_changes(db.session, valid, new_status)
+            
+            db.session.commit()
+            
+            return {
+                'success': True,
+                'status': new_status,
+                'updated': len(valid),
+                'failed': len(results) - len(valid),
+                'results': results
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            return {'success': False, 'errors': [str(e)]}
+    
     @staticmethod
     def verify_seller_access(user):
         """Verify if user has seller access"""
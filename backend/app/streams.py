@@ -0,0 +1,178 @@
+"""
+Badge Streams - Server-Sent Events for unread counters
+
+The layouts used to poll /api/notifications/count and
+/api/messages/unread-count every 30 seconds from every open tab. Instead,
+each tab opens one GET /api/stream/counters, authenticated once when it
+connects, and the server pushes the counters when they change:
+
+    retry: 5000
+
+    event: counters
+    data: {"unread_notifications": 3, "unread_messages": 1, ...}
+
+    : ping
+
+The first event carries every badge count (see app/badges.py); later
+events only carry the ones that changed. Writers that change a count record
+the user in the session, and after commit the registry wakes that user's
+streams.
+Nothing is written to idle streams except a comment every
+SSE_HEARTBEAT_SECONDS, which keeps proxies from closing them.
+
+An idle stream is a blocked wait on a threading.Event and holds no database
+connection; the session is released after every read. Changes committed by
+another worker process arrive as "counters" events on the event bus (see
+app/events.py); a resync every SSE_RESYNC_SECONDS covers any that are lost.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .badges import cached_badge_counts, invalidate_badge_counts, invalidate_local_badge_counts
+from .events import event_bus
+from .models.models import db
+
+
+class Subscription:
+    """One open stream; woken when its user's counters change"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._changed = threading.Event()
+
+    def notify(self):
+        self._changed.set()
+
+    def wait(self, timeout):
+        """True when woken by a change, False when `timeout` passed without one"""
+        changed = self._changed.wait(timeout)
+        if changed:
+            self._changed.clear()
+        return changed
+
+
+class StreamRegistry:
+    """user_id -> open subscriptions in this worker, with per-worker and per-user limits"""
+
+    def __init__(self, max_streams=500, max_streams_per_user=10):
+        self.max_streams = max_streams
+        self.max_streams_per_user = max_streams_per_user
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._count = 0
+
+    def subscribe(self, user_id):
+        """A new Subscription, or None when a limit is reached"""
+        with self._lock:
+            if self._count >= self.max_streams:
+                return None
+            if len(self._subscriptions.get(user_id, ())) >= self.max_streams_per_user:
+                return None
+            subscription = Subscription(user_id)
+            self._subscriptions[user_id].add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+            self._count -= 1
+
+    def publish(self, user_ids):
+        """Wake every stream of the given users"""
+        with self._lock:
+            targets = [s for user_id in user_ids for s in self._subscriptions.get(user_id, ())]
+        for subscription in targets:
+            subscription.notify()
+
+    def wake_all(self):
+        """Wake every stream, so each rereads its counters"""
+        with self._lock:
+            targets = [s for subscriptions in self._subscriptions.values() for s in subscriptions]
+        for subscription in targets:
+            subscription.notify()
+
+    def stats(self):
+        with self._lock:
+            return {'streams': self._count, 'users': len(self._subscriptions)}
+
+
+stream_registry = StreamRegistry()
+
+
+def init_streams(app):
+    stream_registry.max_streams = app.config['SSE_MAX_STREAMS']
+    stream_registry.max_streams_per_user = app.config['SSE_MAX_STREAMS_PER_USER']
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_counter_changes(session):
+    changed = session.info.pop('counters_changed', None)
+    if changed:
+        # Drop cached counts first, so woken streams read the new ones
+        invalidate_badge_counts(changed)
+        stream_registry.publish(changed)
+        event_bus.publish([{'model': 'counters', 'user_ids': sorted(changed)}])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_counter_changes(session):
+    session.info.pop('counters_changed', None)
+
+
+def _apply_remote_counter_changes(events):
+    changed = {user_id for e in events if e['model'] == 'counters' for user_id in e['user_ids']}
+    if changed:
+        invalidate_local_badge_counts(changed)
+        stream_registry.publish(changed)
+
+
+event_bus.subscribe(_apply_remote_counter_changes, stream_registry.wake_all)
+
+
+def _read_counters(user_id):
+    counts = cached_badge_counts(user_id)
+    # Give the connection back to the pool before going idle
+    db.session.remove()
+    return counts
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+def counter_events(subscription, expires_at, heartbeat, resync):
+    """Generate the SSE stream for one subscription until `expires_at` (epoch seconds)"""
+    try:
+        yield 'retry: 5000\n\n'
+        last = _read_counters(subscription.user_id)
+        yield _event('counters', last)
+
+        resync_at = time.monotonic() + resync
+        while True:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                # The client reconnects with a fresh token
+                yield _event('expired', {})
+                return
+
+            changed = subscription.wait(min(heartbeat, remaining))
+            if not changed and time.monotonic() < resync_at:
+                yield ': ping\n\n'
+                continue
+
+            resync_at = time.monotonic() + resync
+            current = _read_counters(subscription.user_id)
+            delta = {key: value for key, value in current.items() if last.get(key) != value}
+            last = current
+            yield _event('counters', delta) if delta else ': ping\n\n'
+    finally:
+        stream_registry.unsubscribe(subscription)
@@ -0,0 +1,183 @@
+"""
+Conversation Threads - One summary row per pair of users and item
+
+conversation_threads holds, for each conversation, its latest message and
+how many messages each participant has not read. The conversation list
+reads these rows (see app/conversations.py) instead of the messages table,
+so its cost does not grow with message volume.
+
+Threads change in the same transaction as the messages they summarize:
+
+    message inserted       upsert the thread: newer last message, +1 unread
+                           for the receiver
+    read flag changed      -1 (or +1) unread for the receiver
+    message deleted        -1 unread if it was unread
+
+An after_flush hook covers every ORM write, so send_message,
+start_conversation and start_item_conversation need no extra code. Writes
+made with bulk UPDATE statements (marking a conversation read, see
+app/conversations.py) call adjust_thread_unread or clear_thread_unread
+themselves.
+
+`python manage.py rebuild-conversation-threads` rebuilds the table from
+the messages, to repair drift; migration 0013 fills it the first time.
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import case, event, func, inspect, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+from .models.models import db, ConversationThread, Message
+
+
+def thread_key(sender_id, receiver_id, item_id):
+    """(user_low_id, user_high_id, item_key) of the conversation a message belongs to"""
+    low, high = sorted((int(sender_id), int(receiver_id)))
+    return low, high, item_id or 0
+
+
+def _receiver_side(key, receiver_id):
+    return 'low_unread' if int(receiver_id) == key[0] else 'high_unread'
+
+
+def upsert_threads(connection, rows):
+    """Insert or advance threads from rows of thread columns.
+
+    last_message_* only move forward, and the unread counts in the rows are
+    added to the stored ones.
+    """
+    if not rows:
+        return
+    table = ConversationThread.__table__
+    if connection.dialect.name == 'mysql':
+        statement = mysql.insert(table)
+        new = statement.inserted
+    else:
+        statement = sqlite.insert(table)
+        new = statement.excluded
+
+    is_newer = new.last_message_id > table.c.last_message_id
+    # MySQL applies the assignments in order, so last_message_at is set
+    # while last_message_id still holds the old value
+    assignments = [
+        ('last_message_at', case((is_newer, new.last_message_at), else_=table.c.last_message_at)),
+        ('last_message_id', case((is_newer, new.last_message_id), else_=table.c.last_message_id)),
+        ('low_unread', table.c.low_unread + new.low_unread),
+        ('high_unread', table.c.high_unread + new.high_unread),
+        ('updated_at', new.updated_at),
+    ]
+    if connection.dialect.name == 'mysql':
+        statement = statement.on_duplicate_key_update(assignments)
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_low_id', 'user_high_id', 'item_key'], set_=dict(assignments)
+        )
+    connection.execute(statement, rows)
+
+
+def adjust_thread_unread(session, deltas):
+    """Add {(user_low_id, user_high_id, item_key, 'low_unread'|'high_unread'): delta} to threads.
+
+    Counts never go below zero. Runs on the session's connection, so this
+    is safe inside flush hooks.
+    """
+    connection = session.connection()
+    table = ConversationThread.__table__
+    for (low, high, item_key, column), delta in deltas.items():
+        if not delta:
+            continue
+        connection.execute(
+            update(table)
+            .where(table.c.user_low_id == low, table.c.user_high_id == high, table.c.item_key == item_key)
+            .values({column: case((table.c[column] + delta > 0, table.c[column] + delta), else_=0)})
+        )
+
+
+def clear_thread_unread(session, reader_id, partner_id, item_id=None):
+    """Zero the reader's unread count in their threads with the partner (about one item, if given)"""
+    table = ConversationThread.__table__
+    low, high, item_key = thread_key(reader_id, partner_id, item_id)
+    column = _receiver_side((low, high, item_key), reader_id)
+    statement = update(table).where(table.c.user_low_id == low, table.c.user_high_id == high)
+    if item_id:
+        statement = statement.where(table.c.item_key == item_key)
+    session.connection().execute(statement.values({column: 0}))
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_thread_writes(session, flush_context):
+    threads = {}
+    for obj in session.new:
+        if not isinstance(obj, Message):
+            continue
+        key = thread_key(obj.sender_id, obj.receiver_id, obj.item_id)
+        thread = threads.get(key)
+        if thread is None:
+            thread = threads[key] = {
+                'user_low_id': key[0], 'user_high_id': key[1], 'item_key': key[2],
+                'last_message_id': obj.id, 'last_message_at': obj.created_at,
+                'low_unread': 0, 'high_unread': 0, 'updated_at': datetime.utcnow()
+            }
+        elif obj.id > thread['last_message_id']:
+            thread['last_message_id'], thread['last_message_at'] = obj.id, obj.created_at
+        if not obj.is_receiver_read:
+            thread[_receiver_side(key, obj.receiver_id)] += 1
+
+    unread = defaultdict(int)
+    for obj in session.dirty:
+        if isinstance(obj, Message):
+            history = inspect(obj).attrs.is_receiver_read.history
+            if history.added and history.deleted and bool(history.added[0]) != bool(history.deleted[0]):
+                key = thread_key(obj.sender_id, obj.receiver_id, obj.item_id)
+                unread[key + (_receiver_side(key, obj.receiver_id),)] += -1 if history.added[0] else 1
+    for obj in session.deleted:
+        if isinstance(obj, Message) and not obj.is_receiver_read:
+            key = thread_key(obj.sender_id, obj.receiver_id, obj.item_id)
+            unread[key + (_receiver_side(key, obj.receiver_id),)] -= 1
+
+    if threads:
+        upsert_threads(session.connection(), list(threads.values()))
+    if unread:
+        adjust_thread_unread(session, unread)
+
+
+def rebuild_conversation_threads(chunk_size=5000):
+    """Recompute every thread from the messages table, in chunks of message ids.
+
+    Messages sent while a rebuild runs may be counted twice; run it while
+    messaging is quiet. Returns the number of threads.
+    """
+    low = case((Message.sender_id < Message.receiver_id, Message.sender_id), else_=Message.receiver_id)
+    high = case((Message.sender_id < Message.receiver_id, Message.receiver_id), else_=Message.sender_id)
+    item_key = func.coalesce(Message.item_id, 0)
+    unread = Message.is_receiver_read.isnot(True)
+
+    db.session.query(ConversationThread).delete(synchronize_session=False)
+    last_id = 0
+    while True:
+        upper = db.session.query(Message.id).filter(Message.id > last_id).order_by(Message.id).offset(
+            chunk_size - 1
+        ).limit(1).scalar()
+        bounds = [Message.id > last_id] + ([Message.id <= upper] if upper is not None else [])
+
+        grouped = select(
+            low.label('user_low_id'), high.label('user_high_id'), item_key.label('item_key'),
+            func.max(Message.id).label('last_message_id'),
+            func.sum(case((unread & (Message.receiver_id == low), 1), else_=0)).label('low_unread'),
+            func.sum(case((unread & (Message.receiver_id == high) & (low != high), 1), else_=0)).label('high_unread')
+        ).where(*bounds).group_by(low, high, item_key).subquery()
+        rows = db.session.execute(
+            select(grouped, Message.created_at.label('last_message_at'))
+            .join(Message, Message.id == grouped.c.last_message_id)
+        ).all()
+
+        now = datetime.utcnow()
+        upsert_threads(db.session.connection(), [
+            dict(row._mapping, last_message_at=row.last_message_at or now, updated_at=now) for row in rows
+        ])
+        db.session.commit()
+        if upper is None:
+            break
+        last_id = upper
+
+    return db.session.query(func.count(ConversationThread.id)).scalar()
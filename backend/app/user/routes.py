@@ -2,7 +2,20 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.models import User, Item, Wishlist, Order, ItemImage, Rating
-from sqlalchemy import or_, and_, text
+from app.pagination import paginate_keyset, InvalidCursor
+from app.search import search_items
+from app.facets import get_marketplace_facets
+from app.conditional import listing_validators, is_not_modified, not_modified_response, with_validators
+from app.order_queries import (
+    order_list_query, parse_status_filter, parse_date_range, apply_order_filters,
+    paginate_orders, order_row_to_dict
+)
+from app.checkout import parse_cart, place_cart_orders, CheckoutError
+from app.idempotency import (
+    get_idempotency_key, request_fingerprint, find_stored_response, store_response, IdempotencyKeyError
+)
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
 import uuid
 import os
 from datetime import datetime, timedelta
@@ -10,30 +23,13 @@ from werkzeug.utils import secure_filename
 
 user_bp = Blueprint('user', __name__)
 
-def ensure_item_images_table():
-    """Ensure item_images table exists"""
-    try:
-        # Try to create the table if it doesn't exist
-        create_table_sql = text("""
-        CREATE TABLE IF NOT EXISTS `item_images` (
-          `id` int NOT NULL AUTO_INCREMENT,
-          `item_id` int NOT NULL,
-          `image_path` varchar(500) COLLATE utf8mb4_unicode_ci NOT NULL,
-          `is_primary` tinyint(1) DEFAULT '0',
-          `display_order` int DEFAULT '0',
-          `original_filename` varchar(255) COLLATE utf8mb4_unicode_ci DEFAULT NULL,
-          `file_size` int DEFAULT NULL,
-          `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
-          PRIMARY KEY (`id`),
-          KEY `idx_item_id` (`item_id`),
-          KEY `idx_primary` (`item_id`,`is_primary`),
-          CONSTRAINT `item_images_ibfk_1` FOREIGN KEY (`item_id`) REFERENCES `items` (`id`) ON DELETE CASCADE
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-        """)
-        db.engine.execute(create_table_sql)
-        print("✓ item_images table ensured")
-    except Exception as e:
-        print(f"Warning: Could not ensure item_images table: {e}")
+# Marketplace sort options: sort_by -> (column, descending). Ties break on items.id
+MARKETPLACE_SORTS = {
+    'newest': (Item.created_at, True),
+    'oldest': (Item.created_at, False),
+    'price_low': (Item.price, False),
+    'price_high': (Item.price, True)
+}
 
 @user_bp.route('/test-jwt', methods=['GET'])
 @jwt_required()
@@ -112,24 +108,28 @@ def get_marketplace_items():
         min_price = request.args.get('min_price', type=float)
         max_price = request.args.get('max_price', type=float)
         condition_filter = request.args.get('condition')
-        sort_by = request.args.get('sort_by', 'newest')  # newest, oldest, price_low, price_high
+        decade = request.args.get('decade', type=int)
+        
+        # Passing ?cursor= (empty for the first page) switches to keyset pagination
+        cursor_mode = 'cursor' in request.args
+        cursor = request.args.get('cursor', '')
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        
+        # newest, oldest, price_low, price_high, or relevance (default when searching)
+        default_sort = 'relevance' if search and not cursor_mode else 'newest'
+        sort_by = request.args.get('sort_by', default_sort)
+        if sort_by == 'relevance' and not search:
+            sort_by = 'newest'
+        if sort_by != 'relevance' and sort_by not in MARKETPLACE_SORTS:
+            sort_by = 'newest'
         
         # Build query for active items only
         query = Item.query.filter_by(status='active')
         
-        # Apply filters
-        if category:
-            query = query.filter(Item.category == category)
-        
+        relevance_order = None
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Item.title.ilike(search_term),
-                    Item.description.ilike(search_term),
-                    Item.category.ilike(search_term)
-                )
-            )
+            # Full-text search over title, description, category and tags
+            query, relevance_order = search_items(query, search)
         
         if min_price is not None:
             query = query.filter(Item.price >= min_price)
@@ -137,86 +137,110 @@ def get_marketplace_items():
         if max_price is not None:
             query = query.filter(Item.price <= max_price)
         
+        # The validators cover the facet base set, which contains the page and every facet count
+        etag, last_modified = listing_validators(query)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        
+        # Apply filters
+        if category:
+            query = query.filter(Item.category == category)
+        
         if condition_filter:
             query = query.filter(Item.condition_status == condition_filter)
         
-        # Apply sorting
-        if sort_by == 'newest':
-            query = query.order_by(Item.created_at.desc())
-        elif sort_by == 'oldest':
-            query = query.order_by(Item.created_at.asc())
-        elif sort_by == 'price_low':
-            query = query.order_by(Item.price.asc())
-        elif sort_by == 'price_high':
-            query = query.order_by(Item.price.desc())
-        else:
-            query = query.order_by(Item.created_at.desc())
-        
-        # Paginate results
-        items = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        if decade is not None:
+            query = query.filter(Item.year >= decade, Item.year < decade + 10)
         
-        # Get categories for filter dropdown
-        categories = db.session.query(Item.category).filter(
-            and_(Item.status == 'active', Item.category.isnot(None))
-        ).distinct().all()
-        categories = [cat[0] for cat in categories if cat[0]]
+        if sort_by == 'relevance':
+            if cursor_mode:
+                return jsonify({'error': 'Cursor pagination is not available for relevance sort'}), 400
+            sort_column, descending = None, False
+        else:
+            sort_column, descending = MARKETPLACE_SORTS[sort_by]
         
-        # Format items with seller information and rating data
-        items_data = []
-        for item in items.items:
-            item_data = item.to_dict()
-            
-            # Get seller information
-            seller = User.query.get(item.seller_id)
-            if seller:
-                item_data['seller'] = {
-                    'id': seller.id,
-                    'username': seller.username,
-                    'first_name': seller.first_name,
-                    'last_name': seller.last_name
-                }
-                item_data['seller_name'] = seller.username
+        if cursor_mode:
+            # Seek past the last row of the previous page; no COUNT(*) unless asked
+            try:
+                page_items, next_cursor = paginate_keyset(
+                    query, sort_column, Item.id, descending, cursor, per_page, tag=sort_by
+                )
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
             
-            # Get rating statistics for this item
-            ratings = Rating.query.filter_by(item_id=item.id).all()
-            if ratings:
-                avg_rating = sum(r.rating for r in ratings) / len(ratings)
-                item_data['rating'] = round(avg_rating, 1)
-                item_data['ratingCount'] = len(ratings)
+            pagination = {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
+            if include_total:
+                pagination['total'] = query.count()
+        else:
+            # Apply sorting
+            if sort_by == 'relevance':
+                query = query.order_by(relevance_order, Item.id.desc())
+            elif descending:
+                query = query.order_by(sort_column.desc(), Item.id.desc())
             else:
-                item_data['rating'] = 0
-                item_data['ratingCount'] = 0
-            
-            # Get sold count for this item (sum of quantities from delivered orders)
-            sold_count = db.session.query(db.func.sum(Order.quantity)).filter_by(
-                item_id=item.id, 
-                status='delivered'
-            ).scalar() or 0
-            item_data['soldCount'] = sold_count
+                query = query.order_by(sort_column.asc(), Item.id.asc())
             
-            items_data.append(item_data)
-        
-        return jsonify({
-            'items': items_data,
-            'pagination': {
+            # Paginate results
+            items = query.paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            page_items = items.items
+            pagination = {
                 'page': items.page,
                 'pages': items.pages,
                 'per_page': items.per_page,
                 'total': items.total,
                 'has_next': items.has_next,
                 'has_prev': items.has_prev
-            },
+            }
+        
+        # Facet counts for the filter sidebar, served from the cached aggregate
+        facets = get_marketplace_facets(
+            search=search, category=category, condition=condition_filter, decade=decade,
+            min_price=min_price, max_price=max_price
+        )
+        categories = [facet['value'] for facet in facets['categories'] if facet['value']]
+        
+        # Format items with seller information and rating data
+        items_data = Item.bulk_to_dict(page_items, include_seller=True)
+        for item_data in items_data:
+            item_data['rating'] = round(item_data['rating'], 1) if item_data['ratingCount'] else 0
+        
+        response = jsonify({
+            'items': items_data,
+            'pagination': pagination,
             'filters': {
                 'categories': categories,
                 'conditions': ['new', 'like_new', 'good', 'fair', 'poor']
-            }
-        }), 200
+            },
+            'facets': facets
+        })
+        return with_validators(response, etag, last_modified), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@user_bp.route('/marketplace/facets', methods=['GET'])
+@jwt_required()
+def get_marketplace_facet_counts():
+    """Get filter counts for the marketplace sidebar without loading items"""
+    try:
+        facets = get_marketplace_facets(
+            search=request.args.get('search'),
+            category=request.args.get('category'),
+            condition=request.args.get('condition'),
+            decade=request.args.get('decade', type=int),
+            min_price=request.args.get('min_price', type=float),
+            max_price=request.args.get('max_price', type=float)
+        )
+        return jsonify({'facets': facets}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @user_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def user_dashboard():
@@ -303,8 +327,6 @@ def update_item(item_id):
 def get_wishlist():
     """Get user's wishlist items"""
     try:
-        ensure_item_images_table()  # Ensure table exists
-        
         user_id = get_jwt_identity()
         if isinstance(user_id, str):
             user_id = int(user_id)
@@ -460,68 +482,52 @@ def remove_from_wishlist(item_id):
 @user_bp.route('/orders', methods=['GET'])
 @jwt_required()
 def get_orders():
-    """Get user's orders"""
+    """Get user's orders.
+    
+    Filters: status (comma-separated or repeated), from/to (ISO dates on created_at).
+    Passing ?cursor= (empty for the first page) switches from page numbers to
+    keyset pagination on (created_at, id).
+    """
     try:
-        ensure_item_images_table()  # Ensure table exists
-        
         user_id = get_jwt_identity()
         if isinstance(user_id, str):
             user_id = int(user_id)
         
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 20, type=int), 50)
-        status_filter = request.args.get('status', '')
+        cursor_mode = 'cursor' in request.args
+        cursor = request.args.get('cursor', '')
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
         
-        # Build query
-        query = Order.query.filter_by(buyer_id=user_id)
-        
-        if status_filter:
-            query = query.filter_by(status=status_filter)
-        
-        query = query.order_by(Order.created_at.desc())
+        try:
+            statuses = parse_status_filter(request.args)
+            start, end = parse_date_range(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        total = query.count()
-        orders = query.offset((page - 1) * per_page).limit(per_page).all()
+        # Orders, items, primary image and sellers in one query
+        query = order_list_query(Order.seller_id).filter(Order.buyer_id == user_id)
+        query = apply_order_filters(query, statuses, start, end)
         
-        # Format response with item details
-        orders_data = []
-        for order in orders:
-            order_data = order.to_dict()
-            
-            # Get item details
-            item = Item.query.get(order.item_id)
-            if item:
-                order_data['item'] = item.to_dict()
-                
-                # Get primary image safely
-                try:
-                    primary_image = ItemImage.query.filter_by(
-                        item_id=item.id, 
-                        is_primary=True
-                    ).first()
-                    
-                    if primary_image:
-                        order_data['item']['primary_image'] = primary_image.to_dict()
-                except Exception as img_error:
-                    print(f"Warning: Could not load primary image for item {item.id}: {img_error}")
-                    # Continue without images
-                
-                # Get seller information
-                seller = User.query.get(order.seller_id)
-                if seller:
-                    order_data['item']['seller'] = {
-                        'id': seller.id,
-                        'username': seller.username,
-                        'first_name': seller.first_name,
-                        'last_name': seller.last_name
-                    }
-                    order_data['item']['seller_name'] = seller.username
+        if cursor_mode:
+            try:
+                rows, next_cursor = paginate_orders(query, cursor, per_page, tag='buyer_orders')
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
             
-            orders_data.append(order_data)
-        
-        return jsonify({
-            'orders': orders_data,
-            'pagination': {
+            pagination = {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
+            if include_total:
+                pagination['total'] = query.order_by(None).count()
+        else:
+            total = query.order_by(None).count()
+            rows = query.order_by(Order.created_at.desc(), Order.id.desc()).offset(
+                (page - 1) * per_page
+            ).limit(per_page).all()
+            pagination = {
                 'page': page,
                 'pages': (total + per_page - 1) // per_page,
                 'per_page': per_page,
@@ -529,6 +535,20 @@ def get_orders():
                 'has_next': page * per_page < total,
                 'has_prev': page > 1
             }
+        
+        orders_data = []
+        for row in rows:
+            order_data = order_row_to_dict(row, 'seller')
+            # The order history reads the seller from the item
+            if 'item' in order_data and 'seller' in order_data:
+                order_data['item']['seller_id'] = order_data['seller_id']
+                order_data['item']['seller'] = order_data['seller']
+                order_data['item']['seller_name'] = order_data['seller']['username']
+            orders_data.append(order_data)
+        
+        return jsonify({
+            'orders': orders_data,
+            'pagination': pagination
         })
         
     except Exception as e:
@@ -550,6 +570,18 @@ def create_order():
         if not item_id:
             return jsonify({'error': 'item_id is required'}), 400
         
+        # Retries with the same Idempotency-Key replay the stored response (prevents double-clicking),
+        # before any check on the item, which the first request may have sold out
+        try:
+            idempotency_key = get_idempotency_key()
+            if idempotency_key:
+                fingerprint = request_fingerprint()
+                stored_response = find_stored_response(user_id, idempotency_key, fingerprint)
+                if stored_response is not None:
+                    return stored_response
+        except IdempotencyKeyError as e:
+            return jsonify({'error': str(e)}), e.status_code
+        
         # Check if item exists and is available
         item = Item.query.filter_by(id=item_id, status='active').first()
         if not item:
@@ -564,20 +596,6 @@ def create_order():
         if quantity <= 0:
             return jsonify({'error': 'Quantity must be greater than 0'}), 400
         
-        # Check for recent duplicate orders (prevent double-clicking)
-        recent_order = Order.query.filter_by(
-            buyer_id=user_id,
-            item_id=item_id
-        ).filter(
-            Order.created_at > datetime.now() - timedelta(minutes=1)
-        ).first()
-        
-        if recent_order:
-            return jsonify({
-                'message': 'Order already created',
-                'order': recent_order.to_dict()
-            }), 200
-        
         # Generate unique order number
         order_number = f"ORD{datetime.now().strftime('%Y%m%d')}{str(uuid.uuid4())[:8].upper()}"
         
@@ -605,20 +623,32 @@ def create_order():
                 customer_notes=data.get('customer_notes', '')
             )
             
-            # Reserve stock (deduct from available stock)
-            item.stock -= quantity
-            
-            # If stock reaches 0, set item status to out_of_stock
-            if item.stock <= 0:
-                item.status = 'out_of_stock'
+            # Reserve stock with one conditional UPDATE; no rows means someone else got there first
+            if not Item.reserve_stock(item.id, quantity):
+                db.session.rollback()
+                return jsonify({'error': 'Insufficient stock available'}), 409
             
             db.session.add(order)
-            db.session.commit()
+            db.session.flush()
             
-            return jsonify({
+            response_body = {
                 'message': 'Order created successfully',
                 'order': order.to_dict()
-            }), 201
+            }
+            if idempotency_key:
+                # Stored in the same transaction as the order it describes
+                store_response(user_id, idempotency_key, fingerprint, 201, response_body)
+            db.session.commit()
+            
+            return jsonify(response_body), 201
+            
+        except IntegrityError:
+            db.session.rollback()
+            # A concurrent request with the same key won; replay its response
+            stored_response = find_stored_response(user_id, idempotency_key, fingerprint) if idempotency_key else None
+            if stored_response is not None:
+                return stored_response
+            return jsonify({'error': 'Failed to create order'}), 500
             
         except Exception as e:
             db.session.rollback()
@@ -630,6 +660,65 @@ def create_order():
         return jsonify({'error': str(e)}), 500
 
 
+@user_bp.route('/orders/checkout', methods=['POST'])
+@jwt_required()
+def checkout_cart():
+    """Order every item in a cart in one transaction.
+    
+    Body: {"items": [{"item_id": 1, "quantity": 2}, ...]} plus the same customer
+    and payment fields as a single order. Either every item is ordered or none is.
+    """
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
+        
+        try:
+            quantities = parse_cart(data)
+        except CheckoutError as e:
+            return jsonify({'error': str(e)}), e.status_code
+        
+        try:
+            idempotency_key = get_idempotency_key()
+            if idempotency_key:
+                fingerprint = request_fingerprint()
+                stored_response = find_stored_response(user_id, idempotency_key, fingerprint)
+                if stored_response is not None:
+                    return stored_response
+        except IdempotencyKeyError as e:
+            return jsonify({'error': str(e)}), e.status_code
+        
+        try:
+            groups = place_cart_orders(user_id, quantities, data)
+        except CheckoutError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e), 'item_ids': e.item_ids}), e.status_code
+        
+        try:
+            response_body = {
+                'message': 'Orders created successfully',
+                'order_count': sum(len(group['orders']) for group in groups),
+                'total_amount': round(sum(group['subtotal'] for group in groups), 2),
+                'groups': groups
+            }
+            if idempotency_key:
+                store_response(user_id, idempotency_key, fingerprint, 201, response_body)
+            db.session.commit()
+            
+            return jsonify(response_body), 201
+            
+        except IntegrityError:
+            db.session.rollback()
+            # A concurrent request with the same key won; replay its response
+            stored_response = find_stored_response(user_id, idempotency_key, fingerprint) if idempotency_key else None
+            if stored_response is not None:
+                return stored_response
+            return jsonify({'error': 'Failed to create orders'}), 500
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @user_bp.route('/orders/<int:order_id>', methods=['GET'])
 @jwt_required()
 def get_order_details(order_id):
@@ -689,6 +778,9 @@ def mark_order_received(order_id):
         order.status = 'delivered'
         order.delivered_at = datetime.utcnow()
         
+        # Keep the item's sales counters in the same transaction
+        Item.record_delivery(order.item_id, order.quantity)
+        
         db.session.commit()
         
         return jsonify({
@@ -776,6 +868,10 @@ def submit_rating():
         )
         
         db.session.add(new_rating)
+        
+        # Keep the item's rating counters in the same transaction
+        Item.record_rating(item.id, rating)
+        
         db.session.commit()
         
         return jsonify({
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Concurrent checkout benchmark
+
+Many buyers race to buy the last units of one item. Three stock reservation
+strategies are compared:
+
+    legacy   read stock in Python, decrement, commit (the old create_order)
+    locked   SELECT ... FOR UPDATE, decrement, commit
+    atomic   Item.reserve_stock: one conditional UPDATE plus a rowcount check
+
+For each one it reports orders/sec, the units sold, and the oversell (units
+sold beyond the starting stock). SQLite ignores FOR UPDATE and serializes
+writers, so only MySQL numbers are meaningful. Use a disposable database,
+because it creates and then deletes its own seller, buyer, item and orders:
+
+    python benchmark_checkout.py --threads 32 --stock 200 --attempts 20
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.models.models import Item, Order, User
+
+
+def place_order(strategy, item_id, buyer_id, quantity):
+    """Try to buy `quantity` units; returns True when an order was created"""
+    if strategy == 'atomic':
+        item = db.session.query(Item.id, Item.seller_id, Item.price).filter_by(id=item_id).one()
+        if not Item.reserve_stock(item_id, quantity):
+            db.session.rollback()
+            return False
+    else:
+        query = Item.query.filter_by(id=item_id)
+        if strategy == 'locked':
+            query = query.with_for_update()
+        item = query.one()
+        if item.status != 'active' or item.stock < quantity:
+            db.session.rollback()
+            return False
+        item.stock -= quantity
+        if item.stock <= 0:
+            item.status = 'sold'
+
+    db.session.add(Order(
+        order_number=f"BENCH{uuid.uuid4().hex[:12].upper()}",
+        buyer_id=buyer_id,
+        seller_id=item.seller_id,
+        item_id=item_id,
+        quantity=quantity,
+        price_per_item=item.price,
+        total_amount=item.price * quantity,
+        status='pending',
+        shipping_address='Benchmark',
+        customer_name='Benchmark'
+    ))
+    db.session.commit()
+    return True
+
+
+def run(app, strategy, threads, stock, attempts, quantity, seller_id, buyer_id):
+    with app.app_context():
+        item = Item(seller_id=seller_id, title=f'Benchmark item ({strategy})', description='benchmark',
+                    category='benchmark', price=10, stock=stock, status='active')
+        db.session.add(item)
+        db.session.commit()
+        item_id = item.id
+
+    results = {'orders': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def worker():
+        orders = rejected = errors = 0
+        with app.app_context():
+            start_barrier.wait()
+            for _ in range(attempts):
+                try:
+                    if place_order(strategy, item_id, buyer_id, quantity):
+                        orders += 1
+                    else:
+                        rejected += 1
+                except Exception:
+                    db.session.rollback()
+                    errors += 1
+            db.session.remove()
+        with lock:
+            results['orders'] += orders
+            results['rejected'] += rejected
+            results['errors'] += errors
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        sold = db.session.query(db.func.coalesce(db.func.sum(Order.quantity), 0)).filter_by(item_id=item_id).scalar()
+        final_stock = db.session.query(Item.stock).filter_by(id=item_id).scalar()
+        Order.query.filter_by(item_id=item_id).delete()
+        Item.query.filter_by(id=item_id).delete()
+        db.session.commit()
+
+    return {
+        'strategy': strategy,
+        'elapsed': elapsed,
+        'orders_per_sec': results['orders'] / elapsed if elapsed else 0.0,
+        'orders': results['orders'],
+        'rejected': results['rejected'],
+        'errors': results['errors'],
+        'sold': int(sold),
+        'final_stock': final_stock,
+        'oversell': max(0, int(sold) - stock)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent checkout benchmark')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--attempts', type=int, default=20, help='order attempts per thread')
+    parser.add_argument('--quantity', type=int, default=1)
+    parser.add_argument('--strategies', default='legacy,locked,atomic')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        suffix = uuid.uuid4().hex[:8]
+        seller = User(username=f'bench_seller_{suffix}', email=f'bench_seller_{suffix}@example.com', role='seller')
+        buyer = User(username=f'bench_buyer_{suffix}', email=f'bench_buyer_{suffix}@example.com', role='user')
+        seller.set_password(suffix)
+        buyer.set_password(suffix)
+        db.session.add_all([seller, buyer])
+        db.session.commit()
+        seller_id, buyer_id = seller.id, buyer.id
+
+    print(f"{args.threads} threads x {args.attempts} attempts, stock {args.stock}, quantity {args.quantity}")
+    print(f"{'strategy':<10}{'orders/s':>10}{'orders':>8}{'rejected':>10}{'errors':>8}{'sold':>7}{'stock':>7}{'oversell':>10}")
+    try:
+        for strategy in args.strategies.split(','):
+            result = run(app, strategy.strip(), args.threads, args.stock, args.attempts,
+                         args.quantity, seller_id, buyer_id)
+            print(f"{result['strategy']:<10}{result['orders_per_sec']:>10.1f}{result['orders']:>8}"
+                  f"{result['rejected']:>10}{result['errors']:>8}{result['sold']:>7}"
+                  f"{result['final_stock']:>7}{result['oversell']:>10}")
+    finally:
+        with app.app_context():
+            User.query.filter(User.id.in_([seller_id, buyer_id])).delete()
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Buyer order history benchmark
+
+Seeds a buyer with many orders across several sellers and items, then
+requests GET /api/user/orders page by page through the Flask test client.
+Two modes are compared:
+
+    offset   ?page=N, which also runs a COUNT for the page total
+    cursor   ?cursor=..., following next_cursor to the end
+
+For each one it reports p50/p95/max latency in milliseconds and the SQL
+statements per page, which should stay constant however many orders the
+buyer has. Use a disposable database, because it creates and then deletes
+its own users, items and orders:
+
+    python benchmark_order_history.py --orders 2000 --per-page 20 --rounds 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import create_app, db
+from app.models.models import Item, ItemImage, Order, User
+
+
+class QueryCounter:
+    """Counts SQL statements sent through the engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def seed(orders, sellers, items_per_seller):
+    """Create a buyer, sellers with imaged items, and `orders` orders; returns the user ids"""
+    suffix = uuid.uuid4().hex[:8]
+    buyer = User(username=f'bench_buyer_{suffix}', email=f'bench_buyer_{suffix}@example.com', role='user')
+    buyer.set_password(suffix)
+    users = [buyer]
+    for index in range(sellers):
+        seller = User(username=f'bench_seller_{suffix}_{index}',
+                      email=f'bench_seller_{suffix}_{index}@example.com', role='seller')
+        seller.set_password(suffix)
+        users.append(seller)
+    db.session.add_all(users)
+    db.session.flush()
+
+    items = []
+    for seller in users[1:]:
+        for index in range(items_per_seller):
+            items.append(Item(seller_id=seller.id, title=f'Benchmark item {index}', description='benchmark',
+                              category='benchmark', price=10 + index, stock=1000, status='active'))
+    db.session.add_all(items)
+    db.session.flush()
+    db.session.add_all([
+        ItemImage(item_id=item.id, image_path=f'{item.id}/image_0.jpeg', is_primary=True) for item in items
+    ])
+
+    now = datetime.utcnow()
+    for index in range(orders):
+        item = items[index % len(items)]
+        db.session.add(Order(
+            order_number=f"BENCH{uuid.uuid4().hex[:12].upper()}",
+            buyer_id=buyer.id,
+            seller_id=item.seller_id,
+            item_id=item.id,
+            quantity=1,
+            price_per_item=item.price,
+            total_amount=item.price,
+            status='pending',
+            shipping_address='Benchmark',
+            customer_name='Benchmark',
+            created_at=now - timedelta(seconds=index)
+        ))
+    db.session.commit()
+    return buyer.id, [user.id for user in users]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def walk(client, headers, counter, mode, per_page):
+    """Request every page once; returns (latencies_ms, queries_per_page, orders_seen)"""
+    latencies, queries, seen = [], [], 0
+    page, cursor = 1, ''
+    while True:
+        if mode == 'cursor':
+            url = f'/api/user/orders?per_page={per_page}&cursor={cursor}'
+        else:
+            url = f'/api/user/orders?per_page={per_page}&page={page}'
+        before = counter.count
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count - before)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}: {response.get_data(as_text=True)}')
+
+        body = response.get_json()
+        seen += len(body['orders'])
+        if not body['pagination']['has_next']:
+            break
+        page += 1
+        cursor = body['pagination'].get('next_cursor') or ''
+    return latencies, queries, seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Buyer order history benchmark')
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--sellers', type=int, default=10)
+    parser.add_argument('--items-per-seller', type=int, default=10)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3, help='full walks through the history per mode')
+    parser.add_argument('--modes', default='offset,cursor')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        buyer_id, user_ids = seed(args.orders, args.sellers, args.items_per_seller)
+        token = create_access_token(identity=str(buyer_id))
+        counter = QueryCounter(db.engine)
+
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    print(f"{args.orders} orders, {args.per_page} per page, {args.rounds} rounds")
+    print(f"{'mode':<8}{'pages':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'queries/page':>14}")
+    try:
+        for mode in args.modes.split(','):
+            mode = mode.strip()
+            latencies, queries = [], []
+            for _ in range(args.rounds):
+                round_latencies, round_queries, seen = walk(client, headers, counter, mode, args.per_page)
+                if seen != args.orders:
+                    raise RuntimeError(f'{mode}: saw {seen} orders, expected {args.orders}')
+                latencies.extend(round_latencies)
+                queries.extend(round_queries)
+            query_range = f'{min(queries)}-{max(queries)}' if min(queries) != max(queries) else str(queries[0])
+            print(f"{mode:<8}{len(latencies) // args.rounds:>7}{statistics.median(latencies):>9.2f}"
+                  f"{percentile(latencies, 0.95):>9.2f}{max(latencies):>9.2f}{query_range:>14}")
+    finally:
+        with app.app_context():
+            item_ids = [row.id for row in db.session.query(Item.id).filter(Item.seller_id.in_(user_ids))]
+            Order.query.filter(Order.buyer_id == buyer_id).delete(synchronize_session=False)
+            ItemImage.query.filter(ItemImage.item_id.in_(item_ids)).delete(synchronize_session=False)
+            Item.query.filter(Item.id.in_(item_ids)).delete(synchronize_session=False)
+            User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
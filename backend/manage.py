@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Management commands for deploy-time and maintenance tasks
+
+Usage:
+    python manage.py migrate        Apply pending schema migrations
+    python manage.py schema-status  Show the applied and latest schema versions
+    python manage.py reconcile-counters [--chunk-size N]
+                                    Rebuild item sales/rating counters from orders and ratings
+    python manage.py purge-idempotency-keys [--chunk-size N]
+                                    Delete expired order idempotency keys
+    python manage.py sweep-pending-orders [--ttl-hours H] [--chunk-size N] [--interval SECONDS]
+                                    Cancel unconfirmed orders older than H hours and restock their items;
+                                    with --interval, keep sweeping (for running as a service)
+    python manage.py consume-order-events [--batch-size N] [--interval SECONDS]
+                                    Apply new order events to the order rollups;
+                                    with --interval, keep consuming (for running as a service)
+    python manage.py rebuild-order-rollups
+                                    Recompute the order rollups from the orders table
+    python manage.py purge-order-events [--days D] [--chunk-size N]
+                                    Delete consumed order events older than D days
+    python manage.py rebuild-conversation-threads [--chunk-size N]
+                                    Recompute the conversation thread summaries from the messages table
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Management commands run against databases that may not be migrated yet
+os.environ.setdefault('SCHEMA_CHECK_ON_STARTUP', 'false')
+
+from app import create_app, db
+from app.migrations import apply_migrations, current_version, latest_version
+from app.maintenance import reconcile_item_counters, release_stale_orders
+from app.idempotency import purge_expired_keys
+from app.outbox import consume_order_events, rebuild_rollups, purge_consumed_events
+from app.threads import rebuild_conversation_threads
+
+
+def migrate(args):
+    applied = apply_migrations(db.engine)
+    if not applied:
+        print("✓ Schema is up to date")
+    for version, name in applied:
+        print(f"✓ Applied migration {version:04d}_{name}")
+
+
+def schema_status(args):
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    print(f"Applied schema version: {version}")
+    print(f"Latest schema version:  {latest_version()}")
+
+
+def reconcile_counters(args):
+    result = reconcile_item_counters(chunk_size=args.chunk_size)
+    print(f"✓ Checked {result['items_processed']} items, repaired {result['items_changed']}")
+
+
+def purge_idempotency_keys(args):
+    deleted = purge_expired_keys(chunk_size=args.chunk_size)
+    print(f"✓ Deleted {deleted} expired idempotency keys")
+
+
+def run_repeatedly(step, interval):
+    """Run `step` once, or every `interval` seconds when given.
+
+    As a service, a failed run (a lost database connection, a deadlock) is
+    reported and rolled back, and the next run goes ahead as scheduled.
+    """
+    while True:
+        if not interval:
+            step()
+            return
+        try:
+            step()
+        except Exception as e:
+            print(f"✗ {e}", file=sys.stderr)
+            try:
+                db.session.rollback()
+            except Exception:
+                db.session.remove()
+        time.sleep(interval)
+
+
+def sweep_pending_orders(args):
+    def sweep():
+        result = release_stale_orders(ttl_hours=args.ttl_hours, chunk_size=args.chunk_size)
+        print(f"✓ Released {result['orders_released']} orders older than {result['cutoff']} "
+              f"({result['units_restored']} units, {result['chunks']} chunks) in {result['elapsed_seconds']}s: "
+              f"{result['orders_per_second']} orders/s, slowest chunk {result['max_chunk_ms']}ms")
+    run_repeatedly(sweep, args.interval)
+
+
+def consume_order_events_command(args):
+    def consume():
+        results = consume_order_events(batch_size=args.batch_size)
+        for name, result in results.items():
+            if result['events_applied'] or not args.interval:
+                print(f"✓ {name}: applied {result['events_applied']} events "
+                      f"in {result['batches']} batches ({result['elapsed_seconds']}s)")
+    run_repeatedly(consume, args.interval)
+
+
+def rebuild_order_rollups(args):
+    for name, last_event_id in rebuild_rollups().items():
+        print(f"✓ Rebuilt {name} through event {last_event_id}")
+
+
+def purge_order_events(args):
+    deleted = purge_consumed_events(older_than_days=args.days, chunk_size=args.chunk_size)
+    print(f"✓ Deleted {deleted} consumed order events")
+
+
+def rebuild_threads(args):
+    threads = rebuild_conversation_threads(chunk_size=args.chunk_size)
+    print(f"✓ Rebuilt {threads} conversation threads")
+
+
+COMMANDS = {
+    'migrate': migrate,
+    'schema-status': schema_status,
+    'reconcile-counters': reconcile_counters,
+    'purge-idempotency-keys': purge_idempotency_keys,
+    'sweep-pending-orders': sweep_pending_orders,
+    'consume-order-events': consume_order_events_command,
+    'rebuild-order-rollups': rebuild_order_rollups,
+    'purge-order-events': purge_order_events,
+    'rebuild-conversation-threads': rebuild_threads,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RareVault management commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('migrate', help='Apply pending schema migrations')
+    subparsers.add_parser('schema-status', help='Show the applied and latest schema versions')
+    reconcile_parser = subparsers.add_parser('reconcile-counters', help='Rebuild item sales and rating counters')
+    reconcile_parser.add_argument('--chunk-size', type=int, default=500)
+    purge_parser = subparsers.add_parser('purge-idempotency-keys', help='Delete expired idempotency keys')
+    purge_parser.add_argument('--chunk-size', type=int, default=1000)
+    sweep_parser = subparsers.add_parser('sweep-pending-orders', help='Release stock held by stale pending orders')
+    sweep_parser.add_argument('--ttl-hours', type=float, default=float(os.getenv('PENDING_ORDER_TTL_HOURS', '72')))
+    sweep_parser.add_argument('--chunk-size', type=int, default=200)
+    sweep_parser.add_argument('--interval', type=int, default=0, help='seconds between sweeps; 0 runs once')
+    consume_parser = subparsers.add_parser('consume-order-events', help='Apply new order events to the order rollups')
+    consume_parser.add_argument('--batch-size', type=int, default=500)
+    consume_parser.add_argument('--interval', type=int, default=0, help='seconds between runs; 0 runs once')
+    subparsers.add_parser('rebuild-order-rollups', help='Recompute the order rollups from orders')
+    purge_events_parser = subparsers.add_parser('purge-order-events', help='Delete consumed order events')
+    purge_events_parser.add_argument('--days', type=int, default=30)
+    purge_events_parser.add_argument('--chunk-size', type=int, default=1000)
+    threads_parser = subparsers.add_parser('rebuild-conversation-threads',
+                                           help='Recompute the conversation threads from messages')
+    threads_parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        COMMANDS[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+-- Denormalized sales and rating counters on items, maintained at write time.
+-- Existing rows are backfilled here; `python manage.py reconcile-counters`
+-- rebuilds them from orders and ratings at any time.
+
+ALTER TABLE `items`
+  ADD COLUMN `sold_quantity` int NOT NULL DEFAULT '0',
+  ADD COLUMN `delivered_order_count` int NOT NULL DEFAULT '0',
+  ADD COLUMN `rating_sum` int NOT NULL DEFAULT '0',
+  ADD COLUMN `rating_count` int NOT NULL DEFAULT '0';
+
+UPDATE `items` i
+  JOIN (
+    SELECT `item_id`, SUM(`quantity`) AS total_quantity, COUNT(*) AS order_count
+    FROM `orders`
+    WHERE `status` = 'delivered'
+    GROUP BY `item_id`
+  ) o ON o.`item_id` = i.`id`
+SET i.`sold_quantity` = o.total_quantity,
+    i.`delivered_order_count` = o.order_count,
+    i.`updated_at` = i.`updated_at`;
+
+UPDATE `items` i
+  JOIN (
+    SELECT `item_id`, SUM(`rating`) AS rating_sum, COUNT(*) AS rating_count
+    FROM `ratings`
+    GROUP BY `item_id`
+  ) r ON r.`item_id` = i.`id`
+SET i.`rating_sum` = r.rating_sum,
+    i.`rating_count` = r.rating_count,
+    i.`updated_at` = i.`updated_at`;
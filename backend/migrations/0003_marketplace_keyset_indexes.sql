@@ -0,0 +1,6 @@
+-- Composite indexes backing keyset pagination of the marketplace listing.
+-- Each matches a (status = 'active', sort column, id) seek predicate.
+
+ALTER TABLE `items`
+  ADD KEY `idx_items_status_created` (`status`,`created_at`,`id`),
+  ADD KEY `idx_items_status_price` (`status`,`price`,`id`);
@@ -0,0 +1,15 @@
+-- Relevance-ranked marketplace search.
+-- tags_text holds the tags JSON flattened to plain words (kept in sync by the
+-- application) so the FULLTEXT index can cover title, description, category
+-- and tags together.
+
+ALTER TABLE `items`
+  ADD COLUMN `tags_text` text COLLATE utf8mb4_unicode_ci;
+
+UPDATE `items`
+SET `tags_text` = CAST(`tags` AS CHAR),
+    `updated_at` = `updated_at`
+WHERE `tags` IS NOT NULL;
+
+ALTER TABLE `items`
+  ADD FULLTEXT KEY `ft_items_search` (`title`,`description`,`category`,`tags_text`);
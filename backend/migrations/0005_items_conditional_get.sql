@@ -0,0 +1,12 @@
+-- Microsecond precision for items.updated_at, which backs the ETag and
+-- Last-Modified validators of item and listing endpoints. With whole seconds,
+-- two writes in the same second would produce the same validator.
+
+ALTER TABLE `items`
+  MODIFY `updated_at` timestamp(6) NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+-- Covering indexes for the listing validators: COUNT(*), MAX(updated_at) and
+-- SUM(id) over a status or a seller are answered from the index alone.
+ALTER TABLE `items`
+  ADD KEY `idx_items_status_updated` (`status`,`updated_at`),
+  ADD KEY `idx_items_seller_updated` (`seller_id`,`updated_at`);
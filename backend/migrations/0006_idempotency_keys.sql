@@ -0,0 +1,15 @@
+-- Stored responses for requests sent with an Idempotency-Key header.
+-- A replay is a single primary-key lookup on (user_id, idempotency_key).
+
+CREATE TABLE IF NOT EXISTS `idempotency_keys` (
+  `user_id` int NOT NULL,
+  `idempotency_key` varchar(64) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `request_hash` char(64) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `status_code` smallint NOT NULL,
+  `response_body` mediumtext COLLATE utf8mb4_unicode_ci NOT NULL,
+  `created_at` datetime NOT NULL,
+  `expires_at` datetime NOT NULL,
+  PRIMARY KEY (`user_id`,`idempotency_key`),
+  KEY `idx_idempotency_expires` (`expires_at`),
+  CONSTRAINT `idempotency_keys_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,5 @@
+-- Index for the stale pending order sweeper: each batch is a range scan over
+-- (status = 'pending', created_at < cutoff) in (created_at, id) order.
+
+ALTER TABLE `orders`
+  ADD KEY `idx_orders_status_created` (`status`,`created_at`,`id`);
@@ -0,0 +1,7 @@
+-- Composite indexes backing the seller order queue. Status-filtered queues
+-- seek on (seller_id, status, created_at); the unfiltered queue pages on
+-- (seller_id, created_at, id) without a filesort.
+
+ALTER TABLE `orders`
+  ADD KEY `idx_orders_seller_status_created` (`seller_id`,`status`,`created_at`,`id`),
+  ADD KEY `idx_orders_seller_created` (`seller_id`,`created_at`,`id`);
@@ -0,0 +1,6 @@
+-- Composite index backing the buyer order history. The history pages on
+-- (buyer_id, created_at, id) without a filesort; status filters are applied
+-- to the few rows per buyer in that range.
+
+ALTER TABLE `orders`
+  ADD KEY `idx_orders_buyer_created` (`buyer_id`,`created_at`,`id`);
@@ -0,0 +1,73 @@
+-- Transactional outbox of order events and the rollups its consumers keep.
+-- Events are written in the same transaction as the order change they
+-- describe; consumers read them in id order and record their position in
+-- outbox_consumers in the same transaction as their rollup updates.
+-- Existing orders are backfilled into both rollups here, and each consumer
+-- starts after the last event; `python manage.py rebuild-order-rollups`
+-- recomputes them from orders at any time.
+
+CREATE TABLE IF NOT EXISTS `order_events` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `order_id` int NOT NULL,
+  `buyer_id` int NOT NULL,
+  `seller_id` int NOT NULL,
+  `item_id` int NOT NULL,
+  `event_type` enum('created','status_changed') COLLATE utf8mb4_unicode_ci NOT NULL,
+  `from_status` varchar(20) COLLATE utf8mb4_unicode_ci DEFAULT NULL,
+  `to_status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `quantity` int NOT NULL DEFAULT '1',
+  `total_amount` decimal(10,2) NOT NULL,
+  `order_created_at` datetime NOT NULL,
+  `created_at` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_order_events_created` (`created_at`),
+  KEY `idx_order_events_buyer` (`buyer_id`,`id`),
+  KEY `idx_order_events_seller` (`seller_id`,`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `outbox_consumers` (
+  `name` varchar(64) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `last_event_id` int NOT NULL DEFAULT '0',
+  `updated_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `order_status_counts` (
+  `user_id` int NOT NULL,
+  `role` enum('buyer','seller') COLLATE utf8mb4_unicode_ci NOT NULL,
+  `status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `order_count` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`user_id`,`role`,`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `daily_order_rollups` (
+  `day` date NOT NULL,
+  `status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `order_count` int NOT NULL DEFAULT '0',
+  `units` int NOT NULL DEFAULT '0',
+  `revenue` decimal(14,2) NOT NULL DEFAULT '0.00',
+  PRIMARY KEY (`day`,`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO `order_status_counts` (`user_id`, `role`, `status`, `order_count`)
+SELECT `buyer_id`, 'buyer', `status`, COUNT(*)
+FROM `orders`
+WHERE `status` IS NOT NULL
+GROUP BY `buyer_id`, `status`;
+
+INSERT INTO `order_status_counts` (`user_id`, `role`, `status`, `order_count`)
+SELECT `seller_id`, 'seller', `status`, COUNT(*)
+FROM `orders`
+WHERE `status` IS NOT NULL
+GROUP BY `seller_id`, `status`;
+
+INSERT INTO `daily_order_rollups` (`day`, `status`, `order_count`, `units`, `revenue`)
+SELECT DATE(`created_at`), `status`, COUNT(*), COALESCE(SUM(`quantity`), 0), COALESCE(SUM(`total_amount`), 0)
+FROM `orders`
+WHERE `status` IS NOT NULL AND `created_at` IS NOT NULL
+GROUP BY DATE(`created_at`), `status`;
+
+INSERT INTO `outbox_consumers` (`name`, `last_event_id`, `updated_at`)
+SELECT c.`name`, (SELECT COALESCE(MAX(`id`), 0) FROM `order_events`), UTC_TIMESTAMP()
+FROM (SELECT 'order_status_counts' AS `name` UNION ALL SELECT 'daily_order_rollups') c
+ON DUPLICATE KEY UPDATE `last_event_id` = VALUES(`last_event_id`);
@@ -0,0 +1,30 @@
+-- Notifications inbox fed on write, and per-user unread counters for the
+-- badges. Existing unread messages are counted once here; from then on the
+-- counters change in the same transaction as the rows they count.
+-- Notifications now exist for most users, so they go when their user does.
+
+ALTER TABLE `notifications`
+  DROP FOREIGN KEY `notifications_ibfk_1`;
+
+ALTER TABLE `notifications`
+  MODIFY `type` enum('order_placed','order_confirmed','order_declined','order_shipped','order_delivered','order_cancelled','message_received','item_favorited') COLLATE utf8mb4_unicode_ci NOT NULL,
+  MODIFY `is_read` tinyint(1) NOT NULL DEFAULT '0',
+  ADD KEY `idx_notifications_user_id` (`user_id`,`id`),
+  ADD CONSTRAINT `notifications_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE;
+
+CREATE TABLE IF NOT EXISTS `notification_counters` (
+  `user_id` int NOT NULL,
+  `unread_notifications` int NOT NULL DEFAULT '0',
+  `unread_messages` int NOT NULL DEFAULT '0',
+  `seen_notification_id` int NOT NULL DEFAULT '0',
+  `updated_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`user_id`),
+  CONSTRAINT `notification_counters_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO `notification_counters` (`user_id`, `unread_messages`, `updated_at`)
+SELECT `receiver_id`, COUNT(*), NOW()
+FROM `messages`
+WHERE `is_receiver_read` = 0
+GROUP BY `receiver_id`
+ON DUPLICATE KEY UPDATE `unread_messages` = VALUES(`unread_messages`);
@@ -0,0 +1,7 @@
+-- Covering indexes for the conversation list. Its sent and received halves
+-- each read one range of these indexes, and the window functions get the
+-- partner, item, time and read flag without touching the message rows.
+
+ALTER TABLE `messages`
+  ADD KEY `idx_messages_sender_inbox` (`sender_id`,`receiver_id`,`item_id`,`created_at`),
+  ADD KEY `idx_messages_receiver_inbox` (`receiver_id`,`sender_id`,`item_id`,`created_at`,`is_receiver_read`);
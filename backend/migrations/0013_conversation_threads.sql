@@ -0,0 +1,47 @@
+-- One summary row per conversation (pair of users and item), kept by the
+-- same transaction as the messages it summarizes. Existing messages are
+-- backfilled here; `python manage.py rebuild-conversation-threads`
+-- recomputes the table from the messages at any time.
+-- The conversation list no longer reads messages, so the covering indexes
+-- from 0012 go.
+
+CREATE TABLE IF NOT EXISTS `conversation_threads` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `user_low_id` int NOT NULL,
+  `user_high_id` int NOT NULL,
+  `item_key` int NOT NULL DEFAULT '0',
+  `last_message_id` int NOT NULL,
+  `last_message_at` datetime NOT NULL,
+  `low_unread` int NOT NULL DEFAULT '0',
+  `high_unread` int NOT NULL DEFAULT '0',
+  `updated_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_conversation_threads_pair_item` (`user_low_id`,`user_high_id`,`item_key`),
+  KEY `idx_conversation_threads_low` (`user_low_id`,`last_message_at`,`id`),
+  KEY `idx_conversation_threads_high` (`user_high_id`,`last_message_at`,`id`),
+  CONSTRAINT `conversation_threads_ibfk_1` FOREIGN KEY (`user_low_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `conversation_threads_ibfk_2` FOREIGN KEY (`user_high_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO `conversation_threads`
+  (`user_low_id`, `user_high_id`, `item_key`, `last_message_id`, `last_message_at`, `low_unread`, `high_unread`, `updated_at`)
+SELECT g.`user_low_id`, g.`user_high_id`, g.`item_key`, g.`last_message_id`,
+       COALESCE(m.`created_at`, UTC_TIMESTAMP()), g.`low_unread`, g.`high_unread`, UTC_TIMESTAMP()
+FROM (
+  SELECT LEAST(`sender_id`, `receiver_id`) AS user_low_id,
+         GREATEST(`sender_id`, `receiver_id`) AS user_high_id,
+         COALESCE(`item_id`, 0) AS item_key,
+         MAX(`id`) AS last_message_id,
+         SUM(CASE WHEN `is_receiver_read` IS NOT TRUE AND `receiver_id` = LEAST(`sender_id`, `receiver_id`)
+                  THEN 1 ELSE 0 END) AS low_unread,
+         SUM(CASE WHEN `is_receiver_read` IS NOT TRUE AND `receiver_id` = GREATEST(`sender_id`, `receiver_id`)
+                       AND `sender_id` <> `receiver_id`
+                  THEN 1 ELSE 0 END) AS high_unread
+  FROM `messages`
+  GROUP BY LEAST(`sender_id`, `receiver_id`), GREATEST(`sender_id`, `receiver_id`), COALESCE(`item_id`, 0)
+) g
+JOIN `messages` m ON m.`id` = g.`last_message_id`;
+
+ALTER TABLE `messages`
+  DROP KEY `idx_messages_sender_inbox`,
+  DROP KEY `idx_messages_receiver_inbox`;
@@ -0,0 +1,12 @@
+-- Conversation messages are read by (pair of users, item) in id order:
+-- "new since" polls seek past the last id the client has, and history
+-- scrolling seeks before the first. The pair is stored as two virtual
+-- columns, lower user id first, so both directions share one index and
+-- every poll is a single index range probe.
+
+ALTER TABLE `messages`
+  ADD COLUMN `user_low_id` int GENERATED ALWAYS AS (CASE WHEN `sender_id` < `receiver_id` THEN `sender_id` ELSE `receiver_id` END) VIRTUAL,
+  ADD COLUMN `user_high_id` int GENERATED ALWAYS AS (CASE WHEN `sender_id` < `receiver_id` THEN `receiver_id` ELSE `sender_id` END) VIRTUAL;
+
+ALTER TABLE `messages`
+  ADD KEY `idx_messages_pair_item` (`user_low_id`,`user_high_id`,`item_id`,`id`);
@@ -0,0 +1,6 @@
+-- Marking a conversation read is one UPDATE of the receiver's unread
+-- messages from one sender, optionally about one item. This index finds
+-- exactly those rows, so the UPDATE locks nothing else.
+
+ALTER TABLE `messages`
+  ADD KEY `idx_messages_receiver_unread` (`receiver_id`,`sender_id`,`item_id`,`is_receiver_read`);
@@ -0,0 +1,57 @@
+import os
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The app on a fresh SQLite database"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.sqlite'}"
+    os.environ['SCHEMA_CHECK_ON_STARTUP'] = 'false'
+    os.environ['EVENT_BUS_BACKEND'] = 'none'
+    from app import create_app, db
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_user(username, role='user'):
+    """A user with password 'secret'; call inside an app context"""
+    from app import db
+    from app.models.models import User
+    user = User(username=username, email=f'{username}@example.com', role=role)
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def auth_headers(app, user_id):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+
+
+def count_queries(app, request):
+    """(response, number of SQL statements) for a request"""
+    from app import db
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = request()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, len(statements)
@@ -0,0 +1,56 @@
+"""
+Conversation message endpoints: query counts per page must not grow with page size
+"""
+import pytest
+from conftest import auth_headers, count_queries, create_user
+
+
+@pytest.fixture(scope='module')
+def conversation(app):
+    """A seller and a buyer with 50 messages about one item; returns (seller_id, buyer_id, item_id, seller_headers)"""
+    from app import db
+    from app.models.models import Item, ItemImage, Message
+    with app.app_context():
+        seller = create_user('seller', role='seller')
+        buyer = create_user('buyer')
+
+        item = Item(seller_id=seller.id, title='Silver coin', description='A rare coin', price=25, stock=1)
+        db.session.add(item)
+        db.session.commit()
+        db.session.add(ItemImage(item_id=item.id, image_path='coin.png', is_primary=True))
+        for number in range(50):
+            sender, receiver = (buyer, seller) if number % 2 else (seller, buyer)
+            db.session.add(Message(sender_id=sender.id, receiver_id=receiver.id, item_id=item.id,
+                                   message=f'message {number}'))
+        db.session.commit()
+        return seller.id, buyer.id, item.id, auth_headers(app, seller.id)
+
+
+def test_conversation_page_query_count_does_not_grow_with_page_size(app, client, conversation):
+    seller_id, buyer_id, item_id, headers = conversation
+
+    counts = {}
+    for per_page in (10, 50):
+        url = f'/api/messages/conversation/{buyer_id}?item_id={item_id}&per_page={per_page}'
+        response, counts[per_page] = count_queries(app, lambda: client.get(url, headers=headers))
+        assert response.status_code == 200
+        messages = response.get_json()['messages']
+        assert len(messages) == per_page
+        assert messages[-1]['item']['images'] == ['coin.png']
+        assert {messages[0]['sender']['id'], messages[0]['receiver']['id']} == {seller_id, buyer_id}
+
+    assert counts[10] == counts[50]
+    assert counts[50] <= 8
+
+
+def test_empty_poll_is_one_query(app, client, conversation):
+    seller_id, buyer_id, item_id, headers = conversation
+
+    latest = client.get(f'/api/messages/conversation/{buyer_id}?item_id={item_id}&per_page=1',
+                        headers=headers).get_json()['messages'][-1]['id']
+    url = f'/api/messages/conversation/{buyer_id}?item_id={item_id}&after_id={latest}'
+    response, count = count_queries(app, lambda: client.get(url, headers=headers))
+
+    assert response.status_code == 200
+    assert response.get_json()['messages'] == []
+    assert count == 1
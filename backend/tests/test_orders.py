@@ -0,0 +1,70 @@
+"""
+Order endpoints: bulk status changes match single-order ones, and retries replay
+"""
+import pytest
+from conftest import auth_headers, create_user
+
+
+@pytest.fixture(scope='module')
+def parties(app):
+    """(seller_id, buyer_id) for the order tests"""
+    with app.app_context():
+        return create_user('order_seller', role='seller').id, create_user('order_buyer').id
+
+
+def create_item(app, seller_id, stock):
+    from app import db
+    from app.models.models import Item
+    with app.app_context():
+        item = Item(seller_id=seller_id, title='Brass lamp', description='A vintage lamp', price=40, stock=stock)
+        db.session.add(item)
+        db.session.commit()
+        return item.id
+
+
+def item_state(app, item_id):
+    from app import db
+    from app.models.models import Item
+    with app.app_context():
+        item = db.session.get(Item, item_id)
+        return item.status, item.stock
+
+
+def place_order(app, client, buyer_id, item_id, quantity=1):
+    response = client.post('/api/user/orders', json={'item_id': item_id, 'quantity': quantity},
+                           headers=auth_headers(app, buyer_id))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['order']['id']
+
+
+def test_bulk_cancel_after_bulk_confirm_makes_items_active(app, client, parties):
+    seller_id, buyer_id = parties
+    item_ids = [create_item(app, seller_id, stock=3) for _ in range(2)]
+    order_ids = [place_order(app, client, buyer_id, item_id) for item_id in item_ids]
+    headers = auth_headers(app, seller_id)
+
+    response = client.put('/api/seller/orders/bulk-status', json={'order_ids': order_ids, 'status': 'confirmed'},
+                          headers=headers)
+    assert response.get_json()['updated'] == 2
+    assert [item_state(app, item_id) for item_id in item_ids] == [('pending', 2)] * 2
+
+    response = client.put('/api/seller/orders/bulk-status', json={'order_ids': order_ids, 'status': 'cancelled'},
+                          headers=headers)
+    assert response.get_json()['updated'] == 2
+    assert [item_state(app, item_id) for item_id in item_ids] == [('active', 3)] * 2
+
+
+def test_idempotent_retry_of_order_that_sold_out_the_item_replays_201(app, client, parties):
+    seller_id, buyer_id = parties
+    item_id = create_item(app, seller_id, stock=1)
+    headers = {**auth_headers(app, buyer_id), 'Idempotency-Key': 'last-unit-1'}
+    body = {'item_id': item_id, 'quantity': 1}
+
+    first = client.post('/api/user/orders', json=body, headers=headers)
+    assert first.status_code == 201
+    assert item_state(app, item_id) == ('sold', 0)
+
+    retry = client.post('/api/user/orders', json=body, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers.get('Idempotent-Replayed') == 'true'
+    assert retry.get_json()['order']['id'] == first.get_json()['order']['id']
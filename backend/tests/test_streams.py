@@ -0,0 +1,38 @@
+"""
+Badge stream endpoint: only live access tokens open a stream
+"""
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token
+from conftest import create_user
+
+
+@pytest.fixture(scope='module')
+def stream_user(app):
+    with app.app_context():
+        return create_user('stream_user').id
+
+
+def test_refresh_token_cannot_open_a_stream(app, client, stream_user):
+    with app.app_context():
+        token = create_refresh_token(identity=str(stream_user))
+    response = client.get(f'/api/stream/counters?token={token}')
+    assert response.status_code == 401
+
+
+def test_revoked_access_token_cannot_open_a_stream(app, client, stream_user, monkeypatch):
+    from app import jwt
+    with app.app_context():
+        token = create_access_token(identity=str(stream_user))
+    # Every token is revoked
+    monkeypatch.setattr(jwt, '_token_in_blocklist_callback', lambda header, payload: True)
+    response = client.get(f'/api/stream/counters?token={token}')
+    assert response.status_code == 401
+
+
+def test_access_token_opens_a_stream(app, client, stream_user):
+    with app.app_context():
+        token = create_access_token(identity=str(stream_user))
+    response = client.get(f'/api/stream/counters?token={token}')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    response.close()